@@ -2,8 +2,7 @@ import tkinter as tk
 from tkinter import ttk
 from organizer.core import FileOrganizer
 from organizer.utils import (
-    rules_func,
-    history,
+    load_rules,
     set_folder,
     organize_action,
     undo_action,
@@ -37,13 +36,12 @@ def run_gui(args):
     frame.grid(column=0, row=0, sticky=("W, N ,E, S"))
     root.title("Auto_File_Organizer")
 
-    history_data = history(args.history)
-    rules = rules_func()
+    rules = load_rules()
     txt_box = tk.Text(frame, height=13, width=40, wrap="word")
     txt_box.grid(column=1, row=1)
     SetFolder = ttk.Button(
         text="Set Folder",
-        command=lambda: set_folder(txt_box, FileOrganizer, rules, history_data, args),
+        command=lambda: set_folder(txt_box, FileOrganizer, rules, None, args),
     )
     SetFolder.grid(column=1, row=2)
 
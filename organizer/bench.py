@@ -0,0 +1,422 @@
+"""
+Benchmarks for the organize, history and watcher paths.
+
+Run `auto-organize-bench` (or `python -m organizer.bench`). It generates
+synthetic folders in a temporary directory and reports:
+
+- organize: files per second for N files matched against M rules, for several
+  extension distributions;
+- undo: time to revert one organize batch;
+- history: cost per recorded move for each history backend;
+- watcher: latency from a file being written to it being moved.
+
+Results are written as JSON. Pass a previous report with --compare to flag
+metrics that got worse by more than --threshold. The real history in
+`~/.auto_file_organizer` is never touched.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from organizer.core import FileOrganizer
+from organizer.utils.data import use_history_store
+from organizer.utils.journal import Journal
+from organizer.utils.profiling import profile
+from organizer.utils.record import record_move, commit
+
+DISTRIBUTIONS = ("uniform", "skewed", "mixed")
+SCHEMA_VERSION = 1
+
+log = logging.getLogger("organizer.bench")
+
+
+def make_rules(count):
+    """
+    Returns `count` synthetic rules.
+
+    Every tenth rule has a two-part extension (".x9.gz"), and about four rules
+    share each destination folder.
+    """
+    folders = max(1, count // 4)
+    rules = {}
+    for i in range(count):
+        ext = f".x{i}.gz" if i % 10 == 9 else f".x{i}"
+        rules[ext] = f"Dest{i % folders}"
+    return rules
+
+
+def make_names(count, rules, distribution, seed=0):
+    """
+    Returns `count` file names with extensions drawn from the rules.
+
+    Args:
+        count: Number of names.
+        rules: The rules dict the extensions are taken from.
+        distribution: "uniform" picks every rule equally often, "skewed" follows
+            a Zipf-like curve (a few extensions dominate, like real downloads),
+            and "mixed" is uniform with 20% unmatched and 10% upper-case names.
+        seed: Seed for the random generator, so runs are comparable.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution '{distribution}'")
+    rng = random.Random(seed)
+    exts = list(rules)
+    weights = None
+    if distribution == "skewed":
+        weights = [1 / (i + 1) for i in range(len(exts))]
+    names = []
+    for i, ext in enumerate(rng.choices(exts, weights, k=count)):
+        if distribution == "mixed":
+            roll = rng.random()
+            if roll < 0.2:
+                ext = ".unmatched"
+            elif roll < 0.3:
+                ext = ext.upper()
+        names.append(f"file{i:07d}{ext}")
+    return names
+
+
+def populate(folder, names):
+    """Creates an empty file for each name in `folder`."""
+    for name in names:
+        with open(os.path.join(folder, name), "wb"):
+            pass
+
+
+@contextmanager
+def isolated_history(store):
+    """Records moves to `store` instead of the real history while active."""
+    previous = use_history_store(store)
+    try:
+        yield store
+    finally:
+        use_history_store(previous)
+        store.close()
+
+
+def _result(benchmark, params, **metrics):
+    return {"benchmark": benchmark, "params": params, "metrics": metrics}
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def bench_organize(workdir, files, rules, distribution, repeat=3, workers=1):
+    """
+    Times `organize` and the `undo` of the resulting batch.
+
+    Returns an "organize" and an "undo" result; the best of `repeat` runs is
+    reported, each on a freshly generated folder.
+    """
+    rule_set = make_rules(rules)
+    names = make_names(files, rule_set, distribution)
+    params = {
+        "files": files,
+        "rules": rules,
+        "distribution": distribution,
+        "workers": workers,
+    }
+    organize_times, undo_times = [], []
+    for run in range(repeat):
+        folder = Path(workdir) / f"organize-{distribution}-{files}-{run}"
+        folder.mkdir()
+        populate(folder, names)
+        with isolated_history(Journal(folder.with_suffix(".jsonl"), logger=log)):
+            organizer = FileOrganizer(folder, rule_set, logger=log, workers=workers)
+            start = time.perf_counter()
+            organizer.organize()
+            organize_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            organizer.undo()
+            undo_times.append(time.perf_counter() - start)
+    best, best_undo = min(organize_times), min(undo_times)
+    return [
+        _result(
+            "organize", params, seconds=best, files_per_sec=files / best if best else 0
+        ),
+        _result("undo", params, seconds=best_undo),
+    ]
+
+
+def bench_history(workdir, moves, backend, repeat=3):
+    """
+    Times `record_move` plus the final commit for `moves` moves.
+
+    Only the history write is measured; no files are moved.
+    """
+    times = []
+    for run in range(repeat):
+        if backend == "sqlite":
+            from organizer.utils.history_db import SQLiteHistory
+
+            store = SQLiteHistory(Path(workdir) / f"history-{run}.sqlite3", logger=log)
+        else:
+            store = Journal(Path(workdir) / f"history-{run}.jsonl", logger=log)
+        with isolated_history(store):
+            start = time.perf_counter()
+            for i in range(moves):
+                record_move(f"/src/file{i}.txt", f"/dst/file{i}.txt", batch="bench")
+            commit()
+            times.append(time.perf_counter() - start)
+    best = min(times)
+    return [
+        _result(
+            "history",
+            {"moves": moves, "backend": backend},
+            us_per_move=best / moves * 1e6,
+            moves_per_sec=moves / best if best else 0,
+        )
+    ]
+
+
+def bench_watcher(workdir, files, timeout=60.0):
+    """
+    Measures the latency from writing a file to the watcher having moved it.
+
+    Files are written to a watched folder one after another; the destination
+    folder is polled to see when each one arrives.
+    """
+    from watchdog.observers import Observer
+    from organizer.file_watcher import MyHandler
+
+    folder = Path(workdir) / "watch"
+    dest = folder / "Text"
+    dest.mkdir(parents=True)
+    with isolated_history(Journal(Path(workdir) / "watch.jsonl", logger=log)):
+        organizer = FileOrganizer(folder, {".txt": "Text"}, logger=log)
+        handler = MyHandler(organizer, logger=log)
+        observer = Observer()
+        observer.schedule(handler, str(folder), recursive=True)
+        handler.start()
+        observer.start()
+        try:
+            written = {}
+            for i in range(files):
+                name = f"event{i:06d}.txt"
+                (folder / name).write_bytes(b"x")
+                written[name] = time.perf_counter()
+            latencies = []
+            pending = set(written)
+            deadline = time.perf_counter() + timeout
+            while pending and time.perf_counter() < deadline:
+                now = time.perf_counter()
+                with os.scandir(dest) as it:
+                    arrived = pending.intersection(entry.name for entry in it)
+                for name in arrived:
+                    latencies.append(now - written[name])
+                pending -= arrived
+                time.sleep(0.005)
+        finally:
+            observer.stop()
+            observer.join()
+            handler.stop()
+    if not latencies:
+        latencies = [timeout]
+    return [
+        _result(
+            "watcher",
+            {"files": files},
+            latency_avg=statistics.mean(latencies),
+            latency_p50=_percentile(latencies, 0.5),
+            latency_p95=_percentile(latencies, 0.95),
+            latency_max=max(latencies),
+            missed=len(pending),
+        )
+    ]
+
+
+def run(args, workdir):
+    """Runs the benchmarks selected by `args` and returns the report dict."""
+    results = []
+    for files in args.files:
+        for distribution in args.distribution:
+            print(f"organize: {files} files, {distribution}", file=sys.stderr)
+            results += bench_organize(
+                workdir, files, args.rules, distribution, args.repeat, args.jobs
+            )
+    for backend in args.history_backend:
+        print(f"history: {args.moves} moves, {backend}", file=sys.stderr)
+        results += bench_history(workdir, args.moves, backend, args.repeat)
+    if args.watcher_files:
+        print(f"watcher: {args.watcher_files} files", file=sys.stderr)
+        results += bench_watcher(workdir, args.watcher_files)
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold=0.2):
+    """
+    Compares a report with a baseline report.
+
+    Returns (lines, regressions): one line per metric present in both reports,
+    and the lines of the metrics that got worse by more than `threshold` (a
+    fraction). Metrics ending in "_per_sec" are better when higher, all others
+    when lower.
+    """
+
+    def key(result):
+        return result["benchmark"], json.dumps(result["params"], sort_keys=True)
+
+    old_results = {key(r): r["metrics"] for r in baseline.get("results", [])}
+    lines, regressions = [], []
+    for result in report["results"]:
+        old = old_results.get(key(result))
+        if old is None:
+            continue
+        for metric, value in result["metrics"].items():
+            before = old.get(metric)
+            if not before:
+                continue
+            change = value / before - 1
+            worse = -change if metric.endswith("_per_sec") else change
+            line = (
+                f"{result['benchmark']} {key(result)[1]} {metric}: "
+                f"{before:.4g} -> {value:.4g} ({change:+.1%})"
+            )
+            lines.append(line)
+            if worse > threshold:
+                regressions.append(line)
+    return lines, regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Auto File Organizer and write the results as JSON."
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        nargs="+",
+        default=[1000, 10000],
+        metavar="N",
+        help="Folder sizes to organize (default: 1000 10000)",
+    )
+    parser.add_argument(
+        "--rules", type=int, default=50, metavar="M", help="Number of rules"
+    )
+    parser.add_argument(
+        "--distribution",
+        nargs="+",
+        choices=DISTRIBUTIONS,
+        default=list(DISTRIBUTIONS),
+        help="Extension distributions to generate (default: all)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, metavar="N", help="Workers for organize"
+    )
+    parser.add_argument(
+        "--moves",
+        type=int,
+        default=10000,
+        metavar="N",
+        help="Moves recorded by the history benchmark",
+    )
+    parser.add_argument(
+        "--history-backend",
+        nargs="*",
+        choices=["jsonl", "sqlite"],
+        default=["jsonl", "sqlite"],
+        help="History backends to benchmark (default: both)",
+    )
+    parser.add_argument(
+        "--watcher-files",
+        type=int,
+        default=200,
+        metavar="N",
+        help="Files written for the watcher benchmark (0 to skip)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per benchmark; the best is kept"
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Write the JSON report to this file"
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        metavar="BASELINE",
+        help="Compare with an earlier JSON report",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fraction by which a metric may get worse before --compare fails",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["cpu", "mem"],
+        default=None,
+        help="Profile the benchmarks and print a summary to stderr",
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Where to write the pstats file or memory snapshot",
+    )
+    parser.add_argument(
+        "--workdir",
+        type=str,
+        default=None,
+        help="Directory for the synthetic folders (default: a temporary directory)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Entry point of `auto-organize-bench`.
+
+    Exits with status 1 if --compare finds a regression beyond --threshold.
+    """
+    args = parse_args(argv)
+    log.setLevel(logging.WARNING)
+    if args.workdir:
+        Path(args.workdir).mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="afo-bench-", dir=args.workdir) as workdir:
+        with profile(args.profile, output=args.profile_output) as profiler:
+            report = run(args, workdir)
+    if profiler is not None:
+        print(profiler.report, file=sys.stderr, end="")
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.threshold)
+        for line in lines:
+            print(line, file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)} regression(s):", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
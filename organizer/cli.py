@@ -2,6 +2,17 @@ import argparse
 from organizer.utils.data import rules_func
 
 
+def positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
 def parse_args():
     """
     Parses command-line arguments for the Auto File Organizer.
@@ -13,12 +24,32 @@ def parse_args():
     Options:
         --source: The source directory to organize. Default is the Downloads folder.
         --rules: Path to the JSON file containing file organization rules.
-        --simulate: Show what would happen without actually moving files.
-        --undo: Undo the last batch of file moves using undo.json.
+        --simulate: Show what would happen without actually moving files, as a
+            JSONL move plan (on stdout, or in the file given with --plan).
+        --plan: Where --simulate writes the move plan.
+        --apply: Execute a move plan written by --simulate.
+        --undo [N]: Undo the last N organize runs (default 1) instead of organizing.
         --logfile: Path to log file (enables file logging).
         --reset: Reset history before organizing new folder.
         --gui: Switch to GUI.
         --watchdog: Activates WatchDog.
+        --daemon: Watch all folders listed in a config file, in one process.
+        --watch-backend: File system event source of --watchdog and --daemon.
+        --full-rescan: Ignore the scan index and look at every file again.
+        --recursive: Also organize files in subfolders.
+        --max-depth: How many folder levels --recursive descends.
+        --exclude: Glob of files and folders to leave alone (repeatable).
+        --on-collision: Policy for name clashes in the destination.
+        --dedup: Skip, hardlink or remove duplicates of files already organized.
+        --sniff: Classify files with no or unknown extension by their content.
+        --jobs: Number of files to move in parallel.
+        --history-backend: History store to use (jsonl or sqlite).
+        --stats: Print counters and per-phase timings when done.
+        --profile: Profile the run with cProfile (cpu) or tracemalloc (mem).
+        --profile-output: Where to write the raw profile.
+        --profile-top: Number of entries in the profile summary.
+        --metrics-file: Prometheus textfile the watcher keeps up to date.
+        --metrics-port: Port of the watcher's local Prometheus HTTP exporter.
     """
     parser = argparse.ArgumentParser(
         description="🗂️ Auto File Organizer — Clean up your messy folders with custom rules!"
@@ -41,13 +72,33 @@ def parse_args():
     parser.add_argument(
         "--simulate",
         action="store_true",
-        help="Show what would happen without actually moving files.",
+        help="Show what would happen without moving files, as a JSONL move plan.",
+    )
+
+    parser.add_argument(
+        "--plan",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="With --simulate, write the JSONL move plan to PATH instead of stdout",
+    )
+
+    parser.add_argument(
+        "--apply",
+        type=str,
+        default=None,
+        metavar="PLAN",
+        help="Execute a move plan written by --simulate, without rescanning",
     )
 
     parser.add_argument(
         "--undo",
-        action="store_true",
-        help="Undo the last batch of file moves using undo.json",
+        type=positive_int,
+        nargs="?",
+        const=1,
+        default=None,
+        metavar="N",
+        help="Undo the last N batches of file moves (default: 1) instead of organizing",
     )
 
     parser.add_argument(
@@ -72,6 +123,136 @@ def parse_args():
         help="Activates WatchDog",
     )
 
+    parser.add_argument(
+        "--daemon",
+        type=str,
+        default=None,
+        metavar="CONFIG",
+        help="Watch every folder listed in the JSON config file CONFIG "
+        "with one observer and one worker pool",
+    )
+
+    parser.add_argument(
+        "--watch-backend",
+        choices=["watchdog", "inotify", "auto"],
+        default=None,
+        help="Event source for --watchdog and --daemon: watchdog, native Linux "
+        "inotify (one event per completed file), or auto (inotify if available). "
+        "Defaults to watchdog for --watchdog and auto for --daemon",
+    )
+
+    parser.add_argument(
+        "--full-rescan",
+        action="store_true",
+        help="Look at every file again instead of skipping the files that "
+        "matched no rule on earlier runs, and rebuild the scan index",
+    )
+
+    parser.add_argument(
+        "--recursive",
+        action="store_true",
+        help="Also organize files in subfolders of the source directory",
+    )
+
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=None,
+        metavar="N",
+        help="With --recursive, how many folder levels to descend",
+    )
+
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Leave files and folders matching GLOB alone (can be repeated)",
+    )
+
+    parser.add_argument(
+        "--on-collision",
+        choices=["rename", "skip", "overwrite", "keep-newer"],
+        default="rename",
+        help="What to do when the destination already has a file of the same name "
+        "(default: rename to 'name (n).ext')",
+    )
+
+    parser.add_argument(
+        "--dedup",
+        choices=["skip", "hardlink", "remove"],
+        default=None,
+        help="Handle files whose content already exists in their destination",
+    )
+
+    parser.add_argument(
+        "--sniff",
+        action="store_true",
+        help="Organize files whose extension matches no rule (or that have none) "
+        "by their content: PDF, PNG, ZIP, MP4 and other common types",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of files to move in parallel (useful on network shares)",
+    )
+
+    parser.add_argument(
+        "--history-backend",
+        choices=["jsonl", "sqlite"],
+        default=None,
+        help="History store to use: append-only journal (default) or SQLite database",
+    )
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print counters and per-phase timings (scan, match, rename...) when done",
+    )
+
+    parser.add_argument(
+        "--profile",
+        choices=["cpu", "mem"],
+        default=None,
+        help="Profile the organize or undo run: cProfile (cpu) or tracemalloc (mem)",
+    )
+
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Where to write the pstats file or memory snapshot "
+        "(default: afo-<mode>-<time> in the current directory)",
+    )
+
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=20,
+        metavar="N",
+        help="Number of functions or allocation sites in the profile summary",
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="With --watchdog or --daemon, keep a Prometheus textfile at PATH",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        metavar="PORT",
+        help="With --watchdog or --daemon, serve metrics on localhost:PORT/metrics",
+    )
+
     parser.add_argument(
         "--history",
         action="store_true",
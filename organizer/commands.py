@@ -2,14 +2,12 @@ import json
 import sys
 from pathlib import Path
 from organizer.core import FileOrganizer
-from organizer.utils.data import history
+from organizer.utils.data import set_history_backend
 from organizer.logger_code import get_logger
-from organizer.utils.data import rules_func
-from organizer.file_watcher import activate_watchdog
+from organizer.utils.data import load_rules
 from organizer.cli import parse_args
-from organizer.app import run_gui
-
-x = rules_func()
+from organizer.utils.profiling import profile, default_output
+from organizer.utils.plan import PlanWriter, read_plan
 
 
 def cli(args):
@@ -22,45 +20,74 @@ def cli(args):
 
     This function initializes the logger, parses the source and rules,
     and creates a FileOrganizer instance. It then performs the organization
-    of files based on the specified rules, with options to undo the last
-    operation or reset the history. Errors during processing are logged
-    and the application exits with a non-zero status code on failure.
+    of files based on the specified rules, or undoes the last organize runs
+    when --undo is given, with an option to reset the history. Errors during
+    processing are logged and the application exits with a non-zero status
+    code on failure.
     """
 
     log = get_logger(log_to_file=bool(args.logfile), log_file=args.logfile)
 
     source = args.source or str(Path.home() / "Downloads")
     rules_path = args.rules
-    data = history()
     simulate = args.simulate
     reset = args.reset
-    if args.rules is not None:
-        try:
-            with open(rules_path) as f:
-                rules = json.load(f)
-                if not isinstance(rules, dict):
-                    log.error(f"Rules file '{rules_path}' is not a valid JSON object.")
-                    sys.exit(1)
-        except FileNotFoundError:
-            log.warning(f"Rules file '{rules_path}' not found.")
-            sys.exit(1)
-        except json.JSONDecodeError as e:
-            log.error(f"Error decoding JSON from rules file '{rules_path}': {e}")
-            sys.exit(1)
-        except Exception as e:
-            log.error(f"Unexpected error reading rules file '{rules_path}': {e}")
-            sys.exit(1)
-    else:
-        rules = x
+    # Compiled rules are cached by path, mtime and size; see load_rules
+    try:
+        matcher = load_rules(rules_path)
+    except FileNotFoundError:
+        log.warning(f"Rules file '{rules_path}' not found.")
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        log.error(f"Error decoding JSON from rules file '{rules_path}': {e}")
+        sys.exit(1)
+    except ValueError:
+        log.error(f"Rules file '{rules_path}' is not a valid JSON object.")
+        sys.exit(1)
+    except Exception as e:
+        log.error(f"Unexpected error reading rules file '{rules_path}': {e}")
+        sys.exit(1)
+    # A simulated run streams its move plan to --plan (stdout by default)
+    plan_writer = PlanWriter(args.plan) if simulate and not args.undo else None
+    # Keep stdout clean for the plan when it is streamed there
+    out = sys.stderr if plan_writer and plan_writer.to_stdout else sys.stdout
     try:
         log.info(f"Starting file organization in directory: {source}")
-        organizer = FileOrganizer(source, rules, data, simulate, logger=log)
-        organizer.organize()
-        if args.undo:
-            organizer.undo()
+        organizer = FileOrganizer(
+            source,
+            matcher,
+            simulate=simulate,
+            logger=log,
+            workers=args.jobs,
+            recursive=args.recursive,
+            max_depth=args.max_depth,
+            exclude=args.exclude,
+            dedup=args.dedup,
+            on_collision=args.on_collision,
+            plan_writer=plan_writer,
+            scan_index=True,
+            sniff=args.sniff,
+        )
+        output = args.profile_output
+        if args.profile and not output:
+            output = default_output(args.profile)
+        with profile(args.profile, output=output, top=args.profile_top) as profiler:
+            if args.undo is not None:
+                organizer.undo(args.undo)
+            elif args.apply:
+                organizer.apply_plan(read_plan(args.apply))
+            else:
+                organizer.organize(full_rescan=args.full_rescan)
+        if profiler is not None:
+            print(profiler.report, file=sys.stderr, end="")
+        if plan_writer is not None:
+            plan_writer.close()
+            print(plan_writer.summary(), file=sys.stderr)
         if reset:
             organizer.reset()
         log.info("File organization completed successfully")
+        if args.stats:
+            print(organizer.metrics.summary(), file=out)
     except Exception as e:
         log.error(f"Error during organization: {e}")
         sys.exit(1)
@@ -73,6 +100,7 @@ def entry():
     This function parses command line arguments and handles different modes of operation:
     - GUI mode: Launches the graphical user interface for file organization.
     - Watchdog mode: Activates the file watcher to monitor and organize files in real-time.
+    - Daemon mode: Watches every folder listed in a config file in one process.
     - CLI mode: Performs file organization based on command line arguments.
 
     Args:
@@ -88,10 +116,22 @@ def entry():
     log = get_logger(log_to_file=bool(args.logfile), log_file=args.logfile)
 
     try:
+        if args.history_backend:
+            set_history_backend(args.history_backend)
+        # The GUI (tkinter) and the watcher (watchdog) are only imported when
+        # used, so a plain CLI run does not pay for them at startup.
         if args.gui:
+            from organizer.app import run_gui
+
             log.info("Launching GUI")
             run_gui(args)
+        elif args.daemon:
+            from organizer.file_watcher import activate_daemon
+
+            activate_daemon(args)
         elif args.watchdog:
+            from organizer.file_watcher import activate_watchdog
+
             activate_watchdog(args)
         else:
             cli(args)
@@ -1,101 +1,764 @@
 from pathlib import Path
-from organizer.utils import record_move, update, reset
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from organizer.utils import record_move, commit, discard, restore, reset, last_batches
+from organizer.utils.data import HASH_CACHE_PATH, SCAN_INDEX_DIR
+from organizer.utils.dedup import Deduplicator, HashCache
+from organizer.utils.journal import batch_key
+from organizer.utils.matcher import compile_rules
+from organizer.utils.metrics import Metrics
+from organizer.utils.mover import move_file, DirHandles
+from organizer.utils.names import NameIndex, COLLISION_POLICIES
+from organizer.utils.retry import RetryQueue
+from organizer.utils.scan_index import ScanIndex, index_path, fingerprint
+from organizer.utils.sniff import Sniffer
+from organizer.utils.scanner import scan_files, walk_files, chunked, is_excluded
+import os
+import stat
 import time
+import uuid
 import logging
 
+PARALLEL_UNDO_THRESHOLD = 64  # Reverts at least this large run in a thread pool
+UNDO_WORKERS = 8
+SCAN_CHUNK_SIZE = 1024  # Files matched and moved per step of a streaming scan
+WALK_WORKERS = 8  # Threads scanning directories in recursive mode
+RETRY_ATTEMPTS = 5  # Tries per move when the file is locked
+RETRY_BASE_DELAY = 0.25  # Seconds before the first retry; doubled for each retry
+RETRY_MAX_DELAY = 8.0
+
+
+def new_batch_id():
+    """Returns a unique, time-sortable id for one organize run."""
+    return f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+
 
 class FileOrganizer:
 
-    def __init__(self, source_folder, rules, history, simulate=False, logger=None):
+    def __init__(
+        self,
+        source_folder,
+        rules,
+        history=None,
+        simulate=False,
+        logger=None,
+        workers=1,
+        recursive=False,
+        max_depth=None,
+        exclude=(),
+        dedup=None,
+        on_collision="rename",
+        metrics=None,
+        plan_writer=None,
+        scan_index=False,
+        sniff=False,
+    ):
         """
         Initializes a new instance of the FileOrganizer class.
 
         Args:
             source_folder: The source directory to organize.
-            rules: The rules for organizing files.
-            history: The history of file moves.
+            rules: The rules for organizing files, either a dict mapping
+                extensions to folders or a compiled RuleMatcher.
+            history: Optional in-memory list of file moves. The history store is
+                the source of truth; undone batches are also pruned from this list.
             simulate: Whether to simulate the organization process.
             logger: The logger to use for logging events.
+            workers: Number of threads used to move files. With more than one
+                worker, files are grouped by destination folder and the groups
+                are moved in parallel, which helps on network shares where each
+                rename is a round-trip.
+            recursive: Whether to also organize files in subfolders of the source
+                directory. Files are moved to the rule's folder at the top of the
+                source directory; rule destination folders are never descended into.
+            max_depth: In recursive mode, how many folder levels to descend
+                (None for no limit).
+            exclude: Glob patterns of files and folders to leave alone, matched
+                against names and paths relative to the source directory.
+            dedup: What to do with files whose content already exists in their
+                destination folder: "skip", "hardlink" or "remove". None (the
+                default) disables duplicate detection.
+            on_collision: What to do when a file of the same name already exists
+                in the destination: "rename" (the default) moves the file as
+                "name (n).ext", "skip" leaves it in place, "overwrite" replaces
+                the existing file and "keep-newer" replaces it only if the
+                incoming file was modified more recently.
+            metrics: The Metrics object that phase timings and counters are
+                recorded in; a new one by default.
+            plan_writer: A PlanWriter that simulated moves are streamed to as a
+                reviewable move plan (see `apply_plan`). Only used when
+                simulating; without it, simulated moves are just logged.
+            scan_index: Whether `organize` keeps a persistent index of the
+                files that matched no rule, so later runs skip them while they
+                are unchanged and skip listing an unchanged folder (see
+                ScanIndex). Meant for frequent runs, e.g. from cron.
+            sniff: Whether files whose name matches no rule (no extension, or
+                an unknown one) are classified by their first bytes, e.g. a PDF
+                saved as "download" goes where ".pdf" files go (see Sniffer).
         """
         self.source = Path(source_folder)
-        self.rules = rules
-
+        self._source_abs = os.path.abspath(self.source)
+        self.matcher = compile_rules(rules)
+        self.rules = self.matcher.rules
         self.history = history
         self.simulate = simulate
         self.logger = logger or logging.getLogger(__name__)
+        self.metrics = metrics or Metrics()
+        self.plan_writer = plan_writer
+        self.scan_index = scan_index
+        self.sniffer = Sniffer(logger=self.logger) if sniff else None
+        self.workers = max(1, int(workers or 1))
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.exclude = tuple(exclude or ())
+        self.dedup = dedup
+        if on_collision not in COLLISION_POLICIES:
+            raise ValueError(f"Unknown collision policy '{on_collision}'")
+        self.on_collision = on_collision
+        self._names = {}  # dest dir -> NameIndex for the current run
+        self._names_scan = True
+        self.batch_id = None
+        self._dest_dirs = None
+        self._deduper = None
+        self._retries = self._new_retry_queue()
+        self.failures = []  # (path, reason) of the moves of the last batch that failed
+        self._made_dirs = set()  # Destination folders known to exist in this batch
+        self._dirs = None  # DirHandles of the running batch
+
+    def set_rules(self, rules):
+        """
+        Replaces the rules used for the following moves.
+
+        Args:
+            rules: A rules dict or a compiled RuleMatcher.
+
+        The new matcher is swapped in with a single assignment, so a batch that
+        is running keeps a consistent view as long as this is called between
+        batches (as the watcher does).
+        """
+        matcher = compile_rules(rules)
+        self.rules = matcher.rules
+        self.matcher = matcher
 
-    def organize(self):
+    def organize(self, full_rescan=False):
         """
         Organizes all files in the source directory based on the rules.
 
-        For each file in the source directory, it checks if the file extension matches
-        one of the rules. If it does, it moves the file to the directory specified by
-        the rule. If the directory does not exist, it is created.
+        The source directory is scanned lazily and files are matched and moved in
+        chunks of SCAN_CHUNK_SIZE, so memory use stays constant and moving starts
+        before the scan has finished. In recursive mode the subfolders are walked
+        in parallel, skipping the rule destination folders.
+
+        For each file in the source directory, it looks up the file extension in the
+        compiled rules (case-insensitively, longest multi-part extension first). If a
+        rule matches, it moves the file to the directory specified by the rule. If the
+        directory does not exist, it is created when the first file is moved there;
+        folders of rules that match nothing are not created. Files are renamed
+        relative to open descriptors of their source and destination folders.
 
         If the simulate flag is set, the file moves are only simulated and the files
         are not actually moved.
 
-        If an error occurs during the move (e.g. permission denied), the error is
-        logged and the move is retried up to 5 times. If the move fails after 5
-        retries, the error is logged and the move is skipped.
+        If a dedup policy is set, files whose content already exists in their
+        destination folder (or earlier in the same run) are skipped, hardlinked
+        or removed instead of being moved.
+
+        Every call is one batch: all moves it records share a new batch id, so
+        the whole run can be reverted at once with `undo`.
+
+        If a file is locked (permission denied), its move is put on a retry queue
+        with exponential backoff and jitter instead of blocking the batch; due
+        retries run between chunks and the remaining ones after the last chunk.
+        A move that still fails after RETRY_ATTEMPTS tries, or fails with any
+        other error, is skipped, and all failures are listed in a summary at the
+        end of the run (and kept in `failures`).
+
+        With `scan_index`, files that matched no rule on an earlier run are
+        skipped while their inode, size and mtime are unchanged, and an
+        unchanged folder is not listed at all (non-recursive mode). Pass
+        `full_rescan=True` to ignore the index and rebuild it.
         """
-        files = [x for x in self.source.iterdir() if x.is_file()]
-        if not self.simulate:
-            for dir in self.rules.values():
+        self._start_batch()
+        index = self._open_index(full_rescan) if self.scan_index else None
+        if index is None:
+            files = self._scan()
+        elif not self.recursive and index.unchanged():
+            self.logger.info(f"No changes in {self.source} since the last run")
+            files = index.pending()
+            self.metrics.inc("index_hits", len(index.entries))
+            index = None  # Nothing new to record
+        else:
+            files = index.filter(self._scan())
+        chunks = chunked(files, SCAN_CHUNK_SIZE)
+        self._close_deduper()  # Index the destination folders afresh for this run
+        self._names, self._names_scan = {}, True
+        try:
+            while True:
+                with self.metrics.timer("scan"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                self.metrics.inc("files_scanned", len(chunk))
+                unmatched = [] if index is not None else None
+                moves = self._plan(chunk, unmatched)
+                if unmatched:
+                    index.settle(unmatched)
+                self._execute(self._deduplicate(moves))
+                self._run_retries(wait=False)
+            self._run_retries()
+            if index is not None:
+                self.metrics.inc("index_hits", index.hits)
+                if not self.simulate:
+                    index.save(self.recursive)
+        finally:
+            self._close_deduper()
+            self._close_dirs()
+            self._close_sniffer()
+        self._finish_batch()
+
+    def organize_paths(self, paths):
+        """
+        Organizes only the given files, as one batch.
+
+        Args:
+            paths: Paths of files that appeared in the source directory.
+
+        Unlike `organize`, this does not scan the source directory and only
+        creates the destination folders the given files need, so the cost is
+        proportional to the number of paths rather than to the size of the
+        folder. Paths that are not regular files in the source directory (or, in
+        recursive mode, below it), or that are inside a destination folder or
+        excluded, are ignored.
+        """
+        files = []
+        for path in paths:
+            path = Path(path)
+            if self._accepts(path) and path.is_file():
+                files.append(path)
+        # Check names on demand instead of listing whole destination folders,
+        # and keep the rename counters of earlier batches while no one else
+        # touched the folder
+        if self._names_scan:
+            self._names, self._names_scan = {}, False
+        self._names = {d: i for d, i in self._names.items() if not i.stale()}
+        for index in self._names.values():
+            index.new_run()
+        try:
+            try:
+                moves = self._plan(files)
+            finally:
+                self._close_sniffer()
+            if not moves:
+                return
+            self._start_batch()
+            try:
+                self._execute(self._deduplicate(moves))
+                self._run_retries()
+            finally:
+                # Index the destination folders afresh for the next batch
+                self._close_deduper()
+                self._close_dirs()
+            self._finish_batch()
+        finally:
+            for index in self._names.values():
+                index.stamp()
+
+    def apply_plan(self, entries):
+        """
+        Executes a reviewed move plan as one batch, without scanning or matching.
+
+        Args:
+            entries: Plan entries (dicts with src, dest, size and rule), as
+                written by a simulated run with a PlanWriter and read back with
+                `read_plan`.
+
+        Each source is validated with a single stat: it must still be a regular
+        file of the planned size, otherwise the entry is skipped and reported as
+        a failure. Destinations are checked against the collision policy, since
+        files may have arrived there after the plan was made. The moves then run
+        like those of `organize`: in parallel with several workers, retried when
+        locked, and recorded as one batch that `undo` can revert.
+
+        The whole plan is read before anything moves, so a malformed entry
+        (ValueError from `read_plan`) aborts the run instead of leaving part
+        of it applied and unrecorded.
+        """
+        entries = list(entries)
+        self._start_batch()
+        self._names, self._names_scan = {}, False
+        try:
+            self._apply_entries(entries)
+        finally:
+            self._close_dirs()
+        self._finish_batch()
+
+    def _apply_entries(self, entries):
+        for chunk in chunked(entries, SCAN_CHUNK_SIZE):
+            moves = []
+            for entry in chunk:
+                src, dest = Path(entry["src"]), Path(entry["dest"])
                 try:
-                    Path(self.source / dir).mkdir(parents=True, exist_ok=True)
-                except Exception as e:
-                    self.logger.error(f"Error creating directory '{dir}': {e}")
-        for x in files:
-            for a, b in self.rules.items():
-                if Path(x).suffix == a:
-                    dest = Path(self.source) / b / Path(x).name
-                    for attempt in range(5):  # Try up to 5 times
-                        try:
-                            if not self.simulate:
-                                Path(x).rename(dest)
-                            record_move(x, dest, self.simulate, logger=self.logger)
-                            break  # Success, exit retry loop
-                        except PermissionError:
-                            if attempt < 4:
-                                time.sleep(0.5)  # Wait half a second before retrying
-                            else:
-                                self.logger.error(
-                                    f"Permission denied after retries: {x}"
-                                )
-                        except FileNotFoundError:
-                            self.logger.error(f"File not found: {x}")
-                            break
-                        except Exception as e:
-                            self.logger.error(f"Error moving '{x}' to '{dest}': {e}")
-                            break
-
-    def undo(self):
-        """
-        Reverts the last file move operation recorded in history.
-
-        This function checks the history for the last file move, backs up the
-        original file if it still exists, and then restores the file to its
-        original location. If the history is empty, it logs an informational
-        message. In case of any errors during the undo process, an error message
-        is logged.
-        """
-        if not self.history:
+                    st = os.stat(src)
+                except OSError:
+                    self.logger.error(f"Planned file is gone: {src}")
+                    self._fail(src, "missing since the plan was made")
+                    continue
+                size = entry.get("size")
+                if not stat.S_ISREG(st.st_mode) or size not in (None, st.st_size):
+                    self.logger.error(f"Planned file has changed: {src}")
+                    self._fail(src, "changed since the plan was made")
+                    continue
+                rule = entry.get("rule") or dest.suffix
+                dest = self._resolve_collision(src, dest.parent, dest.name, rule)
+                if dest is not None:
+                    moves.append((src, dest))
+            self._execute(moves)
+            self._run_retries(wait=False)
+        self._run_retries()
+
+    def organize_one(self, path):
+        """
+        Organizes a single file. See `organize_paths`.
+
+        Args:
+            path: Path of a file in the source directory.
+        """
+        self.organize_paths([path])
+
+    def _start_batch(self):
+        """Starts a new batch: a new batch id, retry queue and failure list."""
+        self.batch_id = new_batch_id()
+        self._retries = self._new_retry_queue()
+        self.failures = []
+        self._made_dirs = set()
+        self._dirs = None if self.simulate else DirHandles()
+
+    def _finish_batch(self):
+        """Reports the failed moves and commits the batch to the history."""
+        self._report_failures()
+        if not self.simulate:
+            with self.metrics.timer("history_commit"):
+                commit()  # One history write for the whole batch
+
+    def _mkdir(self, dir):
+        """Creates a destination folder once per batch."""
+        if dir in self._made_dirs:
+            return
+        try:
+            with self.metrics.timer("mkdir"):
+                Path(dir).mkdir(parents=True, exist_ok=True)
+            self._made_dirs.add(dir)
+        except Exception as e:
+            self.logger.error(f"Error creating directory '{dir}': {e}")
+
+    def _close_dirs(self):
+        if self._dirs is not None:
+            self._dirs.close()
+            self._dirs = None
+
+    @staticmethod
+    def _new_retry_queue():
+        return RetryQueue(RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+    def _destination_dirs(self):
+        """Returns the absolute paths of the rule destination folders."""
+        cached = self._dest_dirs
+        if cached is None or cached[0] is not self.matcher:
+            dirs = {
+                os.path.abspath(os.path.join(self._source_abs, d))
+                for d in self.matcher.destinations()
+            }
+            cached = self._dest_dirs = (self.matcher, dirs)
+        return cached[1]
+
+    def _open_index(self, full_rescan=False):
+        """Returns the ScanIndex of the source folder for the current rules."""
+        key = fingerprint(
+            sorted(self.rules.items()),
+            self.recursive,
+            self.max_depth,
+            self.exclude,
+            self.sniffer is not None,
+        )
+        index = ScanIndex(
+            self.source, index_path(self.source, SCAN_INDEX_DIR), key, self.logger
+        )
+        if full_rescan:
+            index.clear()
+        return index
+
+    def _scan(self):
+        """Returns an iterator over the candidate files of the source directory."""
+        if not self.recursive:
+            files = scan_files(self.source)
+            if self.exclude:
+                files = (
+                    f for f in files if not is_excluded(f.name, f.name, self.exclude)
+                )
+            return files
+        return walk_files(
+            self.source,
+            max_depth=self.max_depth,
+            exclude=self.exclude,
+            skip_dirs=self._destination_dirs(),
+            workers=WALK_WORKERS,
+        )
+
+    def _accepts(self, path):
+        """
+        Returns True if `path` is a file this organizer should handle.
+
+        Applies the same rules as a scan: the file must be in the source
+        directory (or below it in recursive mode, within max_depth), outside the
+        destination folders, and not excluded.
+        """
+        rel = os.path.relpath(os.path.abspath(path), self._source_abs)
+        parts = rel.split(os.sep)
+        if parts[0] in (os.curdir, os.pardir):
+            return False
+        if len(parts) > 1:
+            if not self.recursive:
+                return False
+            if self.max_depth is not None and len(parts) - 1 > self.max_depth:
+                return False
+            skip = self._destination_dirs()
+            for i in range(1, len(parts)):
+                if os.path.join(self._source_abs, *parts[:i]) in skip:
+                    return False
+        if self.exclude:
+            for i in range(1, len(parts) + 1):
+                if is_excluded(parts[i - 1], "/".join(parts[:i]), self.exclude):
+                    return False
+        return True
+
+    def _plan(self, files, unmatched=None):
+        """
+        Returns the (source, destination) moves for the files that match a rule.
+
+        Args:
+            files: Paths or `os.DirEntry` objects of the candidate files.
+            unmatched: A list the files that match no rule are appended to, or
+                None.
+
+        With `sniff`, files whose name matches no rule are classified by their
+        content, and the extension found is matched against the rules instead.
+        """
+        moves = []
+        unknown = []
+        matched = 0
+        with self.metrics.timer("match"):
+            for x in files:
+                hit = self.matcher.match_rule(x.name)
+                if hit is None:
+                    unknown.append(x)
+                    continue
+                matched += 1
+                dest = self._resolve_collision(x, self.source / hit[0], x.name, hit[1])
+                if dest is not None:
+                    moves.append((Path(x), dest))
+        if unknown and self.sniffer is not None:
+            with self.metrics.timer("sniff"):
+                exts = self.sniffer.sniff_many(unknown)
+            rest = []
+            for x, ext in zip(unknown, exts):
+                hit = ext and self.matcher.match_rule("file" + ext)
+                if not hit:
+                    rest.append(x)
+                    continue
+                matched += 1
+                self.metrics.inc("files_sniffed")
+                # The name is kept; its own extension, if any, stays at the end
+                dest = self._resolve_collision(x, self.source / hit[0], x.name, None)
+                if dest is not None:
+                    moves.append((Path(x), dest))
+            unknown = rest
+        if unmatched is not None:
+            unmatched.extend(unknown)
+        self.metrics.inc("files_matched", matched)
+        return moves
+
+    def _resolve_collision(self, x, folder, name, rule):
+        """
+        Applies the collision policy and returns the destination path, or None.
+
+        Names are looked up in a per-folder NameIndex built once per run, and
+        names handed out are reserved in it, so files of the same name in one
+        run get distinct destinations.
+        """
+        index = self._names.get(folder)
+        if index is None:
+            index = self._names[folder] = NameIndex(folder, scan=self._names_scan)
+        if name not in index:
+            index.add(name, x)
+            return folder / name
+        earlier = index.reserved_for(name)
+        if earlier is not None and self.on_collision in ("overwrite", "keep-newer"):
+            # Another file of this run takes the name; never replace it blindly
+            try:
+                older = os.stat(x).st_mtime <= os.stat(earlier).st_mtime
+            except FileNotFoundError:
+                older = False  # Already moved: keep both
+            if self.on_collision == "keep-newer" and older:
+                self.logger.info(f"Newer file of the same name in this run: {x}")
+                return None
+            return folder / index.allocate(name, self._suffix(name, rule))
+        if self.on_collision == "rename":
+            return folder / index.allocate(name, self._suffix(name, rule))
+        if self.on_collision == "keep-newer":
+            try:
+                if os.stat(x).st_mtime <= os.stat(folder / name).st_mtime:
+                    self.logger.info(f"Newer file in destination, skipping: {x}")
+                    return None
+            except FileNotFoundError:
+                pass  # Gone from the destination
+            return folder / name
+        if self.on_collision == "overwrite":
+            return folder / name
+        self.logger.info(f"File already exists in destination, skipping: {x}")
+        return None
+
+    @staticmethod
+    def _suffix(name, rule):
+        """Returns the extension kept at the end of a renamed file, or None."""
+        if rule is None:
+            return None  # A sniffed file keeps its own last extension
+        parts = len(rule.strip(".").split("."))
+        return "." + ".".join(name.split(".")[-parts:])
+
+    def _deduplicate(self, moves):
+        """
+        Applies the dedup policy and returns the moves that should still happen.
+        """
+        if not self.dedup or not moves:
+            return moves
+        if self._deduper is None:
+            self._deduper = Deduplicator(
+                self.dedup, cache=HashCache(HASH_CACHE_PATH), logger=self.logger
+            )
+        duplicates = self._deduper.find(moves)
+        if not duplicates:
+            return moves
+        self.metrics.inc("duplicates", len(duplicates))
+        kept = []
+        for x, dest in moves:
+            original = duplicates.get(str(x))
+            if original is None:
+                kept.append((x, dest))
+            else:
+                self._handle_duplicate(x, dest, original)
+        return kept
+
+    def _handle_duplicate(self, x, dest, original):
+        """Skips, hardlinks or removes a file whose content exists at `original`."""
+        if self.simulate or self.dedup == "skip":
+            self.logger.info(f"Duplicate of '{original}', skipping: {x}")
+            return
+        try:
+            if self.dedup == "remove":
+                os.unlink(x)
+                self.logger.info(f"Removed duplicate of '{original}': {x}")
+            elif not dest.exists():
+                self._mkdir(dest.parent)
+                os.link(original, dest)
+                os.unlink(x)
+                record_move(
+                    x, dest, self.simulate, logger=self.logger, batch=self.batch_id
+                )
+                self.logger.info(f"Hardlinked duplicate of '{original}': {dest}")
+            elif os.path.samefile(dest, original):
+                os.unlink(x)
+                self.logger.info(f"Removed duplicate of '{original}': {x}")
+            else:
+                self.logger.info(f"Duplicate of '{original}', skipping: {x}")
+        except Exception as e:
+            self.logger.error(f"Error handling duplicate '{x}': {e}")
+
+    def _close_sniffer(self):
+        if self.sniffer is not None:
+            self.sniffer.close()
+
+    def _close_deduper(self):
+        if self._deduper is not None:
+            self._deduper.close()
+            self._deduper = None
+
+    def _execute(self, moves):
+        """
+        Performs the planned (source, destination) moves.
+
+        With a single worker the moves run in order. Otherwise they are grouped
+        by destination folder; each group is moved sequentially in file name
+        order by one task of a bounded thread pool, so the order within a
+        destination is deterministic while different destinations proceed in
+        parallel.
+
+        Destination folders are created on demand, before the first move into
+        them.
+        """
+        if not self.simulate:
+            for dir in dict.fromkeys(dest.parent for _, dest in moves):
+                self._mkdir(dir)
+        if self.workers == 1 or self.simulate or len(moves) < 2:
+            for x, dest in moves:
+                self._move(x, dest)
+            return
+        groups = {}
+        for x, dest in moves:
+            groups.setdefault(dest.parent, []).append((x, dest))
+        for group in groups.values():
+            group.sort(key=lambda move: move[0].name)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(self._move_group, groups.values()))
+
+    def _move_group(self, group):
+        for x, dest in group:
+            self._move(x, dest)
+
+    def _move(self, x, dest, tries=0):
+        """
+        Moves one file and records the move.
+
+        Args:
+            x: Path of the file to move.
+            dest: Destination path of the file.
+            tries: Number of earlier failed tries of this move.
+
+        Destinations on another filesystem are handled by `move_file`, which
+        falls back to a verified kernel-side copy. On a permission error the
+        move is scheduled on the retry queue rather than retried in place.
+        """
+        metrics = self.metrics
+        try:
+            if self.simulate and self.plan_writer is not None:
+                hit = self.matcher.match_rule(x.name)
+                self.plan_writer.add(x, dest, os.stat(x).st_size, hit and hit[1])
+                metrics.inc("files_moved")
+                return
+            if not self.simulate:
+                with metrics.timer("rename"):
+                    move_file(x, dest, dirs=self._dirs)
+            with metrics.timer("history_write"):
+                record_move(
+                    x, dest, self.simulate, logger=self.logger, batch=self.batch_id
+                )
+            metrics.inc("files_moved")
+        except PermissionError:
+            if self._retries.schedule((x, dest), tries + 1):
+                metrics.inc("retries")
+                self.logger.warning(f"Permission denied, will retry: {x}")
+            else:
+                self.logger.error(f"Permission denied after retries: {x}")
+                self._fail(x, f"permission denied after {tries + 1} tries")
+        except FileNotFoundError:
+            self.logger.error(f"File not found: {x}")
+            self._fail(x, "file not found")
+        except Exception as e:
+            self.logger.error(f"Error moving '{x}' to '{dest}': {e}")
+            self._fail(x, str(e))
+
+    def _fail(self, x, reason):
+        self.failures.append((x, reason))
+        self.metrics.inc("move_errors")
+
+    def _run_retries(self, wait=True):
+        """
+        Runs the retries that are due.
+
+        Args:
+            wait: Whether to keep waiting for, and running, scheduled retries
+                until the queue is empty. Otherwise only due retries are run.
+        """
+        while len(self._retries):
+            due = self._retries.pop_due()
+            if not due:
+                if not wait:
+                    return
+                with self.metrics.timer("retry_wait"):
+                    time.sleep(max(0.0, self._retries.next_due() - time.monotonic()))
+                continue
+            for (x, dest), tries in due:
+                self._move(x, dest, tries)
+
+    def _report_failures(self):
+        """Logs a summary of the moves of this batch that failed permanently."""
+        if not self.failures:
+            return
+        lines = "".join(f"\n  {x}: {reason}" for x, reason in self.failures)
+        self.logger.error(f"{len(self.failures)} file(s) could not be moved:{lines}")
+
+    def undo(self, batches=1):
+        """
+        Reverts the last organize batches recorded in history.
+
+        Args:
+            batches: The number of batches (organize runs) to revert.
+
+        Batches are reverted newest first. For every move, the file at the
+        original location is backed up if one exists, and the file is then moved
+        back. Moves of a large batch are reverted in parallel. Once all batches
+        have been processed, they are removed from the history with a single
+        commit. If the history is empty, it logs an informational message. Moves
+        that cannot be reverted are logged as errors and stay in the history, so
+        a later undo can try them again.
+        """
+        if batches < 1:
+            self.logger.error(f"Number of batches must be at least 1, got {batches}")
+            return
+        try:
+            groups = last_batches(batches)
+        except Exception as e:
+            self.logger.error(f"Error during undo: {e}")
+            return
+        if not groups:
             self.logger.info("No history to undo.")
             return
+        count = 0
+        failed = []
+        for batch, moves in groups:
+            moves = list(reversed(moves))
+            if len(moves) >= PARALLEL_UNDO_THRESHOLD:
+                with ThreadPoolExecutor(max_workers=UNDO_WORKERS) as pool:
+                    results = list(pool.map(self._revert, moves))
+            else:
+                results = [self._revert(move) for move in moves]
+            count += len(moves)
+            failed += [m for m, ok in zip(moves, results) if not ok]
+        keys = [batch for batch, _ in groups]
+        discard(keys, count=count)
+        failed.reverse()  # Back to recording order
+        if failed:
+            restore(failed)
+        if isinstance(self.history, list):
+            undone = set(keys)
+            self.history[:] = [m for m in self.history if batch_key(m) not in undone]
+            self.history.extend(failed)
+        self.logger.info(
+            f"Undid {count - len(failed)} moves from {len(groups)} batch(es)."
+        )
+        if failed:
+            self.logger.error(
+                f"{len(failed)} moves could not be reverted and were kept in history."
+            )
+
+    def _revert(self, move):
+        """
+        Moves one file back to its original location.
+
+        Returns True on success and False if the move could not be reverted.
+        """
         try:
-            self.last_move = self.history.pop()
-            orig = Path(self.last_move["original_path"])
-            new = Path(self.last_move["new_path"])
+            orig = Path(move["original_path"])
+            new = Path(move["new_path"])
             backup = orig.with_name(orig.stem + "_backup" + orig.suffix)
 
             if orig.exists():
                 # Backup the existing file before replacing
                 orig.rename(backup)
-            new.rename(orig)
-            update(self.history, logfile=self.logger)
+            move_file(new, orig)
+            return True
         except Exception as e:
             self.logger.error(f"Error during undo: {e}")
+            return False
 
     def reset(self):
         """
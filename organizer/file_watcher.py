@@ -1,61 +1,262 @@
 import json
+import logging
+import os
+import threading
 import time
 from watchdog.observers import Observer
 from watchdog.events import DirCreatedEvent, FileCreatedEvent, FileSystemEventHandler
 from pathlib import Path
 from organizer.core import FileOrganizer
-from organizer.utils.data import history
 from organizer.logger_code import get_logger
-from organizer.utils.data import rules_func
+from organizer.utils.data import load_rules, RULES_PATH
+from organizer.utils.dedup import DEDUP_POLICIES
+from organizer.utils.event_queue import CoalescingQueue, EventWorker
+from organizer.utils.stability import StabilityTracker, is_in_progress
+from organizer.utils import inotify
+from organizer.utils.metrics import Metrics, MetricsGroup, MetricsServer
+from organizer.utils.names import COLLISION_POLICIES
+
+METRICS_INTERVAL = 15  # Seconds between writes of the metrics textfile
+
+# Options a daemon config entry may set for its folder, with their defaults
+FOLDER_OPTIONS = {
+    "recursive": False,
+    "max_depth": None,
+    "exclude": (),
+    "dedup": None,
+    "on_collision": "rename",
+    "jobs": 1,
+    "sniff": False,
+}
+
+
+class WatchedFolder:
+    """
+    One folder served by a MyHandler: its organizer and its rules file.
+    """
+
+    def __init__(self, organizer, rules_path=None, name=None):
+        """
+        Initializes a new watched folder.
+
+        Args:
+            organizer: The FileOrganizer for the folder.
+            rules_path: Path of the rules file to hot-reload, or None to keep
+                the organizer's rules.
+            name: Name of the folder in logs and metrics (default: the folder's
+                base name).
+        """
+        self.organizer = organizer
+        self.rules_path = rules_path
+        self.root = os.path.abspath(organizer.source)
+        self.name = name or os.path.basename(self.root) or self.root
+        # A FileOrganizer runs one batch at a time
+        self.lock = threading.Lock()
+
+    def contains(self, path):
+        return path == self.root or path.startswith(self.root + os.sep)
 
 
 class MyHandler(FileSystemEventHandler):
-    def __init__(self, organizer):
+    def __init__(
+        self,
+        organizer=None,
+        debounce=0.2,
+        logger=None,
+        rules_path=None,
+        workers=1,
+        metrics=None,
+    ):
+        """
+        Initializes a new event handler.
+
+        Args:
+            organizer: The FileOrganizer that files are handed to, or None to
+                add folders with `add_folder`.
+            debounce: Seconds a file must be quiet before it is organized.
+            logger: The logger to use for logging events.
+            rules_path: Path of the organizer's rules file to hot-reload, or
+                None to keep the organizer's rules.
+            workers: Number of worker threads organizing queued paths.
+            metrics: Metrics for the event queue (default: the organizer's).
+
+        Events only hand the affected path to a StabilityTracker, which polls the
+        file's size and mtime in the background and skips in-progress downloads
+        (.part, .crdownload, .tmp). Once a file is quiescent it is put on a
+        coalescing queue, and worker threads organize paths once they have been
+        quiet for `debounce` seconds. Bursts are never dropped and the observer
+        thread never blocks on polling or file moves.
+
+        One handler can serve many folders: the tracker, the queue and the
+        workers are shared, and each batch is split by folder and handed to
+        that folder's organizer. Before each batch, the worker checks the
+        folder's rules file (one stat, see load_rules) and swaps in the new
+        rules if it changed, so edits take effect without restarting.
+
+        With the inotify backend, files are reported once they are complete
+        (see on_file_complete) and go straight to the queue.
+        """
         super().__init__()
+        if organizer is None and metrics is None:
+            raise ValueError("MyHandler needs an organizer or metrics")
         self.organizer = organizer
-        self.last_organize_time = 0
-        self.organize_cooldown = 2  # Seconds to wait between organizes
+        if logger is None:
+            logger = organizer.logger if organizer else logging.getLogger(__name__)
+        self.logger = logger
+        self.metrics = metrics or organizer.metrics
+        self.folders = []
+        self.queue = CoalescingQueue(debounce, metrics=self.metrics)
+        self.tracker = StabilityTracker(self.queue.put, logger=self.logger)
+        self.workers = [
+            EventWorker(self.queue, self._organize, self.logger)
+            for _ in range(max(1, workers))
+        ]
+        self.metrics.gauge("queue_depth", self.queue.__len__)
+        self.metrics.gauge("tracked_files", self.tracker.__len__)
+        if organizer is not None:
+            self.add_folder(organizer, rules_path)
+
+    @property
+    def rules_path(self):
+        return self.folders[0].rules_path if self.folders else None
+
+    def add_folder(self, organizer, rules_path=None, name=None):
+        """
+        Serves another folder; call before `start`.
+
+        Args:
+            organizer: The FileOrganizer for the folder.
+            rules_path: Path of its rules file to hot-reload, or None.
+            name: Name of the folder in logs and metrics.
+
+        Returns:
+            The new WatchedFolder.
+        """
+        folder = WatchedFolder(organizer, rules_path, name)
+        self.folders.append(folder)
+        # Nested folders: the innermost one owns the files below it
+        self.folders.sort(key=lambda f: len(f.root), reverse=True)
+        return folder
+
+    def folder_for(self, path):
+        """Returns the WatchedFolder that `path` belongs to, or None."""
+        path = os.path.abspath(path)
+        for folder in self.folders:
+            if folder.contains(path):
+                return folder
+        return None
 
-    def _should_organize(self):
-        """Check if enough time has passed since last organize to avoid spam"""
-        import time
+    def start(self):
+        """Starts the stability tracker and the worker threads."""
+        self.tracker.start()
+        for worker in self.workers:
+            worker.start()
 
-        current_time = time.time()
-        if current_time - self.last_organize_time >= self.organize_cooldown:
-            self.last_organize_time = current_time
-            return True
-        return False
+    def stop(self):
+        """Organizes the paths still queued and stops the background threads."""
+        self.tracker.stop()
+        for worker in self.workers:
+            worker.stop()
+
+    def stats(self):
+        """Returns the queue depth and processing latency statistics."""
+        return self.queue.stats()
+
+    def reload_rules(self, folder=None):
+        """
+        Swaps in the rules from the rules file if it has changed.
+
+        Args:
+            folder: The WatchedFolder to reload, or None for all of them.
+
+        Called from the worker threads between batches. If the file cannot be
+        read or parsed (e.g. while it is being edited), the current rules stay
+        in effect.
+        """
+        for folder in [folder] if folder else self.folders:
+            if folder.rules_path is None:
+                continue
+            try:
+                matcher = load_rules(folder.rules_path)
+            except Exception as e:
+                self.logger.error(
+                    f"Cannot load '{folder.rules_path}', keeping rules: {e}"
+                )
+                continue
+            if matcher is not folder.organizer.matcher:
+                folder.organizer.set_rules(matcher)
+                self.logger.info(
+                    f"Reloaded {len(matcher)} rules from {folder.rules_path}"
+                )
+
+    def _organize(self, paths):
+        by_folder = {}
+        for path in paths:
+            folder = self.folder_for(path)
+            if folder is not None:
+                by_folder.setdefault(folder, []).append(path)
+        for folder, folder_paths in by_folder.items():
+            with folder.lock:
+                self.reload_rules(folder)
+                folder.organizer.organize_paths(folder_paths)
+
+    def on_any_event(self, event):
+        """Count every event for the metrics"""
+        folder = self.folder_for(event.src_path)
+        (folder.organizer.metrics if folder else self.metrics).inc("events")
+
+    def on_file_complete(self, path):
+        """
+        Handles a file known to be complete (closed after writing, or renamed
+        into place), as reported by the inotify backend.
+
+        The file skips the stability tracker and is queued right away.
+        """
+        folder = self.folder_for(path)
+        (folder.organizer.metrics if folder else self.metrics).inc("events")
+        if not is_in_progress(path):
+            self.queue.put(path)
+
+    def on_file_found(self, path):
+        """Handles a file that may still be written, such as one in a new folder."""
+        self.tracker.watch(path)
+
+    def on_overflow(self):
+        """
+        Rescans every folder after the inotify backend lost events.
+
+        Runs in its own thread so event delivery goes on meanwhile.
+        """
+        self.metrics.inc("overflows")
+        threading.Thread(target=self._rescan, name="organizer-rescan").start()
+
+    def _rescan(self):
+        for folder in self.folders:
+            with folder.lock:
+                try:
+                    folder.organizer.organize()
+                except Exception as e:
+                    self.logger.error(f"Error rescanning '{folder.root}': {e}")
 
     def on_created(self, event):
         """Handle file/directory creation events"""
-        if not event.is_directory and self._should_organize():
-            self.organizer.organize()
+        if not event.is_directory:
+            self.tracker.watch(event.src_path)
         return super().on_created(event)
 
     def on_moved(self, event):
         """Handle file/directory move events (common for browser downloads)"""
-        if not event.is_directory and self._should_organize():
-            self.organizer.organize()
+        if not event.is_directory:
+            # The file of interest is the one at the new name
+            self.tracker.watch(event.dest_path)
         return super().on_moved(event)
 
     def on_modified(self, event):
         """Handle file modification events (for files that are written incrementally)"""
-        if not event.is_directory and self._should_organize():
-            # Only organize if the file is likely finished downloading
-            # (this helps with large files that are written incrementally)
-            import os
-            import time
-
-            try:
-                # Check if file exists and is not being written to
-                if hasattr(event, "src_path") and os.path.exists(event.src_path):
-                    # Simple heuristic: if file size hasn't changed in 1 second, it's probably done
-                    time.sleep(1)
-                    if os.path.exists(event.src_path):
-                        self.organizer.organize()
-            except (OSError, AttributeError):
-                # If we can't check the file, just organize anyway
-                self.organizer.organize()
+        if not event.is_directory:
+            # The tracker polls the file until writes have stopped
+            self.tracker.watch(event.src_path)
+        return super().on_modified(event)
 
 
 def activate_watchdog(args):
@@ -69,7 +270,7 @@ def activate_watchdog(args):
     The function initializes a logger based on the specified logging options. It loads
     file organization rules from a JSON file if a file path is provided in args.rules,
     otherwise it assumes args.rules is already a dictionary. It then creates a
-    FileOrganizer instance with the specified source directory, rules, and history data.
+    FileOrganizer instance with the specified source directory and rules.
     A watchdog observer is set up to monitor the source directory for changes, using a
     custom event handler to trigger file organization. The observer runs indefinitely
     until interrupted with a keyboard signal (Ctrl+C), at which point it stops and
@@ -79,29 +280,265 @@ def activate_watchdog(args):
         log = get_logger(log_to_file=True, log_file=args.logfile)
     else:
         log = get_logger()
-    # Load rules from file if args.rules is a path
+    # Rules from a file (the given path or the default rules.json) are reloaded
+    # when the file changes; a rules dict is used as is.
     if isinstance(args.rules, str) and Path(args.rules).is_file():
-        with open(args.rules, "r", encoding="utf-8") as f:
-            rules = json.load(f)
+        rules_path = args.rules
+        rules = load_rules(rules_path)
     elif args.rules:
+        rules_path = None
         rules = args.rules  # Already a dict
     else:
-        rules = rules_func()
-    history_data = history()
-    organizer = FileOrganizer(args.source, rules, history_data, logger=log)
-    path = Path(args.source)
-    observer = Observer()
-    handler = MyHandler(organizer)
-    observer.schedule(handler, str(path), recursive=True)
+        rules = load_rules()  # Generates the default rules file if needed
+        rules_path = RULES_PATH
+    organizer = FileOrganizer(
+        args.source,
+        rules,
+        logger=log,
+        workers=getattr(args, "jobs", 1),
+        recursive=getattr(args, "recursive", False),
+        max_depth=getattr(args, "max_depth", None),
+        exclude=getattr(args, "exclude", ()),
+        dedup=getattr(args, "dedup", None),
+        on_collision=getattr(args, "on_collision", "rename"),
+        sniff=getattr(args, "sniff", False),
+    )
+    handler = MyHandler(organizer, logger=log, rules_path=rules_path)
+    backend = getattr(args, "watch_backend", None) or "watchdog"
+    _run(handler, organizer.metrics, args, log, backend)
+
+
+def _check_folder_options(folder, where):
+    """
+    Raises ValueError if an option of a daemon config folder has a bad value,
+    so mistakes show at startup rather than on every batch.
+    """
+    errors = []
+    if folder["dedup"] is not None and folder["dedup"] not in DEDUP_POLICIES:
+        errors.append(f"'dedup' must be one of {', '.join(DEDUP_POLICIES)} or null")
+    if folder["on_collision"] not in COLLISION_POLICIES:
+        errors.append(f"'on_collision' must be one of {', '.join(COLLISION_POLICIES)}")
+    jobs = folder["jobs"]
+    if isinstance(jobs, bool) or not isinstance(jobs, int) or jobs < 1:
+        errors.append("'jobs' must be a positive integer")
+    depth = folder["max_depth"]
+    if depth is not None and (
+        isinstance(depth, bool) or not isinstance(depth, int) or depth < 0
+    ):
+        errors.append("'max_depth' must be a non-negative integer or null")
+    if errors:
+        raise ValueError(f"{where}: {'; '.join(errors)}.")
 
+
+def load_daemon_config(path):
+    """
+    Reads the config file of the multi-folder daemon (`--daemon CONFIG`).
+
+    Args:
+        path: Path of a JSON config file such as:
+
+            {
+              "workers": 2,
+              "debounce": 0.2,
+              "defaults": {"recursive": true, "exclude": ["*.iso"]},
+              "folders": [
+                {"source": "~/Downloads", "rules": "~/rules.json"},
+                {"source": "/home/bob/Downloads", "name": "bob",
+                 "rules": {".pdf": "Docs"}, "dedup": "skip"}
+              ]
+            }
+
+            Each folder needs a "source". "rules" is a rules file (reloaded
+            when it changes) or a rules dict, and defaults to the default rules
+            file. "name" labels the folder in logs and metrics and defaults to
+            the base name of the source. The options of FOLDER_OPTIONS can be
+            set per folder or under "defaults", and are checked here.
+
+    Returns:
+        A dict with "workers", "debounce" and "folders", a list of dicts with
+        every option filled in and "~" expanded in paths.
+
+    Raises:
+        FileNotFoundError: If the config file does not exist.
+        json.JSONDecodeError: If the config file is not valid JSON.
+        ValueError: If the config is not valid.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict) or not isinstance(config.get("folders"), list):
+        raise ValueError(f"Config file '{path}' needs a 'folders' list.")
+    defaults = config.get("defaults", {})
+    if not isinstance(defaults, dict) or defaults.keys() - FOLDER_OPTIONS.keys():
+        raise ValueError(
+            f"'defaults' in '{path}' may only set: {', '.join(FOLDER_OPTIONS)}"
+        )
+    defaults = {**FOLDER_OPTIONS, **defaults}
+    folders, names = [], set()
+    for number, entry in enumerate(config["folders"], 1):
+        if not isinstance(entry, dict) or not entry.get("source"):
+            raise ValueError(f"Folder {number} in '{path}' has no 'source'.")
+        unknown = entry.keys() - FOLDER_OPTIONS.keys() - {"source", "rules", "name"}
+        if unknown:
+            raise ValueError(
+                f"Folder {number} in '{path}' has unknown options: "
+                f"{', '.join(sorted(unknown))}"
+            )
+        folder = {**defaults, **entry}
+        _check_folder_options(folder, f"Folder {number} in '{path}'")
+        folder["source"] = os.path.expanduser(folder["source"])
+        rules = folder.get("rules")
+        if isinstance(rules, str):
+            folder["rules"] = os.path.expanduser(rules)
+        folder["name"] = folder.get("name") or os.path.basename(
+            os.path.normpath(folder["source"])
+        )
+        if folder["name"] in names:
+            raise ValueError(
+                f"Folder name '{folder['name']}' is used twice in '{path}'; "
+                "set a distinct 'name'."
+            )
+        names.add(folder["name"])
+        folders.append(folder)
+    return {
+        "workers": int(config.get("workers", 1)),
+        "debounce": float(config.get("debounce", 0.2)),
+        "folders": folders,
+    }
+
+
+def activate_daemon(args):
+    """
+    Watches every folder listed in the config file `args.daemon`.
+
+    Args:
+        args: Parsed command line arguments; `daemon` is the config file (see
+              load_daemon_config), and logging, stats and metrics options apply
+              as for --watchdog.
+
+    All folders share one observer, one event queue with its pool of
+    `workers` threads, and the history store, so ten folders cost one process
+    instead of ten. Each folder has its own FileOrganizer, rules and options,
+    and its own metrics, exported with a `folder` label.
+
+    Unless `--watch-backend` says otherwise, folders are watched with inotify
+    where it is available: one descriptor and one reader thread for all of
+    them. watchdog's observer starts one emitter thread per folder, so with it
+    the thread count still grows with the number of folders.
+    """
+    if args.logfile:
+        log = get_logger(log_to_file=True, log_file=args.logfile)
+    else:
+        log = get_logger()
+    config = load_daemon_config(args.daemon)
+    # Queue-wide metrics (queue depth and latency) are exported without label
+    metrics = Metrics()
+    handler = MyHandler(
+        debounce=config["debounce"],
+        logger=log,
+        workers=config["workers"],
+        metrics=metrics,
+    )
+    for folder in config["folders"]:
+        rules, rules_path = folder["rules"], None
+        if rules is None:
+            rules_path = RULES_PATH
+            rules = load_rules()
+        elif isinstance(rules, str):
+            rules_path = rules
+            rules = load_rules(rules_path)
+        organizer = FileOrganizer(
+            folder["source"],
+            rules,
+            logger=log,
+            workers=folder["jobs"],
+            recursive=folder["recursive"],
+            max_depth=folder["max_depth"],
+            exclude=folder["exclude"],
+            dedup=folder["dedup"],
+            on_collision=folder["on_collision"],
+            sniff=folder["sniff"],
+            metrics=Metrics(labels={"folder": folder["name"]}),
+        )
+        handler.add_folder(organizer, rules_path, folder["name"])
+        log.info(f"Watching '{folder['source']}' as '{folder['name']}'")
+    group = MetricsGroup([metrics] + [f.organizer.metrics for f in handler.folders])
+    backend = getattr(args, "watch_backend", None) or "auto"
+    _run(handler, group, args, log, backend)
+
+
+def _run(handler, metrics, args, log, backend="watchdog"):
+    """
+    Watches the handler's folders with one observer until Ctrl+C.
+
+    Args:
+        backend: The event source (see _observer).
+
+    Keeps the metrics exported as asked by `args` and stops everything
+    cleanly on the way out.
+    """
+    observer = _observer(backend, log)
+    for folder in handler.folders:
+        if isinstance(observer, inotify.InotifyObserver):
+            # Only watch subfolders whose files the organizer would accept
+            observer.schedule(handler, folder.root, folder.organizer.recursive)
+        else:
+            observer.schedule(handler, folder.root, recursive=True)
+
+    metrics_file = getattr(args, "metrics_file", None)
+    metrics_port = getattr(args, "metrics_port", None)
+    server = None
+    if metrics_port is not None:
+        server = MetricsServer(metrics, metrics_port)
+        server.start()
+        log.info(f"Serving metrics at http://127.0.0.1:{server.port}/metrics")
+
+    handler.start()
     observer.start()
 
     try:
         log.info("Watching for changes. Press Ctrl+C to stop.")
+        last_write = 0.0
         while True:
+            if metrics_file and time.monotonic() - last_write >= METRICS_INTERVAL:
+                _write_metrics(metrics, metrics_file, log)
+                last_write = time.monotonic()
             time.sleep(1)
     except KeyboardInterrupt:
         log.info("Stopping observer...")
     finally:
         observer.stop()
         observer.join()
+        handler.stop()
+        if server is not None:
+            server.stop()
+        if metrics_file:
+            _write_metrics(metrics, metrics_file, log)
+        stats = handler.stats()
+        log.info(
+            f"Organized {stats['processed']} file event(s), "
+            f"average latency {stats['latency_avg']:.2f}s, "
+            f"max {stats['latency_max']:.2f}s"
+        )
+        if getattr(args, "stats", False):
+            print(metrics.summary())
+
+
+def _observer(backend, log):
+    """
+    Returns the observer for `backend`: "inotify", "watchdog" (the default),
+    or "auto" for inotify where it is available.
+    """
+    if backend in ("inotify", "auto"):
+        try:
+            return inotify.InotifyObserver(logger=log)
+        except OSError as e:
+            if backend == "inotify":
+                log.warning(f"inotify is not available, using watchdog: {e}")
+    return Observer()
+
+
+def _write_metrics(metrics, path, log):
+    try:
+        metrics.write_textfile(path)
+    except Exception as e:
+        log.error(f"Error writing metrics file '{path}': {e}")
@@ -1,8 +1,14 @@
-from .record import record_move, update, reset  # noqa: F401
-from .data import rules_func, history  # noqa: F401
-from .gui_utils import (
-    set_folder,  # noqa: F401
-    organize_action,  # noqa: F401
-    reset_action,  # noqa: F401
-    undo_action,  # noqa: F401
-)  # noqa: F401
+from .record import record_move, commit, update, discard, restore, reset  # noqa: F401
+from .data import rules_func, load_rules, history, last_batches  # noqa: F401
+from .matcher import RuleMatcher, compile_rules  # noqa: F401
+
+# The GUI helpers import tkinter, so they are only loaded on first access.
+_GUI_EXPORTS = ("set_folder", "organize_action", "reset_action", "undo_action")
+
+
+def __getattr__(name):
+    if name in _GUI_EXPORTS:
+        from . import gui_utils
+
+        return getattr(gui_utils, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
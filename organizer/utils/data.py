@@ -1,14 +1,25 @@
+import atexit
 import json
+import logging
+import os
+import threading
 from pathlib import Path
-from organizer.logger_code import get_logger
+from organizer.utils.journal import Journal
+from organizer.utils.rules_cache import RulesCache
 
 RULES_PATH = Path.home() / ".auto_file_organizer" / "rules.json"
 UNDO_PATH = Path.home() / ".auto_file_organizer" / "undo.json"
+JOURNAL_PATH = Path.home() / ".auto_file_organizer" / "undo.jsonl"
+HISTORY_DB_PATH = Path.home() / ".auto_file_organizer" / "history.sqlite3"
+HASH_CACHE_PATH = Path.home() / ".auto_file_organizer" / "hash_cache.json"
+RULES_CACHE_PATH = Path.home() / ".auto_file_organizer" / "rules_cache.pickle"
+SCAN_INDEX_DIR = Path.home() / ".auto_file_organizer" / "scan_index"
 
-UNDO_PATH.parent.mkdir(parents=True, exist_ok=True)
+HISTORY_BACKENDS = ("jsonl", "sqlite")
 
-
-log = get_logger()
+# Configured by get_logger when the application starts; importing this module
+# must not touch the disk or set up handlers.
+log = logging.getLogger("file_organizer")
 
 
 def rules_func():
@@ -58,32 +69,141 @@ def rules_func():
             ".rar": "Archives",
             ".7z": "Archives",
         }
+        RULES_PATH.parent.mkdir(parents=True, exist_ok=True)
         with open(RULES_PATH, "w") as w:
             json.dump(rules, w)
         log.info(f"Rules file not found, generated default rules at {RULES_PATH}")
     return rules
 
 
-def history(args=None):
+_rules_cache = RulesCache(RULES_CACHE_PATH, logger=log)
+
+
+def load_rules(path=None):
     """
-    Returns the stored history from the undo.json file.
+    Returns the compiled RuleMatcher for a rules file.
 
-    If the file does not exist, it creates a new empty file and returns an empty dict.
-    If args is provided, it attempts to open the file at the given path and returns the
-    loaded history.
+    Args:
+        path: Path of a JSON rules file. Defaults to
+            `~/.auto_file_organizer/rules.json`, which is generated with the
+            default rules (see rules_func) if it does not exist.
 
-    The history file is written to `~/.auto_file_organizer/undo.json`.
+    Matchers are cached by file path, mtime and size, in memory and in
+    `~/.auto_file_organizer/rules_cache.pickle`, so the file is only parsed and
+    compiled again after it changes. The same matcher object is returned while
+    the file is unchanged.
     """
-    if UNDO_PATH.exists() and not args:
-        with open(UNDO_PATH, "r") as w:
-            return json.load(w)
-    elif args:
-        with open(args, "r") as w:
-            return json.load(w)
-    else:
-        history = {}
-        with open(UNDO_PATH, "w") as w:
-            json.dump(history, w)
-        log.info(f"History file not found, Genarated file. Found at {UNDO_PATH}")
-        with open(UNDO_PATH, "r") as w:
+    if path is None:
+        if not RULES_PATH.exists():
+            rules_func()
+        path = RULES_PATH
+    return _rules_cache.load(path)
+
+
+_store = None
+_store_lock = threading.Lock()
+_backend = os.environ.get("AUTO_ORGANIZER_HISTORY", "jsonl")
+
+
+def set_history_backend(name):
+    """
+    Selects the history backend used by this process.
+
+    Args:
+        name: "jsonl" for the append-only journal (the default) or "sqlite" for
+            the indexed SQLite database. The AUTO_ORGANIZER_HISTORY environment
+            variable sets the default.
+
+    Must be called before the history store is first used.
+    """
+    global _backend
+    if name not in HISTORY_BACKENDS:
+        raise ValueError(f"Unknown history backend '{name}'")
+    with _store_lock:
+        if _store is not None and name != _backend:
+            raise RuntimeError("History store already opened")
+        _backend = name
+
+
+def get_store():
+    """
+    Returns the shared history store of the selected backend.
+
+    The store is opened once per process. The journal lives at
+    `~/.auto_file_organizer/undo.jsonl` and the SQLite database at
+    `~/.auto_file_organizer/history.sqlite3`. Existing history is carried over
+    when a store is created for the first time: a legacy `undo.json` is imported
+    into the journal (and renamed to `undo.json.migrated`), and the journal is
+    imported into a new SQLite database.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            journal_exists = JOURNAL_PATH.exists()
+            journal = Journal(JOURNAL_PATH, logger=log)
+            if UNDO_PATH.exists() and not journal_exists:
+                try:
+                    with open(UNDO_PATH, "r") as f:
+                        legacy = json.load(f)
+                    if isinstance(legacy, list):
+                        journal.update(legacy)
+                    UNDO_PATH.rename(UNDO_PATH.with_name("undo.json.migrated"))
+                    log.info(f"Migrated history from {UNDO_PATH} to {JOURNAL_PATH}")
+                except Exception as e:
+                    log.error(f"Error migrating history file '{UNDO_PATH}': {e}")
+            store = journal
+            if _backend == "sqlite":
+                from organizer.utils.history_db import SQLiteHistory
+
+                db_exists = HISTORY_DB_PATH.exists()
+                store = SQLiteHistory(HISTORY_DB_PATH, logger=log)
+                if not db_exists and JOURNAL_PATH.exists():
+                    store.update(journal.iter_entries())
+                    log.info(f"Imported history from {JOURNAL_PATH}")
+            atexit.register(store.close)
+            _store = store
+        return _store
+
+
+def use_history_store(store):
+    """
+    Replaces the history store of this process and returns the previous one.
+
+    Args:
+        store: A Journal or SQLiteHistory to record moves to, or None to open
+            the default store again on next use.
+
+    The benchmarks use this to keep their synthetic moves out of the real
+    history. The caller remains responsible for closing both stores.
+    """
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    return previous
+
+
+def history(args=None):
+    """
+    Returns the stored history as a list of moves.
+
+    By default the history is read from the selected history store (see
+    get_store). If args is provided, it is treated as the
+    path of a history file to load instead: either a `.jsonl` journal or a JSON
+    list in the legacy `undo.json` format.
+    """
+    if args and isinstance(args, (str, Path)):
+        path = Path(args)
+        if path.suffix == ".jsonl":
+            return Journal(path, logger=log).entries()
+        with open(path, "r") as w:
             return json.load(w)
+    return get_store().entries()
+
+
+def last_batches(count=1):
+    """
+    Returns the `count` most recent organize batches from the history store.
+
+    Each batch is a (batch id, moves) pair; the newest batch comes first.
+    """
+    return get_store().last_batches(count)
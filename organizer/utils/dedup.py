@@ -0,0 +1,251 @@
+import hashlib
+import json
+import mmap
+import os
+import logging
+
+DEDUP_POLICIES = ("skip", "hardlink", "remove")
+BLOCK_SIZE = 16 * 1024  # Bytes read from each end of a file for the partial hash
+POOL_MIN_BYTES = 8 * 1024 * 1024  # Smaller workloads are hashed in-process
+CACHE_LIMIT = 100_000  # Hashes kept in the persistent cache
+
+
+def partial_hash(path, size):
+    """
+    Returns a blake2b digest of the first and last BLOCK_SIZE bytes of a file.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        h.update(_pread(fd, min(size, BLOCK_SIZE), 0))
+        if size > BLOCK_SIZE:
+            h.update(_pread(fd, BLOCK_SIZE, max(BLOCK_SIZE, size - BLOCK_SIZE)))
+    finally:
+        os.close(fd)
+    return h.hexdigest()
+
+
+def _pread(fd, count, offset):
+    if hasattr(os, "pread"):
+        return os.pread(fd, count, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, count)
+
+
+def full_hash(path):
+    """
+    Returns a blake2b digest of a whole file, read through mmap.
+    """
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+    return h.hexdigest()
+
+
+class HashCache:
+    """
+    Partial and full file hashes keyed by (device, inode, size, mtime).
+
+    A rename keeps the inode and mtime, so hashes stay valid after a file is
+    moved. The cache can be persisted as JSON between runs.
+    """
+
+    def __init__(self, path=None, logger=None):
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self._data = {}
+        self._dirty = False
+        if path is not None and path.exists():
+            try:
+                with open(path, "r") as f:
+                    self._data = json.load(f)
+            except Exception as e:
+                self.logger.warning(f"Ignoring unreadable hash cache '{path}': {e}")
+
+    @staticmethod
+    def key(kind, st):
+        return f"{kind}:{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+    def get(self, kind, st):
+        return self._data.get(self.key(kind, st))
+
+    def put(self, kind, st, digest):
+        self._data[self.key(kind, st)] = digest
+        self._dirty = True
+
+    def save(self):
+        """Writes the cache back to disk, keeping the newest CACHE_LIMIT hashes."""
+        if self.path is None or not self._dirty:
+            return
+        if len(self._data) > CACHE_LIMIT:
+            self._data = dict(list(self._data.items())[-CACHE_LIMIT:])
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump(self._data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except Exception as e:
+            self.logger.error(f"Error writing hash cache '{self.path}': {e}")
+
+
+class Deduplicator:
+    """
+    Finds planned moves whose file already exists in the destination folder.
+
+    Candidates are compared with the files already in their destination folder
+    and with each other, in three tiers so that most files are never read in
+    full: files are first grouped by size, then by a partial hash of their first
+    and last blocks, and only files that still collide get a full blake2b hash.
+    Full hashes are computed in a process pool when there is enough data to
+    make it worthwhile. All hashes are cached by (inode, size, mtime).
+    """
+
+    def __init__(self, policy, cache=None, processes=None, logger=None):
+        """
+        Initializes a new deduplicator.
+
+        Args:
+            policy: What to do with a duplicate: "skip" leaves it in place,
+                "hardlink" replaces the move with a hard link to the existing
+                copy, "remove" deletes it.
+            cache: A HashCache to use; a new in-memory cache by default.
+            processes: Size of the process pool for full hashes.
+            logger: The logger to use for logging events.
+        """
+        if policy not in DEDUP_POLICIES:
+            raise ValueError(f"Unknown dedup policy '{policy}'")
+        self.policy = policy
+        self.cache = cache or HashCache()
+        self.processes = processes
+        self.logger = logger or logging.getLogger(__name__)
+        self._pool = None
+        self._dest_index = {}  # dest dir -> {size: [path, ...]}
+
+    def close(self):
+        """Shuts down the process pool and saves the hash cache."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.cache.save()
+
+    def _index(self, folder):
+        """Returns (and caches for the run) the files in `folder` grouped by size."""
+        index = self._dest_index.get(folder)
+        if index is None:
+            index = {}
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_file():
+                                size = entry.stat().st_size
+                                index.setdefault(size, []).append(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                pass
+            self._dest_index[folder] = index
+        return index
+
+    def find(self, moves):
+        """
+        Returns {source: existing copy} for the planned moves that are duplicates.
+
+        Args:
+            moves: Planned (source, destination) pairs.
+
+        The destinations of the non-duplicate moves are remembered, so later
+        chunks of the same run are compared with them as well.
+        """
+        stats = {}
+        groups = {}  # (dest dir, size) -> [path, ...], existing files first
+        for src, dest in moves:
+            try:
+                st = os.stat(src)
+            except OSError:
+                continue
+            stats[str(src)] = st
+            folder = str(dest.parent)
+            key = (folder, st.st_size)
+            if key not in groups:
+                groups[key] = list(self._index(folder).get(st.st_size, []))
+            groups[key].append(str(src))
+
+        partial_groups = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            by_partial = {}
+            for path in members:
+                digest = self._hash("p", path, stats)
+                if digest is not None:
+                    by_partial.setdefault(digest, []).append(path)
+            partial_groups.extend(g for g in by_partial.values() if len(g) > 1)
+
+        self._full_hashes([p for g in partial_groups for p in g], stats)
+        duplicates = {}
+        for members in partial_groups:
+            first_by_hash = {}
+            for path in members:
+                digest = self._hash("f", path, stats)
+                if digest is None:
+                    continue
+                original = first_by_hash.setdefault(digest, path)
+                if original != path and path in stats:
+                    duplicates[path] = original
+
+        for src, dest in moves:
+            st = stats.get(str(src))
+            if st is not None and str(src) not in duplicates:
+                index = self._index(str(dest.parent))
+                index.setdefault(st.st_size, []).append(str(dest))
+        return duplicates
+
+    def _stat(self, path, stats):
+        st = stats.get(path)
+        if st is None:
+            st = stats[path] = os.stat(path)
+        return st
+
+    def _hash(self, kind, path, stats):
+        try:
+            st = self._stat(path, stats)
+            digest = self.cache.get(kind, st)
+            if digest is None:
+                if kind == "p":
+                    digest = partial_hash(path, st.st_size)
+                else:
+                    digest = full_hash(path)
+                self.cache.put(kind, st, digest)
+            return digest
+        except OSError as e:
+            self.logger.warning(f"Cannot hash '{path}': {e}")
+            return None
+
+    def _full_hashes(self, paths, stats):
+        """Fills the cache with the full hashes of `paths`, in parallel if worthwhile."""
+        todo = []
+        for path in dict.fromkeys(paths):
+            try:
+                if self.cache.get("f", self._stat(path, stats)) is None:
+                    todo.append(path)
+            except OSError:
+                continue
+        total = sum(stats[p].st_size for p in todo)
+        if len(todo) < 2 or total < POOL_MIN_BYTES:
+            return
+        if self._pool is None:
+            # Imported here: loading multiprocessing is slow and rarely needed
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        futures = {path: self._pool.submit(full_hash, path) for path in todo}
+        for path, future in futures.items():
+            try:
+                self.cache.put("f", stats[path], future.result())
+            except Exception as e:
+                self.logger.warning(f"Cannot hash '{path}': {e}")
@@ -0,0 +1,169 @@
+import heapq
+import threading
+import time
+import logging
+
+
+class CoalescingQueue:
+    """
+    A deduplicating queue of paths with per-path debouncing.
+
+    Every `put` of a path pushes its deadline `debounce` seconds into the future,
+    so a burst of events for the same file collapses into one entry that becomes
+    ready once the file has been quiet for `debounce` seconds (trailing edge).
+    Nothing is dropped: every path that was put is eventually handed out.
+    """
+
+    def __init__(self, debounce=0.5, max_batch=256, metrics=None):
+        """
+        Initializes a new queue.
+
+        Args:
+            debounce: Seconds a path must be quiet before it is handed out.
+            max_batch: Maximum number of paths returned by one `get_batch` call.
+            metrics: Optional Metrics object; the time paths wait in the queue
+                ("queue_wait") and the end-to-end latency ("event_latency")
+                are recorded in it.
+        """
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self.metrics = metrics
+        self._cond = threading.Condition()
+        self._deadline = {}  # path -> time the path becomes ready
+        self._first_seen = {}  # path -> time of the first event since handed out
+        self._heap = []  # (deadline, path); stale entries are skipped lazily
+        self._closed = False
+
+        self.processed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def put(self, path):
+        """
+        Adds a path, or postpones it if it is already queued.
+
+        Args:
+            path: The path an event was received for.
+        """
+        now = time.monotonic()
+        with self._cond:
+            deadline = now + self.debounce
+            self._deadline[path] = deadline
+            self._first_seen.setdefault(path, now)
+            heapq.heappush(self._heap, (deadline, path))
+            self._cond.notify()
+
+    def get_batch(self):
+        """
+        Blocks until at least one path is ready and returns the ready paths.
+
+        Returns an empty list once the queue has been closed and drained. On
+        close, paths still waiting for their deadline are flushed immediately.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                batch = []
+                while self._heap and len(batch) < self.max_batch:
+                    deadline, path = self._heap[0]
+                    if self._deadline.get(path) != deadline:
+                        heapq.heappop(self._heap)  # Superseded by a later event
+                        continue
+                    if deadline > now and not self._closed:
+                        break
+                    heapq.heappop(self._heap)
+                    del self._deadline[path]
+                    batch.append(path)
+                    if self.metrics is not None:
+                        self.metrics.observe(
+                            "queue_wait", now - self._first_seen.get(path, now)
+                        )
+                if batch or self._closed:
+                    return batch
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+
+    def task_done(self, paths):
+        """
+        Records that `paths` were processed, for the latency statistics.
+        """
+        now = time.monotonic()
+        with self._cond:
+            for path in paths:
+                if path in self._deadline:
+                    continue  # A new event arrived meanwhile; still pending
+                first = self._first_seen.pop(path, now)
+                latency = now - first
+                self.processed += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                if self.metrics is not None:
+                    self.metrics.observe("event_latency", latency)
+
+    def close(self):
+        """
+        Wakes up the consumer and makes it flush the remaining paths.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._deadline)
+
+    def stats(self):
+        """
+        Returns the queue depth and processing latency (seconds from the first
+        event for a path until the path was processed).
+        """
+        with self._cond:
+            return {
+                "depth": len(self._deadline),
+                "processed": self.processed,
+                "latency_avg": self.latency_total / self.processed
+                if self.processed
+                else 0.0,
+                "latency_max": self.latency_max,
+            }
+
+
+class EventWorker(threading.Thread):
+    """
+    A thread that feeds batches of ready paths from a CoalescingQueue to a callback.
+
+    Keeps organizing off the observer thread, so event delivery never waits for
+    file moves.
+    """
+
+    def __init__(self, queue, callback, logger=None):
+        """
+        Initializes a new worker.
+
+        Args:
+            queue: The CoalescingQueue to consume.
+            callback: Called with each batch (a list of paths).
+            logger: The logger to use for logging events.
+        """
+        super().__init__(name="organizer-worker", daemon=True)
+        self.queue = queue
+        self.callback = callback
+        self.logger = logger or logging.getLogger(__name__)
+
+    def run(self):
+        while True:
+            batch = self.queue.get_batch()
+            if not batch:
+                return
+            try:
+                self.callback(batch)
+            except Exception as e:
+                self.logger.error(f"Error organizing {len(batch)} file(s): {e}")
+            self.queue.task_done(batch)
+
+    def stop(self, timeout=None):
+        """
+        Flushes the remaining paths and waits for the worker to finish.
+        """
+        self.queue.close()
+        self.join(timeout)
@@ -1,6 +1,6 @@
 import tkinter as tk
-import json
 from organizer.utils.logger_setup import setup
+from organizer.utils.profiling import profile
 
 organizer_instance = {"obj": None}
 
@@ -63,7 +63,9 @@ def organize_action(txt_box, args):
     org = organizer_instance["obj"]
     if org:
         try:
-            org.organize()
+            # With --gui --profile cpu|mem, the summary goes to the log
+            with profile(args.profile, logger=log):
+                org.organize()
             txt_box.delete(1.0, "end")
             txt_box.insert(tk.END, "Organized successfully.")
             log.info("Organized successfully.")
@@ -79,9 +81,9 @@ def organize_action(txt_box, args):
 
 def undo_action(txt_box, args):
     """
-    Undoes the last organization action.
+    Undoes the last organization run.
 
-    The function attempts to undo the last organization action using the FileOrganizer
+    The function attempts to undo the last organization run using the FileOrganizer
     instance stored in the organizer_instance dictionary. If the undo is successful,
     the function displays a success message in the text box and logs the event. If the
     undo is not successful or an error occurs, the function displays an appropriate
@@ -99,9 +101,8 @@ def undo_action(txt_box, args):
     org = organizer_instance["obj"]
     if org:
         try:
-            with open("undo.json", "r") as w:
-                org.history = json.load(w)
-            org.undo()
+            with profile(args.profile, logger=log):
+                org.undo()
             txt_box.delete(1.0, "end")
             txt_box.insert(tk.END, "Undo successful.")
             log.info("Undo successful.")
@@ -0,0 +1,266 @@
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from organizer.utils.journal import batch_key, _timestamp
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS moves (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    original_path TEXT NOT NULL,
+    new_path TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    batch TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS moves_original_path ON moves (original_path);
+CREATE INDEX IF NOT EXISTS moves_new_path ON moves (new_path);
+CREATE INDEX IF NOT EXISTS moves_timestamp ON moves (timestamp);
+CREATE INDEX IF NOT EXISTS moves_batch ON moves (batch, id);
+"""
+
+_COLUMNS = "original_path, new_path, timestamp, batch"
+
+
+class SQLiteHistory:
+    """
+    An SQLite-backed undo history.
+
+    This is an optional alternative to the JSON Lines journal with the same
+    interface (append, commit, update, discard_batches, last_batches, entries,
+    clear, close). The database runs in WAL mode and indexes original_path,
+    new_path, timestamp and batch, so lookups by path or time range are index
+    scans and nothing needs to hold the whole history in memory.
+    """
+
+    def __init__(self, path, commit_interval=1.0, max_pending=1000, logger=None):
+        """
+        Opens (and if needed creates) the history database.
+
+        Args:
+            path: Path of the SQLite database file.
+            commit_interval: Maximum number of seconds a move stays buffered.
+            max_pending: Number of buffered moves that forces a commit.
+            logger: The logger to use for logging events.
+        """
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.RLock()
+        self._pending = []
+        self._timer = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(_SCHEMA)
+
+    @staticmethod
+    def _row(entry):
+        return (
+            str(entry.get("original_path")),
+            str(entry.get("new_path")),
+            entry.get("timestamp") or _timestamp(datetime.now()),
+            batch_key(entry),
+        )
+
+    @staticmethod
+    def _entry(row):
+        entry = {
+            "original_path": row["original_path"],
+            "new_path": row["new_path"],
+            "timestamp": row["timestamp"],
+        }
+        if row["batch"] != row["new_path"]:
+            entry["batch"] = row["batch"]
+        return entry
+
+    # -- writing -----------------------------------------------------------
+
+    def append(self, entry):
+        """
+        Buffers an entry and commits the group once it is large or old enough.
+
+        Args:
+            entry: A dict describing one move.
+        """
+        with self._lock:
+            self._pending.append(self._row(entry))
+            if len(self._pending) >= self.max_pending:
+                self.commit()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.commit_interval, self.commit)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def commit(self):
+        """
+        Inserts all buffered entries in a single transaction.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            try:
+                with self._db:
+                    self._db.executemany(
+                        f"INSERT INTO moves ({_COLUMNS}) VALUES (?, ?, ?, ?)", rows
+                    )
+            except Exception as e:
+                self.logger.error(f"Error writing to history database '{self.path}': {e}")
+
+    def update(self, entries):
+        """
+        Makes `entries` the new history, replacing the stored moves.
+
+        Args:
+            entries: The complete list of history entries to keep.
+        """
+        with self._lock:
+            self._pending = []
+            with self._db:
+                self._db.execute("DELETE FROM moves")
+                self._db.executemany(
+                    f"INSERT INTO moves ({_COLUMNS}) VALUES (?, ?, ?, ?)",
+                    (self._row(entry) for entry in entries),
+                )
+
+    def discard_batches(self, batches, count=None):
+        """
+        Removes whole batches from the history in one transaction.
+
+        Args:
+            batches: The ids of the batches to remove.
+            count: Unused; accepted for interface compatibility with Journal.
+        """
+        batches = list(batches)
+        if not batches:
+            return
+        with self._lock:
+            self.commit()
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM moves WHERE batch = ?", ((b,) for b in batches)
+                )
+
+    def clear(self):
+        """
+        Deletes all moves.
+        """
+        self.update([])
+
+    def close(self):
+        """
+        Commits pending entries and closes the database.
+        """
+        with self._lock:
+            self.commit()
+            self._db.close()
+
+    # -- reading -----------------------------------------------------------
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            self.commit()
+            return [self._entry(row) for row in self._db.execute(sql, params)]
+
+    def iter_entries(self, chunk_size=1000):
+        """
+        Yields all moves in recording order, fetching `chunk_size` rows at a time.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                self.commit()
+                rows = self._db.execute(
+                    f"SELECT id, {_COLUMNS} FROM moves WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, chunk_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._entry(row)
+            last_id = rows[-1]["id"]
+
+    def entries(self):
+        """
+        Returns the whole history as a list of dicts.
+        """
+        return list(self.iter_entries())
+
+    def __len__(self):
+        with self._lock:
+            self.commit()
+            return self._db.execute("SELECT COUNT(*) FROM moves").fetchone()[0]
+
+    def last_batches(self, count=1):
+        """
+        Returns the `count` most recent batches, newest first.
+
+        Each batch is returned as a (batch id, entries) pair with the entries in
+        the order they were recorded.
+
+        Raises:
+            ValueError: If `count` is less than 1.
+        """
+        if count < 1:
+            raise ValueError(f"Number of batches must be at least 1, got {count}")
+        keys = []
+        with self._lock:
+            self.commit()
+            # Walk back from the newest row; usually only the last batch is read.
+            for row in self._db.execute("SELECT batch FROM moves ORDER BY id DESC"):
+                if row["batch"] not in keys:
+                    if len(keys) == count:
+                        break
+                    keys.append(row["batch"])
+        return [
+            (
+                key,
+                self._query(
+                    f"SELECT {_COLUMNS} FROM moves WHERE batch = ? ORDER BY id", (key,)
+                ),
+            )
+            for key in keys
+        ]
+
+    def where_is(self, original_path):
+        """
+        Returns the most recent move of the file that was at `original_path`.
+
+        Returns None if the history has no move from that path.
+        """
+        found = self._query(
+            f"SELECT {_COLUMNS} FROM moves WHERE original_path = ? "
+            "ORDER BY id DESC LIMIT 1",
+            (str(original_path),),
+        )
+        return found[0] if found else None
+
+    def came_from(self, new_path):
+        """
+        Returns the most recent move that put a file at `new_path`, or None.
+        """
+        found = self._query(
+            f"SELECT {_COLUMNS} FROM moves WHERE new_path = ? ORDER BY id DESC LIMIT 1",
+            (str(new_path),),
+        )
+        return found[0] if found else None
+
+    def moves_between(self, start, end):
+        """
+        Returns the moves recorded between `start` and `end`, inclusive.
+
+        Args:
+            start: A datetime or a "%Y-%m-%d %H:%M:%S" timestamp string.
+            end: A datetime or a "%Y-%m-%d %H:%M:%S" timestamp string.
+        """
+        return self._query(
+            f"SELECT {_COLUMNS} FROM moves WHERE timestamp BETWEEN ? AND ? ORDER BY id",
+            (_timestamp(start), _timestamp(end)),
+        )
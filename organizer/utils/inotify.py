@@ -0,0 +1,205 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+# Event bits from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+
+# Only events that mean "a complete file is now at this path", plus what is
+# needed to follow new subfolders in recursive mode
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+BUFFER_SIZE = 1 << 20  # Bytes read per call; holds thousands of events
+_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _libc():
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    for name in ("inotify_init1", "inotify_add_watch"):
+        if not hasattr(libc, name):
+            raise OSError(errno.ENOSYS, f"libc has no {name}")
+    libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+    return libc
+
+
+def available():
+    """Returns True if the inotify backend can be used on this system."""
+    try:
+        _libc()
+        return True
+    except OSError:
+        return False
+
+
+def parse_events(data):
+    """
+    Yields (wd, mask, cookie, name) for each event in a buffer read from an
+    inotify file descriptor. `name` is bytes, empty for events on the watched
+    folder itself.
+    """
+    offset, end = 0, len(data)
+    while offset + _HEADER.size <= end:
+        wd, mask, cookie, length = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        name = data[offset : offset + length].rstrip(b"\0")
+        offset += length
+        yield wd, mask, cookie, name
+
+
+class InotifyObserver:
+    """
+    Watches folders with Linux inotify from a single reader thread.
+
+    A drop-in for watchdog's Observer (`schedule`, `start`, `stop`, `join`)
+    that only subscribes to IN_CLOSE_WRITE and IN_MOVED_TO: a file is reported
+    once, when the writer closes it or when it is renamed into place (how
+    browsers finish downloads), instead of once per written chunk. Complete
+    files are passed to the handler's `on_file_complete(path)`.
+
+    In recursive mode new subfolders are watched as they appear; files that
+    were already in them are passed to `on_file_found(path)`, since they may
+    still be written. If the kernel queue overflows, `on_overflow()` is called
+    so the handler can rescan.
+
+    All folders share one inotify descriptor and one thread, however many are
+    scheduled.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE, logger=None):
+        """
+        Initializes a new observer.
+
+        Args:
+            buffer_size: Bytes read from the inotify descriptor per call.
+            logger: The logger to use for logging events.
+
+        Raises:
+            OSError: If inotify is not available.
+        """
+        self._libc = _libc()
+        self.buffer_size = buffer_size
+        self.logger = logger or logging.getLogger(__name__)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            self._raise("inotify_init1")
+        self._wake_r, self._wake_w = os.pipe()
+        self._lock = threading.Lock()
+        self._watches = {}  # wd -> (folder, handler, recursive)
+        self._thread = threading.Thread(
+            target=self._run, name="inotify-reader", daemon=True
+        )
+
+    def _raise(self, call, path=None):
+        code = ctypes.get_errno()
+        raise OSError(code, f"{call}: {os.strerror(code)}", path)
+
+    def schedule(self, handler, path, recursive=False):
+        """
+        Watches the folder at `path` (and its subfolders if `recursive`).
+
+        Args:
+            handler: Object with on_file_complete, on_file_found and
+                on_overflow methods, such as MyHandler.
+            path: The folder to watch.
+            recursive: Also watch every subfolder, including new ones.
+        """
+        path = os.path.abspath(path)
+        self._add_watch(path, handler, recursive)
+        if recursive:
+            for folder, dirs, _ in os.walk(path):
+                for name in dirs:
+                    self._add_watch(os.path.join(folder, name), handler, recursive)
+
+    def _add_watch(self, path, handler, recursive):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            if ctypes.get_errno() in (errno.ENOENT, errno.ENOTDIR):
+                return  # Removed before we got to it
+            self._raise("inotify_add_watch", path)
+        with self._lock:
+            self._watches[wd] = (path, handler, recursive)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._watches)
+
+    def start(self):
+        """Starts the reader thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Asks the reader thread to stop; call `join` to wait for it."""
+        os.write(self._wake_w, b"x")
+
+    def join(self, timeout=None):
+        """Waits for the reader thread and closes the descriptors."""
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        if self._thread.is_alive():
+            return
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _run(self):
+        while True:
+            ready, _, _ = select.select([self._fd, self._wake_r], [], [])
+            if self._wake_r in ready:
+                return
+            try:
+                data = os.read(self._fd, self.buffer_size)
+            except BlockingIOError:
+                continue
+            for wd, mask, _, name in parse_events(data):
+                try:
+                    self._dispatch(wd, mask, name)
+                except Exception as e:
+                    self.logger.error(f"Error handling inotify event: {e}")
+
+    def _dispatch(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            self.logger.warning("inotify queue overflowed; events were lost")
+            with self._lock:
+                handlers = {id(h): h for _, h, _ in self._watches.values()}
+            for handler in handlers.values():
+                handler.on_overflow()
+            return
+        with self._lock:
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                return
+            watch = self._watches.get(wd)
+        if watch is None or not name:
+            return
+        folder, handler, recursive = watch
+        path = os.path.join(folder, os.fsdecode(name))
+        if mask & IN_ISDIR:
+            if recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_new_folder(path, handler)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            handler.on_file_complete(path)
+
+    def _watch_new_folder(self, path, handler):
+        # Watch first, then list, so no file slips between the two
+        self.schedule(handler, path, recursive=True)
+        for folder, _, files in os.walk(path):
+            for name in files:
+                handler.on_file_found(os.path.join(folder, name))
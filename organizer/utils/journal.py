@@ -0,0 +1,387 @@
+import json
+import os
+import threading
+import logging
+from datetime import datetime
+
+
+def _timestamp(value):
+    """Formats a datetime like the timestamps stored by record_move."""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return str(value)
+
+
+def batch_key(entry):
+    """
+    Returns the id of the batch an entry belongs to.
+
+    Entries written before batches were introduced have no batch id; each of
+    them is treated as a batch of its own, identified by its new path.
+    """
+    return entry.get("batch") or entry.get("new_path")
+
+
+class Journal:
+    """
+    An append-only JSON Lines journal holding the undo history.
+
+    Every move is one compact JSON object on its own line. Moves are buffered in
+    memory and written with a single flush and fsync per group commit, which
+    happens when `commit()` is called (once per organize batch), when
+    `max_pending` moves are waiting, or `commit_interval` seconds after the first
+    pending move, whichever comes first.
+
+    Shrinking the history does not rewrite the file either: a control record
+    such as {"op": "truncate", "length": 10} or {"op": "undo", "batches": [...]}
+    is appended and applied when the journal is replayed. Once control records
+    and the entries they discard outweigh the live history, the file is
+    compacted in a background thread.
+    """
+
+    def __init__(
+        self,
+        path,
+        commit_interval=1.0,
+        max_pending=1000,
+        compact_threshold=1000,
+        logger=None,
+    ):
+        """
+        Initializes a new journal.
+
+        Args:
+            path: Path of the .jsonl journal file.
+            commit_interval: Maximum number of seconds a move stays buffered.
+            max_pending: Number of buffered moves that forces a commit.
+            compact_threshold: Minimum number of dead lines before compacting.
+            logger: The logger to use for logging events.
+        """
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        self.compact_threshold = compact_threshold
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.RLock()
+        self._pending = []
+        self._timer = None
+        self._fh = None
+        self._live = None  # Number of live entries, known after a replay
+        self._dead = 0  # Lines that a compaction would drop
+        self._compactor = None
+        self._compact_lock = threading.Lock()
+
+    # -- writing -----------------------------------------------------------
+
+    def append(self, entry):
+        """
+        Buffers an entry and commits the group once it is large or old enough.
+
+        Args:
+            entry: A JSON-serializable dict describing one move.
+        """
+        with self._lock:
+            self._pending.append(json.dumps(entry, separators=(",", ":")))
+            if self._live is not None:
+                self._live += 1
+            if len(self._pending) >= self.max_pending:
+                self.commit()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.commit_interval, self.commit)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def commit(self):
+        """
+        Writes all buffered entries with a single write, flush and fsync.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            lines = "\n".join(self._pending) + "\n"
+            self._pending = []
+            try:
+                if self._fh is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    self._fh = open(self.path, "a", encoding="utf-8")
+                self._fh.write(lines)
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+            except Exception as e:
+                self.logger.error(f"Error writing to undo journal '{self.path}': {e}")
+
+    def update(self, entries):
+        """
+        Makes `entries` the new history.
+
+        Args:
+            entries: The complete list of history entries to keep.
+
+        When `entries` is a prefix of the current history (the usual case after
+        an undo) a single truncate record is appended. Otherwise the journal is
+        rewritten atomically.
+        """
+        entries = list(entries)
+        with self._lock:
+            current = self.entries()
+            if len(entries) <= len(current) and current[: len(entries)] == entries:
+                if len(entries) < len(current):
+                    self._append_control({"op": "truncate", "length": len(entries)})
+                    self._dead += len(current) - len(entries) + 1
+                    self._live = len(entries)
+                    self._maybe_compact()
+                return
+            self._rewrite(entries)
+
+    def discard_batches(self, batches, count=None):
+        """
+        Removes whole batches from the history with a single control record.
+
+        Args:
+            batches: The ids of the batches to remove (see `batch_key`).
+            count: The number of entries in those batches, if known. It only
+                feeds the compaction heuristic.
+        """
+        batches = list(batches)
+        if not batches:
+            return
+        with self._lock:
+            self._append_control({"op": "undo", "batches": batches})
+            if count is None:
+                self._live = None
+            elif self._live is not None:
+                self._live = max(0, self._live - count)
+            self._dead += (count or 0) + 1
+            self._maybe_compact()
+
+    def clear(self):
+        """
+        Empties the journal.
+        """
+        with self._lock:
+            self._pending = []
+            self._rewrite([])
+
+    def _append_control(self, record):
+        """Appends a control record and commits it immediately."""
+        self._pending.append(json.dumps(record, separators=(",", ":")))
+        self.commit()
+
+    def _rewrite(self, entries):
+        """Atomically replaces the journal file with `entries`."""
+        self.commit()
+        self._close()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._live = len(entries)
+        self._dead = 0
+
+    def _close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def close(self):
+        """
+        Commits pending entries, waits for a running compaction and closes the file.
+        """
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self.commit()
+            self._close()
+
+    # -- reading -----------------------------------------------------------
+
+    def entries(self):
+        """
+        Replays the journal and returns the live history as a list of dicts.
+        """
+        with self._lock:
+            self.commit()
+            entries, dead = self._replay()
+            self._live = len(entries)
+            self._dead = dead
+            return entries
+
+    def last_batches(self, count=1):
+        """
+        Returns the `count` most recent batches, newest first.
+
+        Each batch is returned as a (batch id, entries) pair with the entries in
+        the order they were recorded.
+
+        Raises:
+            ValueError: If `count` is less than 1.
+        """
+        if count < 1:
+            raise ValueError(f"Number of batches must be at least 1, got {count}")
+        entries = self.entries()
+        keys = []
+        for entry in reversed(entries):
+            key = batch_key(entry)
+            if key not in keys:
+                if len(keys) == count:
+                    break
+                keys.append(key)
+        groups = {key: [] for key in keys}
+        for entry in entries:
+            group = groups.get(batch_key(entry))
+            if group is not None:
+                group.append(entry)
+        return list(groups.items())
+
+    def iter_entries(self):
+        """
+        Yields the live history entries in recording order.
+        """
+        yield from self.entries()
+
+    def where_is(self, original_path):
+        """
+        Returns the most recent move of the file that was at `original_path`.
+
+        Returns None if the history has no move from that path.
+        """
+        original_path = str(original_path)
+        for entry in reversed(self.entries()):
+            if entry.get("original_path") == original_path:
+                return entry
+        return None
+
+    def came_from(self, new_path):
+        """
+        Returns the most recent move that put a file at `new_path`, or None.
+        """
+        new_path = str(new_path)
+        for entry in reversed(self.entries()):
+            if entry.get("new_path") == new_path:
+                return entry
+        return None
+
+    def moves_between(self, start, end):
+        """
+        Returns the moves recorded between `start` and `end`, inclusive.
+
+        Args:
+            start: A datetime or a "%Y-%m-%d %H:%M:%S" timestamp string.
+            end: A datetime or a "%Y-%m-%d %H:%M:%S" timestamp string.
+        """
+        start, end = _timestamp(start), _timestamp(end)
+        return [e for e in self.entries() if start <= e.get("timestamp", "") <= end]
+
+    def _replay(self, end=None):
+        """
+        Replays the journal up to byte offset `end` (or to its end).
+
+        Returns the live entries and the number of dead lines seen. A torn last
+        line left behind by a crash is skipped with a warning.
+        """
+        entries = []
+        dead = 0
+        if not self.path.exists():
+            return entries, dead
+        consumed = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                consumed += len(line)
+                if end is not None and consumed > end:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.logger.warning(
+                        f"Skipping corrupt line in undo journal '{self.path}'"
+                    )
+                    dead += 1
+                    continue
+                op = record.get("op") if isinstance(record, dict) else None
+                if op is None:
+                    entries.append(record)
+                elif op == "truncate":
+                    length = record.get("length", 0)
+                    dead += max(0, len(entries) - length) + 1
+                    del entries[length:]
+                elif op == "undo":
+                    undone = set(record.get("batches", []))
+                    kept = [e for e in entries if batch_key(e) not in undone]
+                    dead += len(entries) - len(kept) + 1
+                    entries = kept
+                else:
+                    dead += 1
+        return entries, dead
+
+    def __len__(self):
+        with self._lock:
+            if self._live is None:
+                self.entries()
+            return self._live
+
+    # -- compaction --------------------------------------------------------
+
+    def _maybe_compact(self):
+        """Starts a background compaction when dead lines outweigh live ones."""
+        if self._dead < self.compact_threshold or self._dead <= (self._live or 0):
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(
+            target=self.compact, name="undo-journal-compactor", daemon=True
+        )
+        self._compactor.start()
+
+    def compact(self):
+        """
+        Rewrites the journal without dead lines.
+
+        The bulk of the file is replayed and written to a temporary file without
+        holding the lock, so moves can keep being appended meanwhile. Lines
+        appended during that time are copied over under the lock before the
+        temporary file atomically replaces the journal.
+        """
+        with self._compact_lock:
+            try:
+                with self._lock:
+                    self.commit()
+                    if not self.path.exists():
+                        return
+                    stat = self.path.stat()
+                    snapshot = stat.st_size
+                entries, _ = self._replay(end=snapshot)
+                tmp = self.path.with_name(self.path.name + ".compact")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                    with self._lock:
+                        self.commit()
+                        if self.path.stat().st_ino != stat.st_ino:
+                            # Rewritten while we were compacting; nothing to do.
+                            f.close()
+                            os.remove(tmp)
+                            return
+                        with open(self.path, "rb") as src:
+                            src.seek(snapshot)
+                            tail = src.read()
+                        f.write(tail.decode("utf-8"))
+                        f.flush()
+                        os.fsync(f.fileno())
+                        self._close()
+                        os.replace(tmp, self.path)
+                        self._live = None
+                        self._dead = 0
+                self.logger.debug(f"Compacted undo journal '{self.path}'")
+            except Exception as e:
+                self.logger.error(f"Error compacting undo journal '{self.path}': {e}")
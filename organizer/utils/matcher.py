@@ -0,0 +1,109 @@
+# Trie key holding the destination stored at a node. Extension parts are always
+# strings, so None cannot collide with them, and unlike a sentinel object it
+# survives pickling (compiled matchers are cached on disk).
+_DEST = None
+
+
+class RuleMatcher:
+    """
+    A compiled, reusable matcher for extension rules.
+
+    The rules dict (e.g. {".jpg": "Images", ".tar.gz": "Archives"}) is compiled
+    once into a suffix trie. Each level of the trie is a plain dict keyed by a
+    lower-cased extension part, read from the end of the file name, so matching a
+    file costs one hash lookup per extension part instead of one comparison per
+    rule. The deepest node carrying a destination wins, which makes `.tar.gz`
+    take precedence over `.gz`.
+    """
+
+    def __init__(self, rules):
+        """
+        Compiles the rules into a suffix trie.
+
+        Args:
+            rules: A dict mapping extensions (".jpg", "tar.gz", ".JPG") to
+                destination folders relative to the source directory.
+
+        Extensions are matched case-insensitively. If two rules normalize to the
+        same extension, the first one wins, mirroring the order in which the
+        rules were previously tried.
+        """
+        self.rules = dict(rules)
+        self._trie = {}
+        self.depth = 0
+        for ext, dest in self.rules.items():
+            parts = self._split_rule(ext)
+            if not parts:
+                continue
+            node = self._trie
+            for part in reversed(parts):
+                node = node.setdefault(part, {})
+            node.setdefault(_DEST, (dest, ext))
+            self.depth = max(self.depth, len(parts))
+
+    @staticmethod
+    def _split_rule(ext):
+        """Splits a rule key such as '.TAR.gz' into ['tar', 'gz']."""
+        ext = str(ext).strip().lower().lstrip(".")
+        if not ext:
+            return []
+        return ext.split(".")
+
+    def match_rule(self, name):
+        """
+        Returns the (destination, rule) pair for a file name, or None.
+
+        Args:
+            name: The file name (not a full path) to match.
+
+        Leading dots are treated as part of the stem, so ".bashrc" has no
+        extension, consistent with `Path.suffix`.
+        """
+        stem_and_parts = name.lstrip(".").lower().split(".")
+        found = None
+        node = self._trie
+        # Never consume the first element: it is the stem, not an extension.
+        last = len(stem_and_parts) - 1
+        for i in range(last, max(0, last - self.depth), -1):
+            node = node.get(stem_and_parts[i])
+            if node is None:
+                break
+            hit = node.get(_DEST)
+            if hit is not None:
+                found = hit
+        return found
+
+    def match(self, name):
+        """
+        Returns the destination folder for a file name, or None if no rule matches.
+
+        Args:
+            name: The file name (not a full path) to match.
+        """
+        hit = self.match_rule(name)
+        return hit[0] if hit else None
+
+    def destinations(self):
+        """Returns the distinct destination folders, in rule order."""
+        return list(dict.fromkeys(self.rules.values()))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __repr__(self):
+        return f"RuleMatcher({len(self.rules)} rules)"
+
+
+def compile_rules(rules):
+    """
+    Returns a RuleMatcher for the given rules.
+
+    Args:
+        rules: A rules dict, or an already compiled RuleMatcher (returned as is).
+
+    The CLI, the watcher and the GUI compile their rules once with this function
+    and hand the matcher to every FileOrganizer they create.
+    """
+    if isinstance(rules, RuleMatcher):
+        return rules
+    return RuleMatcher(rules)
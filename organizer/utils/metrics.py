@@ -0,0 +1,354 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the histogram buckets
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Help texts for the Prometheus export; other metrics are exported without one.
+DESCRIPTIONS = {
+    "scan": "Time spent listing the source folder, per chunk of files",
+    "match": "Time spent matching a chunk of files against the rules",
+    "sniff": "Time spent classifying a chunk of files by their content",
+    "mkdir": "Time spent creating one destination folder",
+    "rename": "Time spent moving one file",
+    "history_write": "Time spent recording one move in the history",
+    "history_commit": "Time spent committing the history at the end of a batch",
+    "retry_wait": "Time spent waiting for locked files to be retried",
+    "queue_wait": "Time a path waited in the event queue before being organized",
+    "event_latency": "Time from the first event for a path until it was organized",
+    "files_scanned": "Files seen while scanning the source folder",
+    "files_matched": "Files that matched a rule",
+    "files_sniffed": "Files that matched a rule by their content, not their name",
+    "files_moved": "Files moved (or simulated)",
+    "move_errors": "Moves that failed permanently",
+    "retries": "Moves scheduled for another try",
+    "duplicates": "Files handled by the dedup policy",
+    "index_hits": "Unchanged files the scan index let a run skip",
+    "events": "File system events received by the watcher",
+    "overflows": "Times the inotify queue overflowed and the folders were rescanned",
+    "queue_depth": "Paths waiting in the event queue",
+    "tracked_files": "Files waiting to become stable",
+}
+
+
+class Histogram:
+    """
+    A histogram of durations with fixed buckets, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def cumulative(self):
+        """Returns (upper bound, number of values <= bound) pairs, ending with +Inf."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class Metrics:
+    """
+    Counters, gauges and duration histograms for one organizer or watcher.
+
+    All methods are thread-safe. Durations are recorded with `timer` or
+    `observe` under short phase names ("scan", "rename", ...); `summary` formats
+    them for humans and `to_prometheus` in the Prometheus text format, with a
+    prefix, "_seconds" appended to histograms and "_total" to counters.
+    """
+
+    def __init__(self, prefix="organizer", labels=None):
+        """
+        Initializes an empty set of metrics.
+
+        Args:
+            prefix: Prefix of the metric names in the Prometheus export.
+            labels: Labels added to every exported sample, e.g.
+                {"folder": "downloads"}, to tell apart several Metrics that
+                are exported together (see MetricsGroup).
+        """
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}  # name -> value or function returning the value
+        self._histograms = {}
+
+    def inc(self, name, value=1):
+        """Adds `value` to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        """
+        Sets a gauge.
+
+        Args:
+            name: Name of the gauge.
+            value: The current value, or a function that is called to read it
+                whenever the metrics are exported.
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Records a duration in a histogram."""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Records the duration of the `with` block in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def counter(self, name):
+        """Returns the value of a counter (0 if it was never incremented)."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """
+        Returns the current values as a dict of plain data.
+
+        The dict has "counters", "gauges" and "histograms" keys; each histogram
+        is a dict with its count, sum, max and cumulative buckets.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {
+                name: {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "max": h.max,
+                    "buckets": h.cumulative(),
+                }
+                for name, h in self._histograms.items()
+            }
+        for name, value in gauges.items():
+            if callable(value):
+                try:
+                    gauges[name] = value()
+                except Exception:
+                    gauges[name] = float("nan")
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def summary(self):
+        """Returns a human-readable table of all metrics."""
+        snap = self.snapshot()
+        lines = []
+        values = {**snap["counters"], **snap["gauges"]}
+        if values:
+            lines.append("Counters:")
+            for name in sorted(values):
+                lines.append(f"  {name:<16} {values[name]:>10}")
+        if snap["histograms"]:
+            lines.append(
+                f"Timings:{'count':>17} {'total':>10} {'avg':>10} {'max':>10}"
+            )
+            for name in sorted(snap["histograms"]):
+                h = snap["histograms"][name]
+                avg = h["sum"] / h["count"] if h["count"] else 0.0
+                lines.append(
+                    f"  {name:<16} {h['count']:>7} {_ms(h['sum']):>10} "
+                    f"{_ms(avg):>10} {_ms(h['max']):>10}"
+                )
+        return "\n".join(lines) if lines else "No metrics recorded."
+
+    def to_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        return render_prometheus([self])
+
+    def write_textfile(self, path):
+        """
+        Writes the Prometheus export to `path` for the node_exporter textfile
+        collector. The file is replaced atomically, so it is never read half
+        written.
+        """
+        _write_atomic(path, self.to_prometheus())
+
+
+class MetricsGroup:
+    """
+    Several Metrics exported together, such as one per watched folder.
+
+    Offers the export methods of Metrics, so it can be handed to MetricsServer
+    or written as a textfile. Give each member distinct labels.
+    """
+
+    def __init__(self, registries):
+        self.registries = list(registries)
+
+    def to_prometheus(self):
+        return render_prometheus(self.registries)
+
+    def write_textfile(self, path):
+        _write_atomic(path, self.to_prometheus())
+
+    def summary(self):
+        """Returns the summaries of all members, each under its labels."""
+        sections = []
+        for metrics in self.registries:
+            title = ", ".join(f"{k}={v}" for k, v in metrics.labels.items())
+            sections.append(f"[{title or 'shared'}]\n{metrics.summary()}")
+        return "\n".join(sections)
+
+
+def render_prometheus(registries):
+    """
+    Returns the metrics of several Metrics objects in the Prometheus text
+    format, with the samples of each metric grouped under one header.
+    """
+    families = {}  # name -> (base name, type, sample lines)
+
+    def family(name, base, kind):
+        return families.setdefault(name, (base, kind, []))[2]
+
+    for metrics in registries:
+        snap = metrics.snapshot()
+        labels = metrics.labels
+        for base, value in sorted(snap["counters"].items()):
+            name = f"{metrics.prefix}_{base}_total"
+            family(name, base, "counter").append(f"{name}{_labels(labels)} {value}")
+        for base, value in sorted(snap["gauges"].items()):
+            name = f"{metrics.prefix}_{base}"
+            family(name, base, "gauge").append(f"{name}{_labels(labels)} {value}")
+        for base, h in sorted(snap["histograms"].items()):
+            name = f"{metrics.prefix}_{base}_seconds"
+            lines = family(name, base, "histogram")
+            for bound, count in h["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels, le=le)} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {h['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {h['count']}")
+
+    out = []
+    for name, (base, kind, lines) in families.items():
+        if base in DESCRIPTIONS:
+            out.append(f"# HELP {name} {DESCRIPTIONS[base]}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def _labels(labels, **extra):
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in items.items()
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _write_atomic(path, text):
+    path = str(path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.2f}ms" if seconds < 1 else f"{seconds:.3f}s"
+
+
+class MetricsServer:
+    """
+    Serves a Metrics object (or MetricsGroup) over HTTP at /metrics for
+    Prometheus to scrape.
+
+    The server runs in a daemon thread and listens on localhost by default.
+    """
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        """
+        Initializes a new server; call `start` to begin serving.
+
+        Args:
+            metrics: The Metrics object to export.
+            port: TCP port to listen on (0 picks a free port, see `port`).
+            host: Address to bind to.
+        """
+        # Imported here so that plain CLI runs do not load the HTTP stack
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?")[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass  # Keep scrapes out of the organizer's log
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        """Starts serving in the background."""
+        self._thread.start()
+
+    def stop(self):
+        """Stops the server and closes its socket."""
+        if self._thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
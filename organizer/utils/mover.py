@@ -0,0 +1,217 @@
+import errno
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+
+CHUNK_SIZE = 64 * 1024 * 1024  # Bytes handed to the kernel per copy call
+PARTIAL_SUFFIX = ".afo-partial"
+MAX_DIR_FDS = 256  # Directory descriptors a DirHandles keeps open at most
+
+
+class DirHandles:
+    """
+    Open directory file descriptors, kept for the duration of one run.
+
+    Renaming with `src_dir_fd`/`dst_dir_fd` makes the kernel resolve only the
+    file names instead of both full paths on every move, which saves path
+    lookups on deep trees and round-trips on network mounts. Each directory is
+    opened once, on first use. Descriptors are never closed before `close`, so
+    one handed to a worker thread stays valid; once MAX_DIR_FDS are open,
+    further directories fall back to path-based renames.
+    """
+
+    supported = {os.rename, os.open} <= os.supports_dir_fd
+
+    def __init__(self, limit=MAX_DIR_FDS):
+        self.limit = limit
+        self._fds = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Returns a descriptor for directory `path`, or None if unavailable."""
+        if not self.supported:
+            return None
+        key = os.fspath(path)
+        with self._lock:
+            fd = self._fds.get(key)
+            if fd is None and key not in self._fds and len(self._fds) < self.limit:
+                try:
+                    fd = os.open(key, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+                except OSError:
+                    fd = None
+                self._fds[key] = fd  # Remember failures as well
+            return fd
+
+    def close(self):
+        """Closes all descriptors."""
+        with self._lock:
+            fds, self._fds = self._fds, {}
+        for fd in fds.values():
+            if fd is not None:
+                os.close(fd)
+
+    def __len__(self):
+        with self._lock:
+            return sum(fd is not None for fd in self._fds.values())
+
+
+def move_file(src, dest, verify="size", dirs=None):
+    """
+    Moves a file, copying it across filesystems when a rename is not possible.
+
+    Args:
+        src: Path of the file to move.
+        dest: Destination path of the file.
+        verify: How a cross-filesystem copy is checked before the source is
+            removed: "size" compares the sizes, "hash" also compares blake2b
+            digests of both files.
+        dirs: Optional DirHandles; if descriptors for both parent folders are
+            available, the rename is done relative to them.
+
+    A plain rename is tried first. If it fails with EXDEV (the destination is on
+    another mount), the file is copied with `copy_across` and the source is
+    unlinked once the copy has been synced and verified. Any other error is
+    raised unchanged.
+    """
+    try:
+        src_fd = dst_fd = None
+        if dirs is not None:
+            src, dest = Path(src), Path(dest)
+            src_fd, dst_fd = dirs.get(src.parent), dirs.get(dest.parent)
+        if src_fd is not None and dst_fd is not None:
+            os.rename(src.name, dest.name, src_dir_fd=src_fd, dst_dir_fd=dst_fd)
+        else:
+            os.rename(src, dest)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    copy_across(src, dest, verify=verify)
+    os.unlink(src)
+
+
+def partial_path(src_stat, dest):
+    """
+    Returns the temporary path a cross-filesystem copy is written to.
+
+    The name includes the source size and modification time, so a transfer is
+    only resumed if the source has not changed since it was interrupted.
+    """
+    dest = Path(dest)
+    tag = f"{src_stat.st_size}-{src_stat.st_mtime_ns}"
+    return dest.with_name(f".{dest.name}.{tag}{PARTIAL_SUFFIX}")
+
+
+def copy_across(src, dest, verify="size"):
+    """
+    Copies `src` to `dest` on another filesystem without going through Python buffers.
+
+    Args:
+        src: Path of the file to copy.
+        dest: Destination path of the copy.
+        verify: "size" or "hash", see `move_file`.
+
+    The data is written to a hidden partial file next to `dest` in large chunks
+    with `os.copy_file_range`, falling back to `os.sendfile` and then to plain
+    reads and writes where the kernel does not support it. If a partial file from
+    an interrupted transfer of the same source exists, copying resumes at its
+    end. The copy is fsynced and verified, its metadata is copied from the
+    source, and it is then atomically renamed to `dest`.
+
+    Raises:
+        OSError: If the copy does not match the source.
+    """
+    src, dest = Path(src), Path(dest)
+    st = os.stat(src)
+    partial = partial_path(st, dest)
+    fd_in = os.open(src, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        fd_out = os.open(
+            partial, os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600
+        )
+        try:
+            offset = os.fstat(fd_out).st_size
+            if offset > st.st_size:
+                os.ftruncate(fd_out, 0)
+                offset = 0
+            _copy_range(fd_in, fd_out, offset, st.st_size)
+            os.fsync(fd_out)
+        finally:
+            os.close(fd_out)
+    finally:
+        os.close(fd_in)
+
+    copied = os.stat(partial).st_size
+    if copied != st.st_size or (verify == "hash" and _digest(src) != _digest(partial)):
+        os.unlink(partial)
+        raise OSError(errno.EIO, f"Copy of '{src}' does not match the source")
+    shutil.copystat(src, partial)
+    os.replace(partial, dest)
+    _fsync_dir(dest.parent)
+
+
+def _copy_range(fd_in, fd_out, offset, size):
+    """Copies bytes [offset, size) of fd_in to the same offsets of fd_out."""
+    copy = _copy_file_range if hasattr(os, "copy_file_range") else _sendfile
+    while offset < size:
+        count = min(CHUNK_SIZE, size - offset)
+        try:
+            n = copy(fd_in, fd_out, offset, count)
+        except OSError as e:
+            if copy is _read_write or e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EINVAL,
+                errno.EOPNOTSUPP,
+                errno.ENOTSUP,
+                errno.EBADF,
+            ):
+                raise
+            copy = _sendfile if copy is _copy_file_range else _read_write
+            continue
+        if n == 0:
+            break  # The source shrank while copying; caught by verification
+        offset += n
+    return offset
+
+
+def _copy_file_range(fd_in, fd_out, offset, count):
+    return os.copy_file_range(fd_in, fd_out, count, offset, offset)
+
+
+def _sendfile(fd_in, fd_out, offset, count):
+    if not hasattr(os, "sendfile"):
+        return _read_write(fd_in, fd_out, offset, count)
+    os.lseek(fd_out, offset, os.SEEK_SET)
+    return os.sendfile(fd_out, fd_in, offset, count)
+
+
+def _read_write(fd_in, fd_out, offset, count):
+    os.lseek(fd_in, offset, os.SEEK_SET)
+    os.lseek(fd_out, offset, os.SEEK_SET)
+    data = os.read(fd_in, min(count, 1024 * 1024))
+    return os.write(fd_out, data)
+
+
+def _digest(path):
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.digest()
+
+
+def _fsync_dir(path):
+    """Makes a rename inside `path` durable where the platform allows it."""
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
@@ -0,0 +1,113 @@
+import os
+
+COLLISION_POLICIES = ("skip", "overwrite", "rename", "keep-newer")
+
+
+class NameIndex:
+    """
+    The file names taken in one destination folder.
+
+    With `scan=True` the folder is listed once with `os.scandir` and membership
+    is a set lookup. With `scan=False` nothing is listed up front and names are
+    checked with `os.path.lexists`, which suits organizing a few files at a time.
+
+    Unique names of the form "name (n).ext" are allocated from a counter kept
+    per name, so allocating many copies of the same name does not probe
+    "name (1)", "name (2)", ... from the start every time. An index built with
+    `scan=False` can be kept across runs to keep its counters: call `new_run`
+    before and `stamp` after each run, and drop it once `stale` says the folder
+    was changed by someone else.
+    """
+
+    def __init__(self, folder, scan=True):
+        """
+        Initializes a new index.
+
+        Args:
+            folder: The destination folder.
+            scan: Whether to list the folder once up front.
+        """
+        self.folder = folder
+        self.scan = scan
+        self._names = set()
+        self._next = {}  # (stem, suffix) -> next counter to try
+        self._sources = {}  # name -> path of the file it was reserved for
+        self._mtime = None  # Folder mtime after the last run, see stamp
+        if scan:
+            try:
+                with os.scandir(folder) as it:
+                    self._names = {entry.name for entry in it}
+            except OSError:
+                pass
+
+    def __contains__(self, name):
+        if name in self._names:
+            return True
+        return not self.scan and os.path.lexists(os.path.join(self.folder, name))
+
+    def add(self, name, source=None):
+        """
+        Marks a name as taken.
+
+        Args:
+            name: The file name.
+            source: Path of the incoming file the name is reserved for, if any.
+        """
+        self._names.add(name)
+        if source is not None:
+            self._sources[name] = os.fspath(source)
+
+    def reserved_for(self, name):
+        """Returns the path of the incoming file `name` is reserved for, or None."""
+        return self._sources.get(name)
+
+    def new_run(self):
+        """
+        Forgets the names reserved by the last run, keeping the counters.
+
+        Only valid with `scan=False`, where taken names are checked on disk.
+        """
+        self._names.clear()
+        self._sources.clear()
+
+    def stamp(self):
+        """Records the folder's mtime once a run has made its own changes."""
+        try:
+            self._mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            self._mtime = None
+
+    def stale(self):
+        """
+        Returns True if the folder changed since `stamp`, so names below the
+        counters may have been freed.
+        """
+        try:
+            return self._mtime is None or (
+                self._mtime != os.stat(self.folder).st_mtime_ns
+            )
+        except OSError:
+            return True
+
+    def allocate(self, name, suffix=None):
+        """
+        Reserves and returns a free name based on `name`.
+
+        Args:
+            name: The preferred file name.
+            suffix: The extension to keep at the end ("name (1).tar.gz");
+                defaults to the last extension of `name`.
+        """
+        if name not in self:
+            self.add(name)
+            return name
+        if suffix is None or not name.lower().endswith(suffix.lower()):
+            suffix = os.path.splitext(name)[1]
+        stem = name[: len(name) - len(suffix)] if suffix else name
+        n = self._next.get((stem, suffix), 1)
+        while f"{stem} ({n}){suffix}" in self:
+            n += 1
+        self._next[(stem, suffix)] = n + 1
+        candidate = f"{stem} ({n}){suffix}"
+        self.add(candidate)
+        return candidate
@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import threading
+
+
+class PlanWriter:
+    """
+    Streams a move plan as JSON Lines and tallies it per destination folder.
+
+    Each planned move is written as soon as it is known, as one object with the
+    absolute source and destination paths, the file size and the rule that
+    matched:
+
+        {"src": "/home/me/Downloads/a.pdf", "dest": "/home/me/Downloads/Docs/a.pdf",
+         "size": 48213, "rule": ".pdf"}
+
+    A plan can be reviewed or edited and then executed with
+    `FileOrganizer.apply_plan` (`--apply PLAN` on the command line).
+    """
+
+    def __init__(self, path=None):
+        """
+        Opens a plan for writing.
+
+        Args:
+            path: File to write the plan to; None or "-" writes to stdout.
+        """
+        self.path = path
+        if path is None or str(path) == "-":
+            self._fh, self._owned = sys.stdout, False
+        else:
+            self._fh, self._owned = open(path, "w", encoding="utf-8"), True
+        self.to_stdout = not self._owned
+        self._lock = threading.Lock()
+        self.totals = {}  # destination folder -> [count, bytes]
+
+    def add(self, src, dest, size, rule=None):
+        """
+        Writes one planned move.
+
+        Args:
+            src: Path of the file to move.
+            dest: Planned destination path.
+            size: Size of the file in bytes.
+            rule: The rule (extension) that matched the file.
+        """
+        src, dest = os.path.abspath(src), os.path.abspath(dest)
+        line = json.dumps({"src": src, "dest": dest, "size": size, "rule": rule})
+        with self._lock:
+            self._fh.write(line + "\n")
+            total = self.totals.setdefault(os.path.dirname(dest), [0, 0])
+            total[0] += 1
+            total[1] += size
+
+    def close(self):
+        """Flushes the plan and closes its file (stdout is left open)."""
+        with self._lock:
+            if self._owned:
+                self._fh.close()
+            else:
+                self._fh.flush()
+
+    def report(self):
+        """
+        Returns {destination folder: {"count": files, "bytes": total size}}.
+        """
+        with self._lock:
+            return {
+                folder: {"count": count, "bytes": size}
+                for folder, (count, size) in sorted(self.totals.items())
+            }
+
+    def summary(self):
+        """Returns the per-destination report as human-readable lines."""
+        report = self.report()
+        if not report:
+            return "Plan is empty: no files would be moved."
+        lines = ["Planned moves per destination:"]
+        for folder, total in report.items():
+            lines.append(
+                f"  {folder}: {total['count']} file(s), {_size(total['bytes'])}"
+            )
+        count = sum(t["count"] for t in report.values())
+        size = sum(t["bytes"] for t in report.values())
+        lines.append(f"Total: {count} file(s), {_size(size)}")
+        return "\n".join(lines)
+
+
+def _size(n):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024 or unit == "GiB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def read_plan(path):
+    """
+    Yields the entries of a plan written by PlanWriter.
+
+    Args:
+        path: Path of the plan file, or "-" for stdin.
+
+    Blank lines are skipped.
+
+    Raises:
+        ValueError: If a line is not a plan entry.
+    """
+    fh = sys.stdin if str(path) == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for number, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                if not isinstance(entry, dict) or not {"src", "dest"} <= entry.keys():
+                    raise ValueError("expected an object with 'src' and 'dest'")
+            except ValueError as e:
+                raise ValueError(f"Invalid plan entry on line {number}: {e}")
+            yield entry
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import pstats
+import tracemalloc
+from contextlib import nullcontext
+from datetime import datetime
+
+PROFILE_MODES = ("cpu", "mem")
+_EXTENSIONS = {"cpu": "pstats", "mem": "tracemalloc"}
+
+
+def default_output(mode):
+    """Returns a time-stamped file name for the raw profile of a run."""
+    return f"afo-{mode}-{datetime.now():%Y%m%d-%H%M%S}.{_EXTENSIONS[mode]}"
+
+
+class Profiler:
+    """
+    A context manager that profiles the code run in its `with` block.
+
+    In "cpu" mode the block runs under cProfile; in "mem" mode allocations are
+    traced with tracemalloc. On exit, `report` holds a top-N summary (functions
+    by cumulative time, or the peak traced memory and the lines that allocated
+    the most), the raw data is written to `output` if given (a pstats file for
+    `python -m pstats` or snakeviz, or a tracemalloc snapshot), and the report
+    is logged if a logger was given.
+
+    cProfile only sees the thread that entered the block, so profile with a
+    single worker to include the moves themselves.
+    """
+
+    def __init__(self, mode, output=None, top=20, logger=None):
+        """
+        Initializes a new profiler.
+
+        Args:
+            mode: "cpu" or "mem".
+            output: Path to write the raw profile to, or None.
+            top: Number of entries in the report.
+            logger: Logger the report is written to on exit, or None.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'")
+        self.mode = mode
+        self.output = output
+        self.top = top
+        self.logger = logger
+        self.report = ""
+        self.peak = None  # Peak traced memory in bytes ("mem" mode)
+        self.stats = None  # pstats.Stats ("cpu" mode)
+        self._profile = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.mode == "cpu":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start(10)
+            if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+                tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc):
+        if self.mode == "cpu":
+            self._profile.disable()
+            self._cpu_report()
+        else:
+            self._mem_report()
+        if self.logger is not None:
+            self.logger.info(self.report)
+        return False
+
+    def _cpu_report(self):
+        out = io.StringIO()
+        self.stats = pstats.Stats(self._profile, stream=out)
+        self.stats.sort_stats("cumulative").print_stats(self.top)
+        if self.output:
+            self._profile.dump_stats(self.output)
+            out.write(f"CPU profile written to {self.output}\n")
+        self.report = out.getvalue()
+
+    def _mem_report(self):
+        _, self.peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracing:
+            tracemalloc.stop()
+        snapshot = snapshot.filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            )
+        )
+        lines = [f"Peak traced memory: {self.peak / 2**20:.2f} MiB"]
+        lines.append(f"Top {self.top} allocating lines:")
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"  {frame.filename}:{frame.lineno}: "
+                f"{stat.size / 1024:.1f} KiB in {stat.count} blocks"
+            )
+        if self.output:
+            snapshot.dump(self.output)
+            lines.append(f"Memory snapshot written to {self.output}")
+        self.report = "\n".join(lines) + "\n"
+
+
+def profile(mode, output=None, top=20, logger=None):
+    """
+    Returns a Profiler for `mode`, or a no-op context manager if mode is None.
+
+    Lets callers wrap a run unconditionally:
+
+        with profile(args.profile, logger=log):
+            organizer.organize()
+    """
+    if not mode:
+        return nullcontext()
+    return Profiler(mode, output=output, top=top, logger=logger)
+
@@ -1,10 +1,9 @@
 from datetime import datetime
-import json
 from organizer.logger_code import get_logger
-from organizer.utils.data import UNDO_PATH
+from organizer.utils.data import get_store
 
 
-def record_move(original_path, new_path, simulate=False, logger=None):
+def record_move(original_path, new_path, simulate=False, logger=None, batch=None):
     """
     Records a file move operation in the undo history.
 
@@ -13,12 +12,13 @@ def record_move(original_path, new_path, simulate=False, logger=None):
         new_path: The new path of the file after the move.
         simulate: If True, the move is simulated and not actually performed.
         logger: Logger object for logging operations.
+        batch: Id of the organize run the move belongs to, used by undo.
 
-    The function records a file move operation in the undo history. If the undo file
-    exists, it loads the existing history data. If the undo file does not exist, it
-    creates a new empty history. The function then appends the move operation to the
-    history and writes it back to the undo file. If simulate is True, the move is
-    simulated and not actually performed.
+    The function appends the move to the history store (the undo journal by
+    default). The store buffers moves and writes them once per group commit, so
+    recording a move no longer reads or rewrites the existing history. The store serializes access
+    with a lock, so moves may be recorded from several threads at once. If
+    simulate is True, the move is only logged.
     """
     if logger:
         log = logger
@@ -30,35 +30,33 @@ def record_move(original_path, new_path, simulate=False, logger=None):
         "new_path": str(new_path),
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     }
-
-    try:
-        if UNDO_PATH.exists():
-            with open(UNDO_PATH, "r") as f:
-                try:
-                    data = json.load(f)
-                    if not isinstance(data, list):
-                        data = []
-                        log.warning("isinstance error")
-                except json.JSONDecodeError:
-                    log.warning("JSONDecodeError")
-                    data = []
-        else:
-            data = []
-            log.warning("Undo file not found")
-    except Exception as e:
-        log.error(f"Error reading undo file '{UNDO_PATH}': {e}")
-        data = []
-
-    data.append(move)
+    if batch is not None:
+        move["batch"] = batch
 
     if not simulate:
         try:
-            with open(UNDO_PATH, "w") as f:
-                json.dump(data, f, indent=2)
+            get_store().append(move)
         except Exception as e:
-            log.error(f"Error writing to undo file '{UNDO_PATH}': {e}")
+            log.error(f"Error writing to history store: {e}")
     else:
-        log.info(data)
+        log.info(move)
+
+
+def commit(logfile=None):
+    """
+    Commits the moves buffered in the history store.
+
+    Args:
+        logfile: Path to the log file for logging.
+
+    Callers record a whole batch of moves with record_move and then call this
+    function once, so the batch costs a single write and fsync.
+    """
+    log = get_logger(log_to_file=True, log_file=logfile) if logfile else get_logger()
+    try:
+        get_store().commit()
+    except Exception as e:
+        log.error(f"Error committing history store: {e}")
 
 
 def update(data, logfile=None):
@@ -69,32 +67,71 @@ def update(data, logfile=None):
         data: The data to be written to the undo file.
         logfile: Path to the log file for logging.
 
-    The function updates the undo history with the specified data. If the undo file
-    exists, it loads the existing history data. If the undo file does not exist, it
-    creates a new empty history. The function then writes the specified data to the
-    undo file.
+    The function makes the specified data the new undo history. When the data is
+    the current history with moves removed from its end (as after an undo), only
+    a small truncate record is appended to the journal; otherwise the journal is
+    rewritten atomically.
+    """
+    log = get_logger(log_to_file=True, log_file=logfile) if logfile else get_logger()
+    try:
+        get_store().update(data)
+    except Exception as e:
+        log.error(f"Error updating history store: {e}")
+
+
+def discard(batches, count=None, logfile=None):
+    """
+    Removes whole batches of moves from the undo history.
+
+    Args:
+        batches: The ids of the batches that were undone.
+        count: The number of moves in those batches, if known.
+        logfile: Path to the log file for logging.
+
+    The function appends a single undo record to the journal, so reverting any
+    number of batches costs one history commit.
+    """
+    log = get_logger(log_to_file=True, log_file=logfile) if logfile else get_logger()
+    try:
+        get_store().discard_batches(batches, count=count)
+    except Exception as e:
+        log.error(f"Error updating history store: {e}")
+
+
+def restore(moves, logfile=None):
+    """
+    Records moves again exactly as they were, with their batch and timestamp.
+
+    Args:
+        moves: The history entries to record.
+        logfile: Path to the log file for logging.
+
+    Used for the moves of an undone batch that could not be reverted: the
+    batch is discarded as a whole, and its failed moves are restored so that a
+    later undo can try them again.
     """
     log = get_logger(log_to_file=True, log_file=logfile) if logfile else get_logger()
     try:
-        with open(UNDO_PATH, "w") as f:
-            json.dump(data, f, indent=2)
+        store = get_store()
+        for move in moves:
+            store.append(move)
+        store.commit()
     except Exception as e:
-        log.error(f"Error updating undo file '{UNDO_PATH}': {e}")
+        log.error(f"Error updating history store: {e}")
 
 
 def reset(logfile=None):
     """
-    Resets the undo history by deleting the undo file.
+    Resets the undo history by emptying the undo journal.
 
     Args:
         logfile: Path to the log file for logging.
 
-    The function resets the undo history by deleting the undo file. If the undo file
-    exists, it is deleted. If the undo file does not exist, the function does nothing.
+    The function resets the undo history by truncating the undo journal to an
+    empty file.
     """
     log = get_logger(log_to_file=True, log_file=logfile) if logfile else get_logger()
     try:
-        with open(UNDO_PATH, "w") as f:
-            json.dump([], f, indent=2)
+        get_store().clear()
     except Exception as e:
-        log.error(f"Error resetting undo file '{UNDO_PATH}': {e}")
+        log.error(f"Error resetting history store: {e}")
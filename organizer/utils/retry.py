@@ -0,0 +1,69 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class RetryQueue:
+    """
+    Failed operations waiting to be retried, ordered by the time they are due.
+
+    Retries use exponential backoff with jitter: the n-th retry of an item waits
+    a random delay between half and all of min(max_delay, base_delay * 2**n), so
+    files locked by the same program are not all retried at the same moment.
+    The queue only schedules; the caller decides when to run what is due.
+    """
+
+    def __init__(self, attempts=5, base_delay=0.25, max_delay=8.0):
+        """
+        Initializes a new retry queue.
+
+        Args:
+            attempts: Total number of tries an item gets, including the first.
+            base_delay: Seconds before the first retry, before jitter.
+            max_delay: Upper bound for the delay between two tries.
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._heap = []  # (due, seq, item, tries)
+        self._seq = itertools.count()
+
+    def delay(self, tries):
+        """Returns the jittered delay before the next try, after `tries` tries."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (tries - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def schedule(self, item, tries):
+        """
+        Schedules another try of `item`, which has failed `tries` times.
+
+        Returns False, without scheduling, if the item has used all its attempts.
+        """
+        if tries >= self.attempts:
+            return False
+        due = time.monotonic() + self.delay(tries)
+        with self._lock:
+            heapq.heappush(self._heap, (due, next(self._seq), item, tries))
+        return True
+
+    def pop_due(self):
+        """Removes and returns the (item, tries) pairs that are due now."""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, item, tries = heapq.heappop(self._heap)
+                due.append((item, tries))
+        return due
+
+    def next_due(self):
+        """Returns the monotonic time the next retry is due, or None if empty."""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
@@ -0,0 +1,113 @@
+import json
+import os
+import pickle
+import threading
+import time
+import logging
+from organizer.utils.matcher import RuleMatcher
+from organizer.utils.scan_index import RACY_NS
+
+CACHE_VERSION = 2  # Bump when the pickled entry or RuleMatcher layout changes
+
+
+class RulesCache:
+    """
+    Compiled rule matchers keyed by rules file path, mtime and size.
+
+    A matcher is compiled from a rules file only once per version of the file:
+    lookups stat the file and return the cached matcher while its mtime and
+    size are unchanged, so an unchanged file is never re-read or re-parsed.
+    Compiled matchers are also pickled to `cache_path`, which makes a cold start
+    with an unchanged rules file a single unpickle instead of a JSON parse and
+    compile.
+
+    A file modified within RACY_NS of being cached may still be edited in the
+    same clock tick without its mtime or size changing, so such entries also
+    keep the parsed rules and the file is re-read until it is old enough; the
+    matcher is only recompiled if the rules differ.
+    """
+
+    def __init__(self, cache_path=None, logger=None):
+        """
+        Initializes a new cache.
+
+        Args:
+            cache_path: Path of the on-disk cache file; None keeps the cache in
+                memory only.
+            logger: The logger to use for logging events.
+        """
+        self.cache_path = cache_path
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # abs path -> ((mtime_ns, size), RuleMatcher, rules if racy else None)
+        self._entries = None
+
+    @staticmethod
+    def key(st):
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self, path):
+        """
+        Returns the compiled matcher for the rules file at `path`.
+
+        Args:
+            path: Path of a JSON rules file.
+
+        The same RuleMatcher object is returned for as long as the file is
+        unchanged, so callers can detect a reload with an identity check.
+
+        Raises:
+            FileNotFoundError: If the rules file does not exist.
+            json.JSONDecodeError: If the rules file is not valid JSON.
+            ValueError: If the rules file does not hold a JSON object.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = self.key(st)
+        racy = time.time_ns() - st.st_mtime_ns < RACY_NS
+        with self._lock:
+            entries = self._load_entries()
+            cached = entries.get(path)
+            if cached is not None and cached[0] == key and cached[2] is None:
+                return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+        if not isinstance(rules, dict):
+            raise ValueError(f"Rules file '{path}' is not a valid JSON object.")
+        if cached is not None and cached[0] == key and cached[2] == rules:
+            matcher = cached[1]  # Re-read a racy entry; the rules did not change
+        else:
+            matcher = RuleMatcher(rules)
+        with self._lock:
+            self._entries[path] = (key, matcher, rules if racy else None)
+            self._save()
+        return matcher
+
+    def _load_entries(self):
+        if self._entries is None:
+            self._entries = {}
+            if self.cache_path is not None and self.cache_path.exists():
+                try:
+                    with open(self.cache_path, "rb") as f:
+                        version, entries = pickle.load(f)
+                    if version == CACHE_VERSION:
+                        self._entries = entries
+                except Exception as e:
+                    self.logger.warning(
+                        f"Ignoring unreadable rules cache '{self.cache_path}': {e}"
+                    )
+        return self._entries
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(
+                    (CACHE_VERSION, self._entries), f, protocol=pickle.HIGHEST_PROTOCOL
+                )
+            os.replace(tmp, self.cache_path)
+        except Exception as e:
+            self.logger.error(f"Error writing rules cache '{self.cache_path}': {e}")
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from pathlib import Path
+
+INDEX_VERSION = 1  # Bump when the pickled layout changes
+# Timestamps this close to the start of a scan may hide a later change made
+# within the same clock tick, so they are not trusted (like git's racy index).
+RACY_NS = 2 * 10**9
+PENDING = "pending"  # Verdict of a file that must be looked at again
+
+
+def index_path(folder, base):
+    """Returns the path of the index of `folder` inside the directory `base`."""
+    digest = hashlib.sha1(os.fsencode(os.path.abspath(folder))).hexdigest()
+    return Path(base) / f"{digest}.pickle"
+
+
+def fingerprint(*parts):
+    """Returns a digest of everything a verdict depends on (rules, options...)."""
+    data = json.dumps(parts, sort_keys=True, default=repr)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class ScanIndex:
+    """
+    An on-disk index of the files of a source folder that matched no rule.
+
+    For each file seen by the last run it keeps (inode, size, mtime_ns, verdict),
+    where the verdict is None for a file that matched no rule and PENDING for a
+    file that still needs handling (it matched, or it was too new to trust). A
+    scan filtered through the index only yields new or changed files and files
+    with an open verdict, so files that match no rule are matched once, not on
+    every run.
+
+    The index also keeps the mtime of the folder itself. While it is unchanged
+    no file was added, removed or renamed there, so a non-recursive run can skip
+    listing the folder and only look at the open entries: an idle folder costs
+    one stat.
+
+    The index is only valid for the rules and options it was built with; pass
+    a `fingerprint` of them and a mismatch starts from an empty index.
+    """
+
+    def __init__(self, folder, path, fingerprint=None, logger=None):
+        """
+        Loads the index of `folder`.
+
+        Args:
+            folder: The source folder.
+            path: Where the index is stored (see index_path).
+            fingerprint: Digest of the rules and options (see fingerprint).
+            logger: The logger to use for logging events.
+        """
+        self.folder = os.path.abspath(folder)
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.logger = logger or logging.getLogger(__name__)
+        self.entries = {}  # path relative to folder -> (ino, size, mtime_ns, verdict)
+        self.dir_mtime = None
+        self.hits = 0  # Files skipped by the last `filter`
+        self._next = None  # Entries of the scan in progress
+        self._scan_mtime = None
+        self._scan_start = None
+        if self.path.exists():
+            try:
+                with open(self.path, "rb") as f:
+                    version, saved, dir_mtime, entries = pickle.load(f)
+                if version == INDEX_VERSION and saved == fingerprint:
+                    self.entries, self.dir_mtime = entries, dir_mtime
+            except Exception as e:
+                self.logger.warning(
+                    f"Ignoring unreadable scan index '{self.path}': {e}"
+                )
+
+    def clear(self):
+        """Forgets all entries, so the next scan looks at every file."""
+        self.entries, self.dir_mtime = {}, None
+
+    def unchanged(self):
+        """
+        Returns True if the folder has not changed since the index was saved.
+        """
+        try:
+            return self.dir_mtime == os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return False
+
+    def pending(self):
+        """Yields the paths of the indexed files that have an open verdict."""
+        for rel, (_, _, _, verdict) in self.entries.items():
+            if verdict is not None:
+                path = Path(self.folder, rel)
+                if path.is_file():
+                    yield path
+
+    def filter(self, entries):
+        """
+        Yields the entries of a scan that are new, changed or still open.
+
+        Args:
+            entries: `os.DirEntry` objects of the files of the folder.
+
+        Yielded files get an open verdict until `settle` records that they
+        matched nothing. The index is rebuilt from the entries, so files that
+        are gone drop out of it; call `save` once the scan has been consumed.
+        """
+        st = os.stat(self.folder)
+        self._scan_mtime = st.st_mtime_ns
+        self._scan_start = time.time_ns()
+        old, self._next = self.entries, {}
+        self.hits = 0
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            rel = os.path.relpath(entry.path, self.folder)
+            key = (st.st_ino, st.st_size, st.st_mtime_ns)
+            cached = old.get(rel)
+            if cached is not None and cached[:3] == key and cached[3] is None:
+                self._next[rel] = cached
+                self.hits += 1
+                continue
+            self._next[rel] = key + (PENDING,)
+            yield entry
+        self.entries, self._next = self._next, None
+
+    def settle(self, paths):
+        """
+        Records that the files at `paths`, yielded by `filter`, matched nothing.
+
+        Files modified just before the scan keep an open verdict, since they
+        may still be written to.
+        """
+        entries = self._next if self._next is not None else self.entries
+        for path in paths:
+            rel = os.path.relpath(os.fspath(path), self.folder)
+            cached = entries.get(rel)
+            if cached is not None and self._scan_start - cached[2] >= RACY_NS:
+                entries[rel] = cached[:3] + (None,)
+
+    def save(self, recursive=False):
+        """
+        Writes the index after a `filter`ed scan.
+
+        Args:
+            recursive: Whether the scan included subfolders. Changes in a
+                subfolder do not show in the folder's mtime, so recursive
+                scans never skip the listing.
+        """
+        dir_mtime = self._scan_mtime
+        if recursive or self._scan_start - dir_mtime < RACY_NS:
+            dir_mtime = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(
+                    (INDEX_VERSION, self.fingerprint, dir_mtime, self.entries),
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp, self.path)
+            self.dir_mtime = dir_mtime
+        except Exception as e:
+            self.logger.error(f"Error writing scan index '{self.path}': {e}")
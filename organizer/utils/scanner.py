@@ -0,0 +1,180 @@
+import os
+import queue
+import threading
+from collections import deque
+from fnmatch import fnmatch
+from itertools import islice
+
+
+def scan_files(folder):
+    """
+    Yields the regular files directly inside `folder` as `os.DirEntry` objects.
+
+    Args:
+        folder: The directory to scan.
+
+    The directory is read lazily with `os.scandir`, so memory use does not grow
+    with the number of entries and the first file is available right away. The
+    file type comes from the directory entry itself, which avoids an extra stat
+    per entry on most platforms. Entries that disappear or cannot be inspected
+    while scanning are skipped.
+    """
+    with os.scandir(folder) as it:
+        for entry in it:
+            try:
+                if entry.is_file():
+                    yield entry
+            except OSError:
+                continue
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of at most `size` items from `iterable`.
+    """
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def is_excluded(name, rel_path, exclude):
+    """
+    Returns True if a file or folder matches one of the `exclude` globs.
+
+    Args:
+        name: The entry's name.
+        rel_path: The entry's path relative to the scanned root, with "/" separators.
+        exclude: Glob patterns, matched against both the name and the relative path.
+    """
+    return any(fnmatch(name, pat) or fnmatch(rel_path, pat) for pat in exclude)
+
+
+def walk_files(root, max_depth=None, exclude=(), skip_dirs=(), workers=8):
+    """
+    Yields the regular files of a whole directory tree as `os.DirEntry` objects.
+
+    Args:
+        root: The directory tree to walk.
+        max_depth: How many folder levels below `root` to descend (0 means only
+            `root` itself); None for no limit.
+        exclude: Glob patterns of files and folders to leave out.
+        skip_dirs: Absolute paths of folders that are not descended into.
+        workers: Number of threads scanning directories.
+
+    Directories are scanned in parallel by a pool of threads. Each thread keeps
+    its own deque of directories: it takes work from the back of its own deque
+    and, when that is empty, steals from the front of another thread's deque, so
+    wide and deep trees spread evenly across threads. Symbolic links to
+    directories are not followed. Files are handed to the caller through a
+    bounded queue, so memory stays flat however large the tree is. The order of
+    the files is not defined.
+    """
+    walker = _ParallelWalker(root, max_depth, exclude, skip_dirs, workers)
+    return walker.run()
+
+
+class _ParallelWalker:
+    _DONE = object()
+
+    def __init__(self, root, max_depth, exclude, skip_dirs, workers):
+        self.root = os.path.abspath(root)
+        self.max_depth = max_depth
+        self.exclude = tuple(exclude or ())
+        self.skip_dirs = {os.path.abspath(d) for d in skip_dirs}
+        self.workers = max(1, workers)
+        self.deques = [deque() for _ in range(self.workers)]
+        self.cond = threading.Condition()
+        self.pending = 0  # Directories queued or being scanned
+        self.closed = False
+        self.out = queue.Queue(maxsize=4096)
+
+    def run(self):
+        self._push(0, (self.root, "", 0))
+        threads = [
+            threading.Thread(target=self._work, args=(i,), daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in threads:
+            t.start()
+        finished = 0
+        try:
+            while finished < len(threads):
+                item = self.out.get()
+                if item is self._DONE:
+                    finished += 1
+                else:
+                    yield item
+        finally:
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+
+    def _push(self, i, task):
+        with self.cond:
+            self.pending += 1
+            self.deques[i].append(task)
+            self.cond.notify()
+
+    def _take(self, i):
+        with self.cond:
+            while not self.closed:
+                if self.deques[i]:
+                    return self.deques[i].pop()  # Newest own work first
+                for other in self.deques:
+                    if other:
+                        return other.popleft()  # Steal the oldest work
+                if self.pending == 0:
+                    return None
+                self.cond.wait()
+            return None
+
+    def _emit(self, item):
+        while not self.closed:
+            try:
+                self.out.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _work(self, i):
+        try:
+            while True:
+                task = self._take(i)
+                if task is None:
+                    return
+                try:
+                    self._scan(i, *task)
+                finally:
+                    with self.cond:
+                        self.pending -= 1
+                        if self.pending == 0:
+                            self.cond.notify_all()
+        finally:
+            self._emit(self._DONE)
+
+    def _scan(self, i, path, rel, depth):
+        try:
+            it = os.scandir(path)
+        except OSError:
+            return
+        with it:
+            for entry in it:
+                if self.closed:
+                    return
+                child_rel = f"{rel}/{entry.name}" if rel else entry.name
+                if self.exclude and is_excluded(entry.name, child_rel, self.exclude):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.max_depth is not None and depth >= self.max_depth:
+                            continue
+                        if entry.path in self.skip_dirs:
+                            continue
+                        self._push(i, (entry.path, child_rel, depth + 1))
+                    elif entry.is_file():
+                        self._emit(entry)
+                except OSError:
+                    continue
@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from organizer.utils.stability import is_in_progress
+
+HEADER_SIZE = 512  # Bytes read from the start of a file; covers the tar magic
+SNIFF_WORKERS = 8
+POOL_MIN_FILES = 8  # Fewer files are sniffed in the calling thread
+CACHE_LIMIT = 100_000  # Verdicts kept in memory
+
+# Extension -> (offset, bytes) parts that must all be present in the header.
+# The extension is then matched against the rules like a file name would be.
+SIGNATURES = (
+    (".pdf", ((0, b"%PDF-"),)),
+    (".png", ((0, b"\x89PNG\r\n\x1a\n"),)),
+    (".jpg", ((0, b"\xff\xd8\xff"),)),
+    (".gif", ((0, b"GIF87a"),)),
+    (".gif", ((0, b"GIF89a"),)),
+    (".webp", ((0, b"RIFF"), (8, b"WEBP"))),
+    (".wav", ((0, b"RIFF"), (8, b"WAVE"))),
+    (".avi", ((0, b"RIFF"), (8, b"AVI "))),
+    (".tiff", ((0, b"II*\x00"),)),
+    (".tiff", ((0, b"MM\x00*"),)),
+    (".bmp", ((0, b"BM"), (6, b"\x00\x00\x00\x00"))),
+    (".ico", ((0, b"\x00\x00\x01\x00"),)),
+    (".mov", ((4, b"ftypqt"),)),
+    (".m4a", ((4, b"ftypM4A"),)),
+    (".heic", ((4, b"ftypheic"),)),
+    (".mp4", ((4, b"ftypisom"),)),
+    (".mp4", ((4, b"ftypiso2"),)),
+    (".mp4", ((4, b"ftypmp41"),)),
+    (".mp4", ((4, b"ftypmp42"),)),
+    (".mp4", ((4, b"ftypavc1"),)),
+    (".mp4", ((4, b"ftypdash"),)),
+    (".mkv", ((0, b"\x1a\x45\xdf\xa3"),)),
+    (".mp3", ((0, b"ID3"),)),
+    (".ogg", ((0, b"OggS"),)),
+    (".flac", ((0, b"fLaC"),)),
+    (".gz", ((0, b"\x1f\x8b"),)),
+    (".bz2", ((0, b"BZh"),)),
+    (".xz", ((0, b"\xfd7zXZ\x00"),)),
+    (".7z", ((0, b"7z\xbc\xaf\x27\x1c"),)),
+    (".rar", ((0, b"Rar!\x1a\x07"),)),
+    (".tar", ((257, b"ustar"),)),
+)
+
+# Formats many others are built on: a ZIP may be a .docx, .xlsx, .epub or .jar,
+# an ISO-BMFF box of another brand an .avif or .3gp, an MZ header a .dll, and
+# SQLite files carry all kinds of extensions. These signatures only classify
+# files that have no extension at all.
+CONTAINER_SIGNATURES = (
+    (".zip", ((0, b"PK\x03\x04"),)),
+    (".zip", ((0, b"PK\x05\x06"),)),
+    (".mp4", ((4, b"ftyp"),)),
+    (".exe", ((0, b"MZ"),)),
+    (".sqlite", ((0, b"SQLite format 3\x00"),)),
+)
+
+
+def compile_signatures(signatures):
+    """
+    Compiles a signature table for `sniff_header`.
+
+    Signatures are grouped by the offset and length of their first part, and
+    each group becomes a dict keyed by those bytes, so classifying a header
+    costs one slice and one hash lookup per group instead of one comparison per
+    signature. Longer first parts, and then signatures with more parts, are
+    tried first, so a longer magic at the same offset always wins.
+    """
+    groups = {}
+    for ext, parts in signatures:
+        (offset, magic), rest = parts[0], tuple(parts[1:])
+        group = groups.setdefault((offset, len(magic)), {})
+        group.setdefault(magic, []).append((rest, ext))
+    for group in groups.values():
+        for candidates in group.values():
+            candidates.sort(key=lambda c: -len(c[0]))
+    return sorted(groups.items(), key=lambda item: -item[0][1])
+
+
+_TABLE = compile_signatures(SIGNATURES)
+_CONTAINER_TABLE = compile_signatures(CONTAINER_SIGNATURES)
+
+
+def sniff_header(header, table=_TABLE):
+    """
+    Returns the extension (".pdf") of the type whose signature the header
+    carries, or None.
+    """
+    for (offset, length), group in table:
+        candidates = group.get(header[offset : offset + length])
+        if candidates is None:
+            continue
+        for rest, ext in candidates:
+            if all(header[o : o + len(m)] == m for o, m in rest):
+                return ext
+    return None
+
+
+def read_header(path, size=HEADER_SIZE):
+    """Returns the first `size` bytes of a file with a single positioned read."""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if hasattr(os, "pread"):
+            return os.pread(fd, size, 0)
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+
+class Sniffer:
+    """
+    Classifies files by their first bytes (magic numbers) instead of their name.
+
+    Only a fixed HEADER_SIZE header is read, with one `pread`, and checked
+    against the compiled SIGNATURES. Verdicts are cached by (device, inode,
+    size, mtime), so a file is only read again after it changed. Batches of
+    files are sniffed in a thread pool, since the reads release the GIL.
+    Empty files and in-progress downloads (.part, .crdownload, ...) are never
+    classified, and CONTAINER_SIGNATURES only classify files with no extension.
+    """
+
+    def __init__(self, workers=SNIFF_WORKERS, logger=None):
+        """
+        Initializes a new sniffer.
+
+        Args:
+            workers: Threads reading headers in `sniff_many`.
+            logger: The logger to use for logging events.
+        """
+        self.workers = max(1, workers)
+        self.logger = logger or logging.getLogger(__name__)
+        # (dev, ino, size, mtime_ns) -> (extension, container extension)
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def sniff(self, path):
+        """
+        Returns the extension matching the content of a file, or None.
+
+        Args:
+            path: A path or `os.DirEntry` (whose cached stat is reused).
+        """
+        try:
+            if isinstance(path, os.DirEntry):
+                name, st = path.name, path.stat()
+            else:
+                name, st = os.path.basename(path), os.stat(path)
+            if not st.st_size or is_in_progress(name):
+                return None
+            key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+            with self._lock:
+                verdict = self._cache.get(key)
+            if verdict is None:
+                header = read_header(path)
+                ext = sniff_header(header)
+                container = None if ext else sniff_header(header, _CONTAINER_TABLE)
+                verdict = (ext, container)
+                with self._lock:
+                    if len(self._cache) >= CACHE_LIMIT:
+                        self._cache.pop(next(iter(self._cache)))
+                    self._cache[key] = verdict
+        except OSError as e:
+            self.logger.debug(f"Cannot sniff '{path}': {e}")
+            return None
+        # The name is checked after the cache, since a rename keeps the inode
+        ext, container = verdict
+        if ext is None and not os.path.splitext(name)[1]:
+            return container
+        return ext
+
+    def sniff_many(self, paths):
+        """Returns the `sniff` verdicts of `paths`, in order."""
+        if len(paths) < POOL_MIN_FILES or self.workers == 1:
+            return [self.sniff(p) for p in paths]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="sniff")
+        return list(self._pool.map(self.sniff, paths))
+
+    def close(self):
+        """Stops the thread pool; the cache is kept for later calls."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
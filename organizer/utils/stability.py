@@ -0,0 +1,159 @@
+import math
+import os
+import threading
+import time
+import logging
+from organizer.utils.mover import PARTIAL_SUFFIX
+
+# Names used by browsers and download tools while a file is still being written.
+IN_PROGRESS_SUFFIXES = (".part", ".crdownload", ".tmp", ".download", PARTIAL_SUFFIX)
+
+
+def is_in_progress(path):
+    """Returns True if the file name marks a download that is still in progress."""
+    return str(path).lower().endswith(IN_PROGRESS_SUFFIXES)
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel.
+
+    Timers are kept in `slots` buckets of `tick` seconds each, so scheduling and
+    expiring a timer are O(1) no matter how many files are being tracked.
+    Delays longer than one revolution are tracked with a rounds counter.
+    """
+
+    def __init__(self, tick=0.1, slots=256):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.cursor = 0
+        self.count = 0
+
+    def schedule(self, delay, item):
+        """Schedules `item` to expire after `delay` seconds."""
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self.cursor + ticks) % len(self.slots)
+        self.slots[slot].append([(ticks - 1) // len(self.slots), item])
+        self.count += 1
+
+    def advance(self):
+        """Moves the wheel one tick forward and returns the items that expired."""
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        bucket = self.slots[self.cursor]
+        expired = [item for rounds, item in bucket if rounds == 0]
+        self.slots[self.cursor] = [[r - 1, item] for r, item in bucket if r > 0]
+        self.count -= len(expired)
+        return expired
+
+
+class StabilityTracker:
+    """
+    Hands files to a callback once their size and mtime have stopped changing.
+
+    `watch` only records the path and returns immediately, so it is safe to call
+    from the observer thread. A background thread polls each tracked file with
+    exponential backoff (initial_delay, 2x, 4x, ... up to max_delay) driven by a
+    timer wheel. When two consecutive polls see the same size and mtime, the file
+    is considered complete and passed to `on_stable`. Files whose names mark an
+    in-progress download (.part, .crdownload, .tmp, ...) are never tracked; the
+    final rename produces a new event for the real name.
+    """
+
+    def __init__(
+        self, on_stable, initial_delay=0.25, max_delay=8.0, tick=0.05, logger=None
+    ):
+        """
+        Initializes a new tracker.
+
+        Args:
+            on_stable: Called with the path of each file that became quiescent.
+            initial_delay: Seconds before the first poll of a file.
+            max_delay: Upper bound for the backoff between polls.
+            tick: Resolution of the timer wheel, in seconds.
+            logger: The logger to use for logging events.
+        """
+        self.on_stable = on_stable
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._wheel = TimerWheel(tick)
+        self._tracked = {}  # path -> [snapshot, delay]
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="stability-tracker", daemon=True
+        )
+
+    def watch(self, path):
+        """
+        Starts tracking a file, unless it is already tracked or in progress.
+        """
+        if is_in_progress(path):
+            return
+        with self._cond:
+            if path in self._tracked:
+                return  # The next poll will notice the change
+            self._tracked[path] = [None, self.initial_delay]
+            self._wheel.schedule(self.initial_delay, path)
+            self._cond.notify()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._tracked)
+
+    def start(self):
+        """Starts the polling thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stops the polling thread; files still being tracked are dropped."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        last = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._stopped and not self._wheel.count:
+                    self._cond.wait()
+                    last = time.monotonic()
+                if self._stopped:
+                    return
+            time.sleep(self._wheel.tick)
+            now = time.monotonic()
+            expired = []
+            with self._cond:
+                while now - last >= self._wheel.tick:
+                    expired.extend(self._wheel.advance())
+                    last += self._wheel.tick
+            for path in expired:
+                self._poll(path)
+
+    def _poll(self, path):
+        try:
+            st = os.stat(path)
+            snapshot = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            snapshot = None
+        with self._cond:
+            state = self._tracked.get(path)
+            if state is None:
+                return
+            if snapshot is None:
+                del self._tracked[path]  # Gone (moved or deleted)
+                return
+            if snapshot != state[0]:
+                if state[0] is not None:
+                    state[1] = min(state[1] * 2, self.max_delay)  # Still growing
+                state[0] = snapshot
+                self._wheel.schedule(state[1], path)
+                return
+            del self._tracked[path]
+        try:
+            self.on_stable(path)
+        except Exception as e:
+            self.logger.error(f"Error handing over '{path}': {e}")
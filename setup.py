@@ -13,6 +13,7 @@ setup(
     entry_points={
         "console_scripts": [
             "auto-organize = organizer.commands:entry",
+            "auto-organize-bench = organizer.bench:main",
         ],
     },
     include_package_data=True,
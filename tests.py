@@ -10,7 +10,7 @@ from unittest.mock import patch, MagicMock
 
 # Import the core classes and functions directly
 from organizer.core import FileOrganizer
-from organizer.utils.data import rules_func, history
+from organizer.utils.data import rules_func, history, last_batches
 from organizer.file_watcher import activate_watchdog
 from organizer.commands import cli, entry
 from organizer.cli import parse_args
@@ -343,6 +343,7 @@ class TestComprehensiveFileOrganizer:
         mock_args.reset = False
         mock_args.gui = True
         mock_args.watchdog = False
+        mock_args.profile = None
         
         # Test 1: GUI utility functions with mocked GUI components
         mock_txt_box = MagicMock()
@@ -452,6 +453,958 @@ class TestComprehensiveFileOrganizer:
             # Should not crash on permission errors
             assert "permission" not in str(e).lower() or True
 
+    def test_rule_matcher(self, tmp_path):
+        """Test compiled rules: case-insensitive, longest multi-part extension wins"""
+        from organizer.utils.matcher import compile_rules
+
+        matcher = compile_rules({".gz": "Gzip", ".tar.gz": "Tarballs", ".jpg": "Images"})
+        assert matcher.match("photo.JPG") == "Images"
+        assert matcher.match("backup.tar.gz") == "Tarballs"
+        assert matcher.match("notes.gz") == "Gzip"
+        assert matcher.match(".jpg") is None
+        assert matcher.match("README") is None
+        assert compile_rules(matcher) is matcher
+
+        (tmp_path / "Backup.TAR.GZ").write_text("data")
+        (tmp_path / "Photo.Jpg").write_text("data")
+        organizer = FileOrganizer(str(tmp_path), matcher, [], logger=get_logger())
+        organizer.organize()
+        assert (tmp_path / "Tarballs" / "Backup.TAR.GZ").exists()
+        assert (tmp_path / "Images" / "Photo.Jpg").exists()
+
+    def test_undo_journal(self, tmp_path):
+        """Test the append-only undo journal: group commit, truncate and compaction"""
+        from organizer.utils.journal import Journal
+
+        path = tmp_path / "undo.jsonl"
+        journal = Journal(path, compact_threshold=2)
+        moves = [{"original_path": f"a{i}", "new_path": f"b{i}"} for i in range(5)]
+        for move in moves:
+            journal.append(move)
+        assert not path.exists()  # Still buffered
+        journal.commit()
+        assert len(path.read_text().splitlines()) == 5
+
+        # Undoing from the end appends a truncate record instead of rewriting
+        journal.update(moves[:2])
+        assert journal.entries() == moves[:2]
+
+        journal.compact()
+        assert len(path.read_text().splitlines()) == 2
+        assert Journal(path).entries() == moves[:2]
+
+        journal.clear()
+        assert journal.entries() == []
+        journal.close()
+
+    def test_batch_undo(self, tmp_path):
+        """Test that undo reverts whole organize runs"""
+        from organizer.utils.data import use_history_store
+        from organizer.utils.journal import Journal
+
+        previous = use_history_store(Journal(tmp_path / "undo.jsonl"))
+        try:
+            rules = {".txt": "Text", ".jpg": "Images"}
+            organizer = FileOrganizer(str(tmp_path), rules, [], logger=get_logger())
+
+            (tmp_path / "first.txt").write_text("1")
+            (tmp_path / "first.jpg").write_text("1")
+            organizer.organize()
+            (tmp_path / "second.txt").write_text("2")
+            (tmp_path / "second.jpg").write_text("2")
+            organizer.organize()
+
+            # Counts below 1 are rejected instead of reverting the whole history
+            for bad in (0, -1):
+                organizer.undo(bad)
+                assert (tmp_path / "Text" / "second.txt").exists()
+                assert (tmp_path / "Text" / "first.txt").exists()
+                with pytest.raises(ValueError):
+                    last_batches(bad)
+            for bad in ("0", "-1"):
+                with patch("sys.argv", ["auto-organize", "--undo", bad]):
+                    with pytest.raises(SystemExit):
+                        parse_args()
+
+            organizer.undo()
+            assert (tmp_path / "second.txt").exists()
+            assert (tmp_path / "second.jpg").exists()
+            assert (tmp_path / "Text" / "first.txt").exists()
+
+            organizer.undo()
+            assert (tmp_path / "first.txt").exists()
+            assert (tmp_path / "first.jpg").exists()
+            assert last_batches(5) == []
+        finally:
+            use_history_store(previous).close()
+
+    def test_sqlite_history(self, tmp_path):
+        """Test the SQLite history backend and its query API"""
+        from organizer.utils.history_db import SQLiteHistory
+
+        store = SQLiteHistory(tmp_path / "history.sqlite3")
+        for i, batch in enumerate(["b1", "b1", "b2"]):
+            store.append(
+                {
+                    "original_path": f"/src/f{i}",
+                    "new_path": f"/dst/f{i}",
+                    "timestamp": f"2025-01-0{i + 1} 10:00:00",
+                    "batch": batch,
+                }
+            )
+        assert len(store) == 3
+        assert store.where_is("/src/f1")["new_path"] == "/dst/f1"
+        assert store.came_from("/dst/f2")["original_path"] == "/src/f2"
+        assert len(store.moves_between("2025-01-01 00:00:00", "2025-01-02 23:59:59")) == 2
+
+        [(batch, moves)] = store.last_batches(1)
+        assert batch == "b2" and len(moves) == 1
+        store.discard_batches(["b2"])
+        assert [batch for batch, _ in store.last_batches(5)] == ["b1"]
+        assert store._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        store.close()
+
+    def test_parallel_moves(self, tmp_path, custom_rules):
+        """Test organizing with a thread pool keeps history consistent"""
+        from organizer.utils.data import last_batches, use_history_store
+        from organizer.utils.journal import Journal
+
+        for i in range(20):
+            (tmp_path / f"doc{i}.txt").write_text("text")
+            (tmp_path / f"pic{i}.jpg").write_text("image")
+        previous = use_history_store(Journal(tmp_path / "h.jsonl"))
+        try:
+            organizer = FileOrganizer(
+                str(tmp_path), custom_rules, logger=get_logger(), workers=4
+            )
+            organizer.organize()
+
+            assert len(list((tmp_path / "TextFiles").iterdir())) == 20
+            assert len(list((tmp_path / "Images").iterdir())) == 20
+            [(batch, moves)] = last_batches(1)
+            assert batch == organizer.batch_id
+            assert len(moves) == 40
+            texts = [
+                Path(m["new_path"]).name for m in moves if m["new_path"].endswith(".txt")
+            ]
+            assert texts == sorted(texts)
+        finally:
+            use_history_store(previous).close()
+
+    def test_cross_filesystem_move(self, tmp_path):
+        """Test the EXDEV copy fallback, including resuming a partial copy"""
+        import errno
+        import os
+        from organizer.utils import mover
+
+        src = tmp_path / "video.mp4"
+        src.write_bytes(os.urandom(300_000))
+        dest = tmp_path / "Videos" / "video.mp4"
+        dest.parent.mkdir()
+        partial = mover.partial_path(src.stat(), dest)
+        partial.write_bytes(src.read_bytes()[:100_000])  # Interrupted transfer
+        content = src.read_bytes()
+
+        def cross_device_rename(a, b):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+        with patch.object(mover.os, "rename", cross_device_rename):
+            mover.move_file(src, dest, verify="hash")
+
+        assert not src.exists()
+        assert not partial.exists()
+        assert dest.read_bytes() == content
+
+    def test_organize_paths(self, test_dir, custom_rules):
+        """Test organizing only the given files"""
+        organizer = FileOrganizer(str(test_dir), custom_rules, logger=get_logger())
+        (test_dir / "Images").mkdir()
+        (test_dir / "Images" / "inside.txt").write_text("already in a destination")
+
+        organizer.organize_one(test_dir / "document.txt")
+        organizer.organize_paths([test_dir / "Images" / "inside.txt", test_dir / "gone.txt"])
+
+        assert (test_dir / "TextFiles" / "document.txt").exists()
+        assert (test_dir / "Images" / "inside.txt").exists()
+        # Untouched files stay, and unused destinations are not created
+        assert (test_dir / "image.jpg").exists()
+        assert not (test_dir / "Videos").exists()
+
+    def test_organize_paths_keeps_counters(self, tmp_path):
+        """Test that watcher batches do not probe "name (n)" from 1 every time"""
+        import os
+
+        organizer = FileOrganizer(str(tmp_path), {".txt": "Text"}, logger=get_logger())
+        text = tmp_path / "Text"
+        text.mkdir()
+        (text / "x.txt").write_text("first")
+        probed = []
+        lexists = os.path.lexists
+
+        def counting_lexists(path):
+            probed.append(os.path.basename(path))
+            return lexists(path)
+
+        with patch.object(os.path, "lexists", counting_lexists):
+            for i in range(3):
+                (tmp_path / "x.txt").write_text(str(i))
+                probed.clear()
+                organizer.organize_paths([tmp_path / "x.txt"])
+        assert "x (1).txt" not in probed and "x (2).txt" not in probed
+        assert probed[-1] == "x (3).txt"
+        assert (text / "x (3).txt").read_text() == "2"
+
+        # A name freed by someone else is handed out again
+        time.sleep(0.05)
+        (text / "x (1).txt").unlink()
+        (tmp_path / "x.txt").write_text("3")
+        organizer.organize_paths([tmp_path / "x.txt"])
+        assert (text / "x (1).txt").read_text() == "3"
+
+    def test_coalescing_event_queue(self):
+        """Test per-path debouncing with a trailing-edge flush"""
+        from organizer.utils.event_queue import CoalescingQueue
+
+        queue = CoalescingQueue(debounce=0.2)
+        start = time.monotonic()
+        for _ in range(3):
+            queue.put("a.txt")
+            time.sleep(0.05)
+        queue.put("b.txt")
+        assert len(queue) == 2
+
+        assert queue.get_batch() == ["a.txt"]
+        assert time.monotonic() - start >= 0.25  # Waited for the last event
+        assert queue.get_batch() == ["b.txt"]
+        queue.task_done(["a.txt", "b.txt"])
+        stats = queue.stats()
+        assert stats["depth"] == 0 and stats["processed"] == 2
+
+        queue.put("c.txt")
+        queue.close()
+        assert queue.get_batch() == ["c.txt"]  # Flushed on close
+        assert queue.get_batch() == []
+
+    def test_stability_tracker(self, tmp_path):
+        """Test that files are handed over only once they stop changing"""
+        from organizer.utils.stability import StabilityTracker
+
+        stable = []
+        tracker = StabilityTracker(stable.append, initial_delay=0.1, tick=0.02)
+        tracker.start()
+        try:
+            growing = tmp_path / "movie.mp4"
+            growing.write_text("x")
+            tracker.watch(str(growing))
+            tracker.watch(str(tmp_path / "movie.mp4.crdownload"))  # Ignored
+            for _ in range(5):
+                time.sleep(0.08)
+                with open(growing, "a") as f:
+                    f.write("more data")
+                assert stable == []
+            deadline = time.monotonic() + 5
+            while not stable and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert stable == [str(growing)]
+            assert len(tracker) == 0
+        finally:
+            tracker.stop()
+
+    def test_streaming_scan(self, tmp_path, custom_rules):
+        """Test that organize streams the directory in chunks"""
+        from organizer import core
+        from organizer.utils.scanner import scan_files
+
+        for i in range(25):
+            (tmp_path / f"doc{i}.txt").write_text("text")
+        (tmp_path / "subdir").mkdir()
+        assert sorted(e.name for e in scan_files(tmp_path))[:2] == ["doc0.txt", "doc1.txt"]
+        assert len(list(scan_files(tmp_path))) == 25
+
+        with patch.object(core, "SCAN_CHUNK_SIZE", 4):
+            FileOrganizer(str(tmp_path), custom_rules, logger=get_logger()).organize()
+        assert len(list((tmp_path / "TextFiles").iterdir())) == 25
+
+    def test_recursive_mode(self, tmp_path, custom_rules):
+        """Test recursive organization with depth limits, excludes and destinations"""
+        (tmp_path / "a" / "b" / "c").mkdir(parents=True)
+        (tmp_path / "skip").mkdir()
+        (tmp_path / "TextFiles").mkdir()
+        (tmp_path / "a" / "one.txt").write_text("1")
+        (tmp_path / "a" / "b" / "two.txt").write_text("2")
+        (tmp_path / "a" / "b" / "c" / "three.txt").write_text("3")
+        (tmp_path / "skip" / "four.txt").write_text("4")
+        (tmp_path / "TextFiles" / "five.jpg").write_text("5")
+
+        organizer = FileOrganizer(
+            str(tmp_path),
+            custom_rules,
+            logger=get_logger(),
+            recursive=True,
+            max_depth=2,
+            exclude=["skip"],
+        )
+        organizer.organize()
+
+        assert (tmp_path / "TextFiles" / "one.txt").exists()
+        assert (tmp_path / "TextFiles" / "two.txt").exists()
+        assert (tmp_path / "a" / "b" / "c" / "three.txt").exists()  # Too deep
+        assert (tmp_path / "skip" / "four.txt").exists()  # Excluded
+        assert (tmp_path / "TextFiles" / "five.jpg").exists()  # In a destination
+        assert not organizer._accepts(tmp_path / "TextFiles" / "five.jpg")
+        assert organizer._accepts(tmp_path / "a" / "new.txt")
+
+    @pytest.mark.parametrize("policy", ["skip", "hardlink", "remove"])
+    def test_dedup_policies(self, tmp_path, custom_rules, policy):
+        """Test that duplicates of files already organized are detected"""
+        import os
+
+        (tmp_path / "TextFiles").mkdir()
+        (tmp_path / "TextFiles" / "report.txt").write_text("same content")
+        (tmp_path / "report (1).txt").write_text("same content")
+        (tmp_path / "other.txt").write_text("same contenX")  # Same size and head
+
+        organizer = FileOrganizer(
+            str(tmp_path), custom_rules, logger=get_logger(), dedup=policy
+        )
+        organizer.organize()
+
+        assert (tmp_path / "TextFiles" / "other.txt").exists()
+        moved = tmp_path / "TextFiles" / "report (1).txt"
+        if policy == "skip":
+            assert (tmp_path / "report (1).txt").exists() and not moved.exists()
+        elif policy == "remove":
+            assert not (tmp_path / "report (1).txt").exists() and not moved.exists()
+        else:
+            assert not (tmp_path / "report (1).txt").exists()
+            assert os.path.samefile(moved, tmp_path / "TextFiles" / "report.txt")
+
+    def test_dedup_across_watcher_batches(self, tmp_path):
+        """Test that files moved by an earlier batch are dedup references"""
+        import organizer.core as core
+
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "a.txt").write_text("same content")
+        (src / "b.txt").write_text("same content")
+        cache = tmp_path / "hash_cache.json"
+        organizer = FileOrganizer(
+            str(src), {".txt": "Text"}, logger=get_logger(), dedup="skip"
+        )
+        with patch.object(core, "HASH_CACHE_PATH", cache):
+            organizer.organize_paths([src / "a.txt"])
+            organizer.organize_paths([src / "b.txt"])
+
+        assert (src / "Text" / "a.txt").exists()
+        assert (src / "b.txt").exists() and not (src / "Text" / "b.txt").exists()
+        assert organizer._deduper is None
+        assert cache.exists()
+
+    @pytest.mark.parametrize("policy", ["rename", "skip", "overwrite", "keep-newer"])
+    def test_collision_policies(self, tmp_path, policy):
+        """Test that existing files in the destination are never silently lost"""
+        import os
+
+        rules = {".txt": "Text", ".tar.gz": "Archives"}
+        (tmp_path / "Text").mkdir()
+        (tmp_path / "Archives").mkdir()
+        (tmp_path / "Text" / "notes.txt").write_text("old")
+        (tmp_path / "Text" / "notes (1).txt").write_text("older copy")
+        (tmp_path / "Archives" / "dump.tar.gz").write_text("old")
+        os.utime(tmp_path / "Text" / "notes.txt", (0, 0))
+        (tmp_path / "notes.txt").write_text("new")
+        (tmp_path / "dump.tar.gz").write_text("new")
+        os.utime(tmp_path / "dump.tar.gz", (0, 0))
+
+        organizer = FileOrganizer(
+            str(tmp_path), rules, logger=get_logger(), on_collision=policy
+        )
+        organizer.organize()
+
+        text = tmp_path / "Text"
+        if policy == "rename":
+            assert (text / "notes.txt").read_text() == "old"
+            assert (text / "notes (2).txt").read_text() == "new"
+            assert (tmp_path / "Archives" / "dump (1).tar.gz").read_text() == "new"
+        elif policy == "skip":
+            assert (text / "notes.txt").read_text() == "old"
+            assert (tmp_path / "notes.txt").exists()
+        elif policy == "overwrite":
+            assert (text / "notes.txt").read_text() == "new"
+            assert (tmp_path / "Archives" / "dump.tar.gz").read_text() == "new"
+        else:
+            assert (text / "notes.txt").read_text() == "new"  # Incoming was newer
+            assert (tmp_path / "Archives" / "dump.tar.gz").read_text() == "old"
+            assert (tmp_path / "dump.tar.gz").exists()
+
+    @pytest.mark.parametrize("policy", ["overwrite", "keep-newer"])
+    def test_collision_within_run(self, tmp_path, policy):
+        """Test that a file of the run never replaces another one of the run"""
+        import os
+
+        for sub, text, mtime in (("a", "new", 2000), ("b", "old", 1000)):
+            (tmp_path / sub).mkdir()
+            (tmp_path / sub / "x.txt").write_text(text)
+            os.utime(tmp_path / sub / "x.txt", (mtime, mtime))
+
+        organizer = FileOrganizer(
+            str(tmp_path),
+            {".txt": "Text"},
+            logger=get_logger(),
+            recursive=True,
+            on_collision=policy,
+        )
+        organizer.organize()
+
+        moved = {p.read_text() for p in (tmp_path / "Text").iterdir()}
+        left = {p.read_text() for p in tmp_path.glob("[ab]/x.txt")}
+        assert "new" in moved
+        assert sorted(moved | left) == ["new", "old"]
+        assert not moved & left
+
+    def test_deferred_retries(self, tmp_path):
+        """Test that locked files are retried with backoff without stalling the batch"""
+        import organizer.core as core
+        from organizer.utils.mover import move_file
+
+        for name in ("locked.txt", "busy.txt", "free.txt"):
+            (tmp_path / name).write_text(name)
+        calls = {}
+
+        def flaky_move(src, dest, verify="size", dirs=None):
+            calls[src.name] = calls.get(src.name, 0) + 1
+            if src.name == "locked.txt" or (
+                src.name == "busy.txt" and calls[src.name] < 3
+            ):
+                raise PermissionError(13, "Permission denied")
+            move_file(src, dest, verify, dirs)
+
+        organizer = FileOrganizer(str(tmp_path), {".txt": "Text"}, logger=get_logger())
+        with patch.object(core, "move_file", flaky_move), patch.object(
+            core, "RETRY_BASE_DELAY", 0.01
+        ):
+            start = time.monotonic()
+            organizer.organize()
+            elapsed = time.monotonic() - start
+
+        assert (tmp_path / "Text" / "free.txt").exists()
+        assert (tmp_path / "Text" / "busy.txt").exists()
+        assert (tmp_path / "locked.txt").exists()
+        assert calls["locked.txt"] == core.RETRY_ATTEMPTS
+        assert calls["free.txt"] == 1
+        assert [(x.name, reason) for x, reason in organizer.failures] == [
+            ("locked.txt", f"permission denied after {core.RETRY_ATTEMPTS} tries")
+        ]
+        assert elapsed < 1.0
+
+    def test_cli_startup_budget(self, tmp_path):
+        """Test that importing the CLI is fast, lazy and does not touch the disk"""
+        import os
+        import sys
+
+        budget = 0.5  # Seconds for importing the CLI entry point
+        code = (
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import organizer.commands\n"
+            "elapsed = time.perf_counter() - start\n"
+            "roots = {m.split('.')[0] for m in sys.modules}\n"
+            "print(json.dumps({'elapsed': elapsed, 'modules': sorted(roots)}))\n"
+        )
+        env = dict(os.environ, HOME=str(tmp_path), USERPROFILE=str(tmp_path))
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, env=env
+        )
+        assert result.returncode == 0, result.stderr
+        report = json.loads(result.stdout)
+
+        for heavy in ("tkinter", "watchdog", "multiprocessing", "sqlite3"):
+            assert heavy not in report["modules"]
+        assert list(tmp_path.iterdir()) == []  # No I/O at import time
+        assert report["elapsed"] < budget, f"CLI import took {report['elapsed']:.3f}s"
+
+    def test_rules_cache_and_hot_reload(self, tmp_path):
+        """Test that compiled rules are cached on disk and reloaded when edited"""
+        import os
+        from organizer.utils import rules_cache
+        from organizer.utils.rules_cache import RulesCache
+        from organizer.file_watcher import MyHandler
+
+        rules_file = tmp_path / "rules.json"
+        cache_file = tmp_path / "cache" / "rules.pickle"
+        cache = RulesCache(cache_file)
+
+        # A file just written may change again within the same mtime tick
+        rules_file.write_text(json.dumps({".txt": "Text"}))
+        racy = cache.load(rules_file)
+        assert cache.load(rules_file) is racy
+        st = rules_file.stat()
+        rules_file.write_text(json.dumps({".txt": "Page"}))
+        os.utime(rules_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert cache.load(rules_file).match("a.txt") == "Page"
+
+        rules_file.write_text(json.dumps({".txt": "Text"}))
+        os.utime(rules_file, (1, 1))  # Old enough to trust its mtime
+        matcher = cache.load(rules_file)
+        assert cache.load(rules_file) is matcher
+        assert cache_file.exists()
+
+        # A cold cache reads the pickled matcher instead of parsing the JSON
+        with patch.object(rules_cache.json, "load", side_effect=AssertionError):
+            cold = RulesCache(cache_file).load(rules_file)
+        assert cold.match("a.TXT") == "Text"
+
+        src = tmp_path / "src"
+        src.mkdir()
+        organizer = FileOrganizer(str(src), matcher, logger=get_logger())
+        handler = MyHandler(organizer, rules_path=rules_file)
+        with patch("organizer.file_watcher.load_rules", cache.load):
+            rules_file.write_text(json.dumps({".txt": "Notes", ".md": "Notes"}))
+            st = rules_file.stat()
+            os.utime(rules_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            (src / "a.txt").write_text("a")
+            handler._organize([str(src / "a.txt")])
+            assert (src / "Notes" / "a.txt").exists()
+            assert organizer.matcher is cache.load(rules_file)
+
+            rules_file.write_text("{ broken")  # Mid-edit: keep the last good rules
+            (src / "b.md").write_text("b")
+            handler._organize([str(src / "b.md")])
+            assert (src / "Notes" / "b.md").exists()
+
+    def test_benchmark_suite(self, tmp_path):
+        """Test that the benchmark suite writes a comparable JSON report"""
+        from organizer import bench
+        from organizer.utils import data
+
+        before = data.use_history_store(None)
+        data.use_history_store(before)
+        output = tmp_path / "bench.json"
+        argv = ["--files", "50", "--distribution", "uniform", "mixed", "--rules", "12"]
+        argv += ["--moves", "50", "--watcher-files", "3", "--repeat", "1"]
+        bench.main(argv + ["--output", str(output), "--workdir", str(tmp_path)])
+
+        report = json.loads(output.read_text())
+        names = [r["benchmark"] for r in report["results"]]
+        assert names.count("organize") == 2 and names.count("undo") == 2
+        assert names.count("history") == 2 and "watcher" in names
+        organize = report["results"][0]
+        assert organize["params"]["distribution"] == "uniform"
+        assert organize["metrics"]["files_per_sec"] > 0
+        watcher = next(r for r in report["results"] if r["benchmark"] == "watcher")
+        assert watcher["metrics"]["missed"] == 0
+        assert data.use_history_store(before) is before  # Real history untouched
+
+        baseline = json.loads(output.read_text())
+        baseline["results"][0]["metrics"]["files_per_sec"] *= 2
+        lines, regressions = bench.compare(report, baseline, threshold=0.2)
+        assert lines and len(regressions) == 1
+        assert "files_per_sec" in regressions[0]
+
+    def test_metrics_export(self, tmp_path):
+        """Test per-phase metrics, the --stats summary and the Prometheus exports"""
+        import urllib.request
+        from organizer.utils.metrics import MetricsServer
+
+        for name in ("a.txt", "b.txt", "c.jpg", "d.unknown"):
+            (tmp_path / name).write_text(name)
+        organizer = FileOrganizer(
+            str(tmp_path), {".txt": "Text", ".jpg": "Images"}, logger=get_logger()
+        )
+        organizer.organize()
+
+        metrics = organizer.metrics
+        assert metrics.counter("files_scanned") == 4
+        assert metrics.counter("files_matched") == 3
+        assert metrics.counter("files_moved") == 3
+        snap = metrics.snapshot()["histograms"]
+        assert snap["rename"]["count"] == 3 and snap["history_write"]["count"] == 3
+        for phase in ("scan", "match", "mkdir", "history_commit"):
+            assert snap[phase]["count"] >= 1
+        assert "files_moved" in metrics.summary()
+
+        text = metrics.to_prometheus()
+        assert "organizer_files_moved_total 3" in text
+        assert 'organizer_rename_seconds_bucket{le="+Inf"} 3' in text
+        textfile = tmp_path / "organizer.prom"
+        metrics.write_textfile(textfile)
+        assert textfile.read_text() == text
+
+        server = MetricsServer(metrics, 0)
+        server.start()
+        try:
+            url = f"http://127.0.0.1:{server.port}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                body = response.read().decode()
+        finally:
+            server.stop()
+        assert "# TYPE organizer_rename_seconds histogram" in body
+
+    @pytest.mark.parametrize("mode", ["cpu", "mem"])
+    def test_profiling_hook(self, tmp_path, mode):
+        """Test the cpu and mem profilers around an organize run"""
+        import pstats
+        import tracemalloc
+        from organizer.utils.profiling import Profiler, profile
+
+        src = tmp_path / "src"
+        src.mkdir()
+        for i in range(20):
+            (src / f"file{i}.txt").write_text("x")
+        organizer = FileOrganizer(str(src), {".txt": "Text"}, logger=get_logger())
+        output = tmp_path / f"run.{mode}"
+        with profile(mode, output=str(output), top=5) as profiler:
+            organizer.organize()
+
+        assert isinstance(profiler, Profiler)
+        assert len(list((src / "Text").iterdir())) == 20
+        assert output.exists()
+        if mode == "cpu":
+            assert "organize" in profiler.report
+            assert pstats.Stats(str(output)).total_calls > 0
+        else:
+            assert profiler.peak > 0
+            assert profiler.report.startswith("Peak traced memory")
+            assert not tracemalloc.is_tracing()
+
+        with profile(None) as nothing:  # Disabled: a no-op context manager
+            pass
+        assert nothing is None
+
+    def test_move_plan_simulate_and_apply(self, tmp_path):
+        """Test that --simulate streams a plan that --apply executes without a rescan"""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "a.txt").write_text("aaaa")
+        (src / "b.txt").write_text("bb")
+        (src / "c.tar.gz").write_text("c")
+        (src / "d.jpg").write_text("dd")
+        rules_file = tmp_path / "rules.json"
+        rules_file.write_text(json.dumps({".txt": "Text", ".tar.gz": "Archives"}))
+        plan = tmp_path / "plan.jsonl"
+
+        result = run_cli(
+            ["--source", str(src), "--rules", str(rules_file), "--simulate"]
+            + ["--plan", str(plan)]
+        )
+        assert result.returncode == 0, result.stderr
+        assert "Total: 3 file(s), 7 B" in result.stderr
+        entries = [json.loads(line) for line in plan.read_text().splitlines()]
+        assert {Path(e["src"]).name: e["rule"] for e in entries} == {
+            "a.txt": ".txt",
+            "b.txt": ".txt",
+            "c.tar.gz": ".tar.gz",
+        }
+        assert next(e for e in entries if e["src"].endswith("a.txt"))["size"] == 4
+        assert not (src / "Text").exists()
+
+        # The plan is applied as reviewed, even if the rules change meanwhile
+        rules_file.write_text(json.dumps({".txt": "Other"}))
+        (src / "b.txt").write_text("changed")  # Fails the size check
+        (src / "e.txt").write_text("e")  # Not in the plan
+        result = run_cli(
+            ["--source", str(src), "--rules", str(rules_file), "--apply", str(plan)]
+        )
+        assert result.returncode == 0, result.stderr
+        assert (src / "Text" / "a.txt").read_text() == "aaaa"
+        assert (src / "Archives" / "c.tar.gz").exists()
+        assert (src / "b.txt").exists() and (src / "e.txt").exists()
+        assert "changed since the plan was made" in result.stderr
+        assert not (src / "Other").exists()
+
+    def test_apply_malformed_plan(self, tmp_path):
+        """Test that a malformed plan entry is reported before anything moves"""
+        import organizer.core as core
+        from organizer.utils.plan import read_plan
+
+        (tmp_path / "a.txt").write_text("a")
+        plan = tmp_path / "plan.jsonl"
+        entry = {"src": str(tmp_path / "a.txt"), "dest": str(tmp_path / "T" / "a.txt")}
+        plan.write_text(json.dumps(entry) + "\n{not json\n")
+        organizer = FileOrganizer(str(tmp_path), {".txt": "T"}, logger=get_logger())
+        with patch.object(core, "SCAN_CHUNK_SIZE", 1):
+            with pytest.raises(ValueError, match="line 2"):
+                organizer.apply_plan(read_plan(plan))
+        assert (tmp_path / "a.txt").exists()
+        assert not (tmp_path / "T").exists()
+
+    def test_lazy_destinations_and_dir_fd_moves(self, tmp_path):
+        """Test that only used destinations are created and renames use dir fds"""
+        import os
+        from organizer.utils import mover
+
+        for i in range(5):
+            (tmp_path / f"doc{i}.txt").write_text("x")
+        rules = {".txt": "Text", ".jpg": "Images", ".mp4": "Videos"}
+        calls = []
+        real_rename = os.rename
+
+        def tracking_rename(src, dest, **kwargs):
+            calls.append(kwargs)
+            return real_rename(src, dest, **kwargs)
+
+        organizer = FileOrganizer(str(tmp_path), rules, logger=get_logger(), workers=2)
+        with patch.object(mover.os, "rename", tracking_rename):
+            organizer.organize()
+
+        assert len(list((tmp_path / "Text").iterdir())) == 5
+        assert not (tmp_path / "Images").exists()
+        assert not (tmp_path / "Videos").exists()
+        assert organizer.metrics.snapshot()["histograms"]["mkdir"]["count"] == 1
+        assert len(calls) == 5
+        if mover.DirHandles.supported:
+            assert all("src_dir_fd" in kwargs for kwargs in calls)
+        assert organizer._dirs is None  # Descriptors are closed after the batch
+
+    def test_multi_folder_daemon(self, tmp_path):
+        """Test one daemon handler serving several folders with their own rules"""
+        from organizer.file_watcher import MyHandler, load_daemon_config
+        from organizer.utils.metrics import Metrics, MetricsGroup
+
+        alice, bob = tmp_path / "alice", tmp_path / "bob"
+        alice.mkdir()
+        bob.mkdir()
+        bob_rules = tmp_path / "bob.json"
+        bob_rules.write_text(json.dumps({".txt": "Notes"}))
+        config = tmp_path / "daemon.json"
+        config.write_text(
+            json.dumps(
+                {
+                    "workers": 2,
+                    "defaults": {"on_collision": "skip"},
+                    "folders": [
+                        {"source": str(alice), "rules": {".txt": "Text"}},
+                        {"source": str(bob), "rules": str(bob_rules), "name": "b"},
+                    ],
+                }
+            )
+        )
+        loaded = load_daemon_config(config)
+        assert loaded["workers"] == 2
+        assert [f["name"] for f in loaded["folders"]] == ["alice", "b"]
+        assert loaded["folders"][1]["on_collision"] == "skip"
+
+        # The daemon prefers inotify (one thread for all folders) by default
+        import organizer.file_watcher as file_watcher
+
+        with patch("sys.argv", ["auto-organize", "--daemon", str(config)]):
+            args = parse_args()
+        with patch.object(file_watcher, "_run") as run:
+            file_watcher.activate_daemon(args)
+        assert run.call_args[0][4] == "auto"
+        assert len(run.call_args[0][0].folders) == 2
+
+        metrics = Metrics()
+        handler = MyHandler(workers=loaded["workers"], metrics=metrics)
+        for folder in loaded["folders"]:
+            organizer = FileOrganizer(
+                folder["source"],
+                folder["rules"] if isinstance(folder["rules"], dict) else {},
+                logger=get_logger(),
+                on_collision=folder["on_collision"],
+                metrics=Metrics(labels={"folder": folder["name"]}),
+            )
+            rules_path = folder["rules"] if isinstance(folder["rules"], str) else None
+            handler.add_folder(organizer, rules_path, folder["name"])
+        assert len(handler.workers) == 2
+
+        (alice / "a.txt").write_text("a")
+        (bob / "b.txt").write_text("b")
+        handler._organize([str(alice / "a.txt"), str(bob / "b.txt")])
+        assert (alice / "Text" / "a.txt").exists()
+        assert (bob / "Notes" / "b.txt").exists()
+        assert handler.folder_for(str(bob / "x.txt")).name == "b"
+        assert handler.folder_for(str(tmp_path / "other.txt")) is None
+
+        group = MetricsGroup([metrics] + [f.organizer.metrics for f in handler.folders])
+        text = group.to_prometheus()
+        assert 'organizer_files_moved_total{folder="alice"} 1' in text
+        assert 'organizer_files_moved_total{folder="b"} 1' in text
+        assert text.count("# TYPE organizer_files_moved_total counter") == 1
+        assert "[folder=b]" in group.summary()
+
+        config.write_text(json.dumps({"folders": [{"rules": {}}]}))
+        with pytest.raises(ValueError):
+            load_daemon_config(config)
+        # Bad option values fail at startup, not on every batch
+        for bad in (
+            {"dedup": "skpi"},
+            {"on_collision": "replace"},
+            {"jobs": 0},
+            {"max_depth": -1},
+        ):
+            config.write_text(json.dumps({"folders": [{"source": str(alice), **bad}]}))
+            with pytest.raises(ValueError, match=next(iter(bad))):
+                load_daemon_config(config)
+        config.write_text(json.dumps({"defaults": {"dedupe": "skip"}, "folders": []}))
+        with pytest.raises(ValueError):
+            load_daemon_config(config)
+
+    @pytest.mark.skipif(
+        platform.system() != "Linux", reason="inotify is only available on Linux"
+    )
+    def test_inotify_backend(self, tmp_path):
+        """Test that the inotify backend reports each completed file once"""
+        from organizer.file_watcher import MyHandler
+        from organizer.utils.inotify import InotifyObserver
+
+        src = tmp_path / "src"
+        (src / "old").mkdir(parents=True)
+        organizer = FileOrganizer(
+            str(src), {".txt": "Text"}, logger=get_logger(), recursive=True
+        )
+        handler = MyHandler(organizer, debounce=0.05)
+        observer = InotifyObserver()
+        observer.schedule(handler, str(src), recursive=True)
+        assert len(observer) == 2
+        handler.start()
+        observer.start()
+        try:
+            with open(src / "chunks.txt", "w") as f:
+                for _ in range(20):
+                    f.write("x" * 1000)
+                    f.flush()
+            (src / "dl.txt.part").write_text("x")
+            (src / "dl.txt.part").rename(src / "dl.txt")
+            (src / "new").mkdir()
+            (src / "new" / "deep.txt").write_text("x")
+            moved = [src / "Text" / n for n in ("chunks.txt", "dl.txt", "deep.txt")]
+            deadline = time.time() + 10
+            while not all(p.exists() for p in moved) and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            observer.stop()
+            observer.join()
+            handler.stop()
+        assert all(p.exists() for p in moved)
+        assert organizer.metrics.counter("files_moved") == 3
+        # One event per completed file (and per move into Text), not per write
+        assert organizer.metrics.counter("events") <= 7
+
+    def test_scan_index(self, tmp_path):
+        """Test that the scan index skips unchanged unmatched files and folders"""
+        import os
+
+        src = tmp_path / "src"
+        src.mkdir()
+        old = time.time() - 3600
+        for i in range(10):
+            (src / f"keep{i}.dat").write_text("x")
+            os.utime(src / f"keep{i}.dat", (old, old))
+        (src / "a.txt").write_text("a")
+
+        def run(**kwargs):
+            organizer = FileOrganizer(
+                str(src), {".txt": "Text"}, logger=get_logger(), scan_index=True
+            )
+            with patch("organizer.core.SCAN_INDEX_DIR", tmp_path / "index"):
+                organizer.organize(**kwargs)
+            return organizer.metrics
+
+        metrics = run()
+        assert (src / "Text" / "a.txt").exists()
+        assert metrics.counter("index_hits") == 0
+
+        os.utime(src, (old, old))  # Settle the folder's mtime
+        metrics = run()
+        assert metrics.counter("index_hits") == 10
+        assert metrics.counter("files_matched") == 0
+
+        # An unchanged folder is not listed at all
+        with patch.object(FileOrganizer, "_scan", side_effect=AssertionError):
+            metrics = run()
+        assert metrics.counter("index_hits") == 10
+
+        (src / "b.txt").write_text("b")
+        metrics = run()
+        assert (src / "Text" / "b.txt").exists()
+        assert metrics.counter("index_hits") == 10
+
+        metrics = run(full_rescan=True)
+        assert metrics.counter("index_hits") == 0
+        assert metrics.counter("files_scanned") == 10
+
+    def test_content_sniffing(self, tmp_path):
+        """Test that files with no or unknown extensions are organized by content"""
+        from organizer.utils.sniff import Sniffer, sniff_header
+
+        assert sniff_header(b"\x00\x00\x00\x18ftypqt  ") == ".mov"
+        assert sniff_header(b"\x00\x00\x00\x18ftypisom") == ".mp4"
+        assert sniff_header(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == ".webp"
+        assert sniff_header(b"plain text") is None
+
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "download").write_bytes(b"%PDF-1.7\n" + b"x" * 100)
+        (src / "photo.bin").write_bytes(b"\x89PNG\r\n\x1a\n" + b"x" * 100)
+        (src / "notes").write_text("just text")
+        (src / "movie.mp4.part").write_bytes(b"\x00\x00\x00\x18ftypisom")
+        (src / "Docs").mkdir()
+        (src / "Docs" / "download").write_text("taken")
+        for i in range(10):  # Enough files for the thread pool
+            (src / f"archive{i}").write_bytes(b"PK\x03\x04" + bytes(i))
+        rules = {".pdf": "Docs", ".png": "Images", ".zip": "Archives"}
+        organizer = FileOrganizer(str(src), rules, logger=get_logger(), sniff=True)
+        organizer.organize()
+
+        assert (src / "Docs" / "download (1)").exists()
+        assert (src / "Images" / "photo.bin").exists()
+        assert len(list((src / "Archives").iterdir())) == 10
+        assert (src / "notes").exists() and (src / "movie.mp4.part").exists()
+        assert organizer.metrics.counter("files_sniffed") == 12
+
+        # Container formats only classify files without an extension
+        assert sniff_header(b"\x00\x00\x00\x1cftypavif") is None
+        containers = {
+            "sheet.xlsx": b"PK\x03\x04",
+            "book.epub": b"PK\x03\x04",
+            "picture.avif": b"\x00\x00\x00\x1cftypavif",
+            "library.dll": b"MZ\x90\x00",
+        }
+        for name, header in containers.items():
+            (src / name).write_bytes(header)
+        (src / "bundle").write_bytes(b"PK\x03\x04xl/workbook.xml")
+        rules[".mp4"], rules[".exe"] = "Videos", "Programs"
+        FileOrganizer(str(src), rules, logger=get_logger(), sniff=True).organize()
+        assert not (src / "Videos").exists() and not (src / "Programs").exists()
+        assert all((src / name).exists() for name in containers)
+        assert (src / "Archives" / "bundle").exists()
+
+        # Verdicts are cached until the file changes
+        sniffer = Sniffer()
+        (src / "again").write_bytes(b"%PDF-1.4")
+        assert sniffer.sniff(str(src / "again")) == ".pdf"
+        with patch("organizer.utils.sniff.read_header", side_effect=AssertionError):
+            assert sniffer.sniff(str(src / "again")) == ".pdf"
+
+    def test_undo_keeps_failed_moves(self, tmp_path):
+        """Test that moves an undo could not revert stay in history"""
+        from organizer.utils.data import use_history_store
+        from organizer.utils.journal import Journal
+
+        src = tmp_path / "src"
+        src.mkdir()
+        previous = use_history_store(Journal(tmp_path / "undo.jsonl"))
+        try:
+            (src / "a.txt").write_text("a")
+            (src / "b.txt").write_text("b")
+            organizer = FileOrganizer(str(src), {".txt": "Text"}, logger=get_logger())
+            organizer.organize()
+            (src / "Text" / "a.txt").rename(tmp_path / "away.txt")
+
+            organizer.undo()
+            assert (src / "b.txt").exists()
+            batches = last_batches(5)
+            assert len(batches) == 1
+            assert [Path(m["new_path"]).name for m in batches[0][1]] == ["a.txt"]
+
+            (tmp_path / "away.txt").rename(src / "Text" / "a.txt")
+            organizer.undo()
+            assert (src / "a.txt").exists()
+            assert last_batches(5) == []
+        finally:
+            use_history_store(previous).close()
+
 
 if __name__ == "__main__":
     pytest.main(["-v", __file__])